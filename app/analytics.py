@@ -0,0 +1,267 @@
+"""Аналитические агрегаты для админ-панели (rollup-таблицы)"""
+import logging
+import os
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, delete, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from models import (
+    AnalyticsRefresh,
+    Answer,
+    AnswerOptionStats,
+    CategoryStats,
+    DailyAttemptStats,
+    Question,
+    QuestionStats,
+    TestAttempt,
+    UserAnswer,
+)
+
+logger = logging.getLogger("analytics")
+
+# Порог успешной сдачи теста в процентах
+PASS_PERCENTAGE = int(os.getenv("ANALYTICS_PASS_PERCENTAGE", "70"))
+
+# Сколько последних дней пересчитывается при инкрементальном обновлении
+RECENT_DAYS = int(os.getenv("ANALYTICS_RECENT_DAYS", "2"))
+
+
+def _correct_sum():
+    return func.sum(case((UserAnswer.is_correct.is_(True), 1), else_=0))
+
+
+def _finished_answers(query):
+    """Ограничивает запрос ответами завершенных попыток (автосохранение пишет и ответы незавершенных)"""
+    return query.join(
+        TestAttempt, UserAnswer.test_attempt_id == TestAttempt.id
+    ).where(TestAttempt.end_time.is_not(None))
+
+
+def _upsert_counts(db: Session, model, key: str, columns, counts, source):
+    """
+    Заменяет счетчики rollup-таблицы результатом source, не трогая остальные столбцы.
+
+    В question_stats и answer_option_stats item_analysis.py пишет показатели
+    качества вопроса, поэтому строки не пересоздаются: счетчики обнуляются,
+    обновляются через INSERT ... SELECT ... ON CONFLICT, а строки без ответов удаляются.
+    """
+    table = model.__table__
+    db.execute(update(table).values({column: 0 for column in counts}))
+    stmt = dialect_insert(table).from_select(columns, source)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[key],
+        set_={column: stmt.excluded[column] for column in columns if column != key}
+    ))
+    db.execute(delete(table).where(table.c[counts[0]] == 0))
+
+
+def _refresh_answer_stats(db: Session):
+    """Пересчет статистики по вопросам, вариантам ответов и категориям (только завершенные попытки)"""
+    db.query(CategoryStats).delete(synchronize_session=False)
+
+    # Все агрегаты считаются на стороне БД: INSERT ... SELECT
+    _upsert_counts(
+        db, QuestionStats, "question_id", ["question_id", "answered", "correct"], ["answered", "correct"],
+        _finished_answers(select(
+            UserAnswer.question_id,
+            func.count(UserAnswer.id),
+            _correct_sum()
+        )).where(
+            UserAnswer.question_id.is_not(None)
+        ).group_by(UserAnswer.question_id)
+    )
+
+    _upsert_counts(
+        db, AnswerOptionStats, "answer_id", ["answer_id", "question_id", "selected"], ["selected"],
+        _finished_answers(select(
+            UserAnswer.answer_id,
+            Answer.question_id,
+            func.count(UserAnswer.id)
+        ).join(
+            Answer, UserAnswer.answer_id == Answer.id
+        )).group_by(UserAnswer.answer_id, Answer.question_id)
+    )
+
+    exam_type = func.coalesce(Question.exam_type, literal("rhcsa"))
+    db.execute(insert(CategoryStats).from_select(
+        ["exam_type", "category", "answered", "correct"],
+        _finished_answers(select(
+            exam_type,
+            Question.category,
+            func.count(UserAnswer.id),
+            _correct_sum()
+        ).join(
+            Question, UserAnswer.question_id == Question.id
+        )).group_by(exam_type, Question.category)
+    ))
+
+
+def _refresh_daily_stats(db: Session, since: date = None):
+    """Пересчет дневной статистики попыток начиная с указанной даты"""
+    day = func.date(TestAttempt.end_time)
+    exam_type = func.coalesce(TestAttempt.exam_type, literal("rhcsa"))
+    has_questions = TestAttempt.max_score > 0
+    percentage = case((has_questions, TestAttempt.score * 100.0 / TestAttempt.max_score), else_=0)
+    passed = case((has_questions & (TestAttempt.score * 100 >= TestAttempt.max_score * PASS_PERCENTAGE), 1), else_=0)
+
+    stale = db.query(DailyAttemptStats)
+    source = select(
+        day,
+        exam_type,
+        func.count(TestAttempt.id),
+        func.sum(passed),
+        func.sum(percentage)
+    ).where(TestAttempt.end_time.is_not(None))
+
+    if since:
+        stale = stale.filter(DailyAttemptStats.day >= since)
+        source = source.where(TestAttempt.end_time >= datetime.combine(since, datetime.min.time()))
+
+    stale.delete(synchronize_session=False)
+    db.execute(insert(DailyAttemptStats).from_select(
+        ["day", "exam_type", "attempts", "passed", "percentage_sum"],
+        source.group_by(day, exam_type)
+    ))
+
+
+def rename_category(db: Session, old_name: str, new_name: str):
+    """
+    Переносит агрегаты category_stats на новое имя категории.
+
+    Не делает commit: вызывается в транзакции переименования категории, чтобы
+    страница аналитики не показывала категорию под старым именем до следующего
+    обновления агрегатов.
+    """
+    old_rows = db.query(CategoryStats).filter(
+        CategoryStats.category == old_name
+    ).with_for_update().all()
+    existing = {
+        row.exam_type: row
+        for row in db.query(CategoryStats).filter(CategoryStats.category == new_name).with_for_update()
+    }
+
+    for row in old_rows:
+        target = existing.get(row.exam_type)
+        if target is None:
+            row.category = new_name
+            continue
+        target.answered = (target.answered or 0) + (row.answered or 0)
+        target.correct = (target.correct or 0) + (row.correct or 0)
+        db.delete(row)
+
+    db.flush()
+    return len(old_rows)
+
+
+def refresh_analytics(db: Session, full: bool = False):
+    """
+    Обновляет все аналитические агрегаты в одной транзакции.
+
+    Читатели страницы аналитики видят прежние данные до commit.
+    При full=False дневная статистика пересчитывается только за последние
+    RECENT_DAYS дней, более старые дни не меняются.
+    """
+    refresh = AnalyticsRefresh(started_at=datetime.utcnow(), full=full)
+    db.add(refresh)
+
+    try:
+        _refresh_answer_stats(db)
+        since = None if full else datetime.utcnow().date() - timedelta(days=RECENT_DAYS)
+        _refresh_daily_stats(db, since)
+
+        refresh.finished_at = datetime.utcnow()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    duration = (refresh.finished_at - refresh.started_at).total_seconds()
+    logger.info("Analytics refreshed (full=%s) in %.2fs", full, duration)
+    return refresh
+
+
+def get_analytics(db: Session, days: int = 30, questions_limit: int = 20, min_answers: int = 5):
+    """Читает данные для страницы аналитики только из предрассчитанных таблиц"""
+    last_refresh = db.query(AnalyticsRefresh).filter(
+        AnalyticsRefresh.finished_at.is_not(None)
+    ).order_by(AnalyticsRefresh.finished_at.desc()).first()
+
+    daily = db.query(DailyAttemptStats).filter(
+        DailyAttemptStats.day >= datetime.utcnow().date() - timedelta(days=days)
+    ).order_by(DailyAttemptStats.day.desc(), DailyAttemptStats.exam_type).all()
+
+    categories = db.query(CategoryStats).order_by(
+        CategoryStats.exam_type, CategoryStats.category
+    ).all()
+
+    # Самые сложные вопросы: наименьший процент правильных ответов
+    hardest = db.query(QuestionStats, Question).join(
+        Question, QuestionStats.question_id == Question.id
+    ).filter(
+        QuestionStats.answered >= min_answers
+    ).order_by(
+        (QuestionStats.correct * 1.0 / QuestionStats.answered).asc()
+    ).limit(questions_limit).all()
+
+    # Статистика вариантов ответа только для выбранных вопросов
+    question_ids = [question.id for _, question in hardest]
+    options = {}
+    if question_ids:
+        rows = db.query(Answer, AnswerOptionStats.selected).outerjoin(
+            AnswerOptionStats, AnswerOptionStats.answer_id == Answer.id
+        ).filter(Answer.question_id.in_(question_ids)).order_by(Answer.id).all()
+        for answer, selected in rows:
+            options.setdefault(answer.question_id, []).append((answer, selected or 0))
+
+    questions = []
+    for stats, question in hardest:
+        question_options = [
+            {
+                "answer_id": answer.id,
+                "text": answer.text,
+                "is_correct": answer.is_correct,
+                "selected": selected,
+                "percent_selected": round(selected / stats.answered * 100, 1) if stats.answered else 0
+            }
+            for answer, selected in options.get(question.id, [])
+        ]
+        questions.append({
+            "question_id": question.id,
+            "text": question.text,
+            "exam_type": question.exam_type,
+            "category": question.category,
+            "difficulty": question.difficulty,
+            "answered": stats.answered,
+            "correct": stats.correct,
+            "percent_correct": round(stats.percent_correct, 1),
+            "options": question_options
+        })
+
+    return {
+        "refreshed_at": last_refresh.finished_at.isoformat() if last_refresh else None,
+        "pass_percentage": PASS_PERCENTAGE,
+        "daily": [
+            {
+                "day": row.day.isoformat(),
+                "exam_type": row.exam_type,
+                "attempts": row.attempts,
+                "passed": row.passed,
+                "pass_rate": round(row.pass_rate, 1),
+                "average_percentage": round(row.average_percentage, 1)
+            }
+            for row in daily
+        ],
+        "categories": [
+            {
+                "exam_type": row.exam_type,
+                "category": row.category,
+                "answered": row.answered,
+                "correct": row.correct,
+                "percent_correct": round(row.percent_correct, 1)
+            }
+            for row in categories
+        ],
+        "questions": questions
+    }
@@ -0,0 +1,66 @@
+"""Запись ответов пользователей пакетными UPSERT"""
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from models import Answer, TestAttempt, UserAnswer
+
+# Максимальное число строк в одном INSERT
+WRITE_BATCH_SIZE = 1000
+
+
+def upsert_user_answers(db: Session, answers_by_attempt):
+    """
+    Записывает ответы {attempt_id: {question_id: answer_id}} пакетными UPSERT.
+
+    Ответы в завершенные попытки не записываются: попытки блокируются FOR SHARE,
+    поэтому запись не может проскочить между проверкой и завершением теста.
+    Правильность вычисляется по БД; ответы, не принадлежащие вопросу, отбрасываются.
+    Возвращает число записанных строк. Commit выполняет вызывающий код.
+    """
+    if not answers_by_attempt:
+        return 0
+    open_attempt_ids = {
+        attempt_id
+        for (attempt_id,) in db.query(TestAttempt.id).filter(
+            TestAttempt.id.in_(answers_by_attempt),
+            TestAttempt.end_time.is_(None)
+        ).with_for_update(read=True)
+    }
+
+    answer_ids = {
+        answer_id
+        for attempt_id, answers in answers_by_attempt.items()
+        if attempt_id in open_attempt_ids
+        for answer_id in answers.values()
+    }
+    if not answer_ids:
+        return 0
+
+    known = {
+        answer_id: (question_id, is_correct)
+        for answer_id, question_id, is_correct in db.query(
+            Answer.id, Answer.question_id, Answer.is_correct
+        ).filter(Answer.id.in_(answer_ids))
+    }
+
+    rows = [
+        {
+            "test_attempt_id": attempt_id,
+            "question_id": question_id,
+            "answer_id": answer_id,
+            "is_correct": bool(known[answer_id][1])
+        }
+        for attempt_id, answers in answers_by_attempt.items()
+        if attempt_id in open_attempt_ids
+        for question_id, answer_id in answers.items()
+        if answer_id in known and known[answer_id][0] == question_id
+    ]
+
+    for start in range(0, len(rows), WRITE_BATCH_SIZE):
+        stmt = dialect_insert(UserAnswer.__table__).values(rows[start:start + WRITE_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["test_attempt_id", "question_id"],
+            set_={"answer_id": stmt.excluded.answer_id, "is_correct": stmt.excluded.is_correct}
+        )
+        db.execute(stmt)
+    return len(rows)
@@ -0,0 +1,81 @@
+"""
+Статические файлы с хешем содержимого в имени.
+
+build_assets.py собирает static/dist и manifest.json: исходный путь -> путь
+с хешем. asset_url() подставляет собранное имя, поэтому такие файлы можно
+кэшировать навсегда. Без сборки отдаются исходные файлы, а сторонние
+библиотеки, которые еще не скачаны, берутся с CDN.
+"""
+import json
+import logging
+import os
+
+from starlette.staticfiles import StaticFiles
+
+logger = logging.getLogger("assets")
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+STATIC_URL = "/static/"
+
+# Кэширование собранных файлов: имя меняется вместе с содержимым
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Сторонние библиотеки: локальный путь в static -> исходный адрес на CDN
+VENDOR_ASSETS = {
+    "vendor/bootstrap/css/bootstrap.min.css":
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css",
+    "vendor/bootstrap/js/bootstrap.bundle.min.js":
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js",
+    "vendor/fontawesome/css/all.min.css":
+        "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css",
+    "vendor/highlight/highlight.min.js":
+        "https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.7.0/highlight.min.js",
+    "vendor/highlight/styles/github.min.css":
+        "https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.7.0/styles/github.min.css",
+}
+# Шрифты, на которые ссылается all.min.css Font Awesome
+VENDOR_ASSETS.update({
+    f"vendor/fontawesome/webfonts/{name}.{extension}":
+        f"https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/webfonts/{name}.{extension}"
+    for name in ("fa-brands-400", "fa-regular-400", "fa-solid-900", "fa-v4compatibility")
+    for extension in ("woff2", "ttf")
+})
+
+_manifest = None
+
+
+def load_manifest():
+    """Читает manifest.json сборки (пустой словарь, если сборки нет)"""
+    global _manifest
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as manifest_file:
+            _manifest = json.load(manifest_file)
+    except FileNotFoundError:
+        _manifest = {}
+    except (OSError, ValueError) as e:
+        logger.warning("Could not read asset manifest %s: %s", MANIFEST_PATH, e)
+        _manifest = {}
+    return _manifest
+
+
+def asset_url(path: str) -> str:
+    """URL статического файла: собранный с хешем, исходный или адрес CDN для библиотек"""
+    manifest = _manifest if _manifest is not None else load_manifest()
+    path = path.lstrip("/")
+    if path in manifest:
+        return f"{STATIC_URL}dist/{manifest[path]}"
+    if path in VENDOR_ASSETS and not os.path.exists(os.path.join(STATIC_DIR, path)):
+        return VENDOR_ASSETS[path]
+    return STATIC_URL + path
+
+
+class AssetStaticFiles(StaticFiles):
+    """StaticFiles с бессрочным кэшированием файлов из dist (если nginx не отдает их сам)"""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if os.path.abspath(full_path).startswith(DIST_DIR + os.sep):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
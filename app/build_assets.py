@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Сборка статических файлов.
+
+Скачивает сторонние библиотеки в static/vendor, минифицирует JS и CSS,
+добавляет хеш содержимого в имена файлов, пишет рядом сжатые копии .gz и .br
+и сохраняет static/dist/manifest.json для asset_url().
+Ссылки url(...) внутри CSS (например, на шрифты) переписываются на собранные имена.
+
+Минификация и brotli необязательны: без rjsmin/rcssmin файлы копируются
+как есть, без brotli не создаются копии .br.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+import sys
+import urllib.request
+
+from assets import DIST_DIR, MANIFEST_PATH, STATIC_DIR, VENDOR_ASSETS
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Для каких файлов создаются сжатые копии (woff2 и изображения уже сжаты)
+COMPRESSIBLE_EXTENSIONS = {".js", ".css", ".svg", ".json", ".txt", ".ttf"}
+# Сжатые копии маленьких файлов не окупаются
+MIN_COMPRESS_SIZE = 256
+
+HASH_LENGTH = 10
+
+_URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+_SOURCE_MAP_RE = re.compile(r"\n?/[/*]# sourceMappingURL=[^\n]*?(?:\*/)?\s*$")
+
+
+def fetch_vendor(force: bool = False) -> bool:
+    """Скачивает недостающие сторонние библиотеки; возвращает False, если что-то не скачалось"""
+    ok = True
+    for path, url in VENDOR_ASSETS.items():
+        target = os.path.join(STATIC_DIR, path)
+        if os.path.exists(target) and not force:
+            continue
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                data = response.read()
+        except Exception as e:
+            print(f"Не удалось скачать {url}: {e}")
+            ok = False
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as vendor_file:
+            vendor_file.write(data)
+        print(f"Скачан {path} ({len(data)} байт)")
+    return ok
+
+
+def collect_sources():
+    """Исходные файлы static (без dist и карт исходников) в порядке: сначала не CSS, потом CSS"""
+    sources = []
+    for root, dirs, files in os.walk(STATIC_DIR):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != DIST_DIR and not d.startswith("."))
+        for name in sorted(files):
+            if name.startswith(".") or name.endswith(".map"):
+                continue
+            path = os.path.relpath(os.path.join(root, name), STATIC_DIR).replace(os.sep, "/")
+            sources.append(path)
+    # CSS обрабатывается последним, чтобы в url(...) подставить уже собранные имена
+    return sorted(sources, key=lambda path: path.endswith(".css"))
+
+
+def minify(path: str, data: bytes) -> bytes:
+    """Минифицирует JS и CSS, если доступен минификатор и файл еще не минифицирован"""
+    if ".min." in posixpath.basename(path):
+        return data
+    if path.endswith(".js") and rjsmin is not None:
+        return rjsmin.jsmin(data.decode("utf-8")).encode("utf-8")
+    if path.endswith(".css") and rcssmin is not None:
+        return rcssmin.cssmin(data.decode("utf-8")).encode("utf-8")
+    return data
+
+
+def rewrite_css_urls(path: str, css: str, manifest: dict) -> str:
+    """Переписывает относительные url(...) на собранные имена файлов"""
+    base_dir = posixpath.dirname(path)
+
+    def replace(match):
+        quote, url = match.group(1), match.group(2).strip()
+        if url.startswith(("data:", "http:", "https:", "//", "#", "/")):
+            return match.group(0)
+        target, suffix = re.match(r"([^?#]*)(.*)", url).groups()
+        resolved = posixpath.normpath(posixpath.join(base_dir, target))
+        if resolved not in manifest:
+            return match.group(0)
+        new_url = posixpath.relpath(manifest[resolved], base_dir)
+        return f"url({quote}{new_url}{suffix}{quote})"
+
+    return _URL_RE.sub(replace, css)
+
+
+def hashed_name(path: str, data: bytes) -> str:
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    stem, extension = posixpath.splitext(path)
+    return f"{stem}.{digest}{extension}"
+
+
+def write_compressed(target: str, data: bytes, stats: dict):
+    """Пишет сжатые копии .gz и .br рядом с файлом"""
+    if os.path.splitext(target)[1] not in COMPRESSIBLE_EXTENSIONS or len(data) < MIN_COMPRESS_SIZE:
+        return
+    gzipped = gzip.compress(data, compresslevel=9, mtime=0)
+    with open(target + ".gz", "wb") as gz_file:
+        gz_file.write(gzipped)
+    stats["gzip"] += len(gzipped)
+    if brotli is not None:
+        compressed = brotli.compress(data, quality=11)
+        with open(target + ".br", "wb") as br_file:
+            br_file.write(compressed)
+        stats["brotli"] += len(compressed)
+
+
+def build():
+    """Собирает static/dist во временном каталоге и заменяет им предыдущую сборку"""
+    build_dir = DIST_DIR + ".tmp"
+    shutil.rmtree(build_dir, ignore_errors=True)
+    manifest = {}
+    stats = {"files": 0, "source": 0, "minified": 0, "gzip": 0, "brotli": 0}
+
+    for path in collect_sources():
+        with open(os.path.join(STATIC_DIR, path), "rb") as source_file:
+            data = source_file.read()
+        stats["source"] += len(data)
+
+        if path.endswith((".js", ".css")):
+            data = minify(path, data)
+            text = _SOURCE_MAP_RE.sub("", data.decode("utf-8"))
+            if path.endswith(".css"):
+                text = rewrite_css_urls(path, text, manifest)
+            data = text.encode("utf-8")
+
+        name = hashed_name(path, data)
+        target = os.path.join(build_dir, *name.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as target_file:
+            target_file.write(data)
+        write_compressed(target, data, stats)
+
+        manifest[path] = name
+        stats["files"] += 1
+        stats["minified"] += len(data)
+
+    with open(os.path.join(build_dir, os.path.basename(MANIFEST_PATH)), "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    os.rename(build_dir, DIST_DIR)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка статических файлов")
+    parser.add_argument("--skip-vendor", action="store_true", help="Не скачивать сторонние библиотеки")
+    parser.add_argument("--refresh-vendor", action="store_true", help="Скачать сторонние библиотеки заново")
+    parser.add_argument("--strict", action="store_true", help="Завершиться с ошибкой, если библиотеки не скачались")
+    args = parser.parse_args()
+
+    if not args.skip_vendor and not fetch_vendor(force=args.refresh_vendor) and args.strict:
+        sys.exit(1)
+    if rjsmin is None or rcssmin is None:
+        print("rjsmin/rcssmin не установлены: JS и CSS копируются без минификации")
+    if brotli is None:
+        print("brotli не установлен: копии .br не создаются")
+
+    stats = build()
+    print(
+        f"Собрано файлов: {stats['files']}; исходный размер {stats['source']} байт, "
+        f"после минификации {stats['minified']}, gzip {stats['gzip']}, brotli {stats['brotli']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
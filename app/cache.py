@@ -0,0 +1,427 @@
+"""
+Кэш приложения: пространства имен, TTL, ограничение размера с вытеснением
+давно не использованных значений (LRU) и защита от одновременной загрузки
+одного значения несколькими запросами (single-flight).
+
+Хранилище выбирается переменной CACHE_BACKEND:
+- memory (по умолчанию) - словарь в памяти процесса;
+- sqlite - файл CACHE_URL, общий для процессов одного хоста (удобен и для
+  локальной проверки нескольких воркеров);
+- redis - сервер CACHE_URL (redis://...), общий для всех воркеров и хостов;
+  размер ограничивается политикой maxmemory сервера.
+Если общее хранилище не удалось подключить, используется память процесса.
+Значения в общих хранилищах сериализуются pickle.
+"""
+import logging
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from metrics import CACHE_REQUESTS
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger("cache")
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_URL = os.getenv("CACHE_URL", "")
+# Сколько ждать значение, которое загружает другой процесс, прежде чем загрузить самому
+CACHE_LOAD_TIMEOUT = float(os.getenv("CACHE_LOAD_TIMEOUT", "10"))
+
+_WAIT_INTERVAL = 0.05
+# Ограничение SQLite на число параметров запроса
+_SQLITE_CHUNK = 500
+
+_MISSING = object()
+
+
+class MemoryBackend:
+    """Кэш в памяти процесса: в OrderedDict ключи идут от давно использованных к недавним"""
+
+    shared = False
+
+    def __init__(self):
+        self.namespaces = {}
+        self.lock = threading.Lock()
+
+    def _get(self, namespace, key, now):
+        items = self.namespaces.get(namespace)
+        entry = items.get(key) if items else None
+        if entry is None:
+            return _MISSING
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del items[key]
+            return _MISSING
+        items.move_to_end(key)
+        return value
+
+    def get(self, namespace, key):
+        with self.lock:
+            return self._get(namespace, key, time.monotonic())
+
+    def get_many(self, namespace, keys):
+        now = time.monotonic()
+        result = {}
+        with self.lock:
+            for key in keys:
+                value = self._get(namespace, key, now)
+                if value is not _MISSING:
+                    result[key] = value
+        return result
+
+    def set_many(self, namespace, values: dict, ttl, max_size):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self.lock:
+            items = self.namespaces.setdefault(namespace, OrderedDict())
+            for key, value in values.items():
+                items[key] = (value, expires_at)
+                items.move_to_end(key)
+            while max_size and len(items) > max_size:
+                items.popitem(last=False)
+
+    def delete(self, namespace, key):
+        with self.lock:
+            self.namespaces.get(namespace, {}).pop(key, None)
+
+    def clear(self, namespace):
+        with self.lock:
+            self.namespaces.pop(namespace, None)
+
+
+class SQLiteBackend:
+    """Кэш в файле SQLite, общий для процессов одного хоста"""
+
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "namespace TEXT, key TEXT, value BLOB, expires_at REAL, accessed_at REAL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        connection.execute("CREATE TABLE IF NOT EXISTS cache_locks (name TEXT PRIMARY KEY, expires_at REAL)")
+
+    @contextmanager
+    def _transaction(self):
+        """Несколько изменений одной транзакцией (соединение работает в режиме autocommit)"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _connection(self):
+        """Соединение для текущего потока (sqlite3 не разделяет соединения между потоками)"""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def get(self, namespace, key):
+        return self.get_many(namespace, [key]).get(key, _MISSING)
+
+    def get_many(self, namespace, keys):
+        connection = self._connection()
+        now = time.time()
+        stored_keys = {repr(key): key for key in keys}
+        result = {}
+        expired = []
+        names = list(stored_keys)
+        for start in range(0, len(names), _SQLITE_CHUNK):
+            chunk = names[start:start + _SQLITE_CHUNK]
+            rows = connection.execute(
+                f"SELECT key, value, expires_at FROM cache WHERE namespace = ? "
+                f"AND key IN ({','.join('?' * len(chunk))})",
+                [namespace, *chunk]
+            ).fetchall()
+            for stored_key, value, expires_at in rows:
+                if expires_at is not None and expires_at <= now:
+                    expired.append(stored_key)
+                else:
+                    result[stored_keys[stored_key]] = pickle.loads(value)
+
+        if not result and not expired:
+            return result
+        with self._transaction() as connection:
+            connection.executemany(
+                "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                [(now, namespace, repr(key)) for key in result]
+            )
+            connection.executemany(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?",
+                [(namespace, stored_key) for stored_key in expired]
+            )
+        return result
+
+    def set_many(self, namespace, values: dict, ttl, max_size):
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._transaction() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (namespace, repr(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at, now)
+                    for key, value in values.items()
+                ]
+            )
+            if max_size:
+                connection.execute(
+                    "DELETE FROM cache WHERE namespace = ? AND key IN ("
+                    "SELECT key FROM cache WHERE namespace = ? ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (namespace, namespace, max_size)
+                )
+
+    def delete(self, namespace, key):
+        self._connection().execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, repr(key)))
+
+    def clear(self, namespace):
+        self._connection().execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
+
+    def acquire(self, namespace, key, timeout):
+        name = f"{namespace}:{key!r}"
+        now = time.time()
+        with self._transaction() as connection:
+            # Блокировка процесса, который упал во время загрузки, истекает сама
+            connection.execute("DELETE FROM cache_locks WHERE name = ? AND expires_at <= ?", (name, now))
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO cache_locks (name, expires_at) VALUES (?, ?)", (name, now + timeout)
+            )
+        return cursor.rowcount == 1
+
+    def release(self, namespace, key):
+        self._connection().execute("DELETE FROM cache_locks WHERE name = ?", (f"{namespace}:{key!r}",))
+
+
+class RedisBackend:
+    """Кэш на сервере Redis, общий для всех воркеров и хостов"""
+
+    shared = True
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("для CACHE_BACKEND=redis нужна библиотека redis")
+        self.client = redis.Redis.from_url(url)
+        self.client.ping()
+
+    @staticmethod
+    def _key(namespace, key):
+        return f"cache:{namespace}:{key!r}"
+
+    def get(self, namespace, key):
+        data = self.client.get(self._key(namespace, key))
+        return _MISSING if data is None else pickle.loads(data)
+
+    def get_many(self, namespace, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.client.mget([self._key(namespace, key) for key in keys])
+        return {key: pickle.loads(values[i]) for i, key in enumerate(keys) if values[i] is not None}
+
+    def set_many(self, namespace, values: dict, ttl, _max_size):
+        # Размер ограничивает политика maxmemory сервера
+        pipeline = self.client.pipeline(transaction=False)
+        for key, value in values.items():
+            pipeline.set(
+                self._key(namespace, key),
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                px=int(ttl * 1000) if ttl else None
+            )
+        pipeline.execute()
+
+    def delete(self, namespace, key):
+        self.client.delete(self._key(namespace, key))
+
+    def clear(self, namespace):
+        batch = []
+        for name in self.client.scan_iter(match=f"cache:{namespace}:*", count=1000):
+            batch.append(name)
+            if len(batch) >= 1000:
+                self.client.delete(*batch)
+                batch = []
+        if batch:
+            self.client.delete(*batch)
+
+    def acquire(self, namespace, key, timeout):
+        return bool(self.client.set(f"lock:{self._key(namespace, key)}", 1, nx=True, px=int(timeout * 1000)))
+
+    def release(self, namespace, key):
+        self.client.delete(f"lock:{self._key(namespace, key)}")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(name: str = CACHE_BACKEND, url: str = CACHE_URL):
+    """Создает хранилище; при ошибке подключения общего хранилища возвращает память процесса"""
+    try:
+        if name == "sqlite":
+            return SQLiteBackend(url or os.path.join(tempfile.gettempdir(), "cli-flow-cache.sqlite3"))
+        if name == "redis":
+            return RedisBackend(url or "redis://localhost:6379/0")
+    except Exception as e:
+        logger.warning("Cache backend %s unavailable, using process memory: %s", name, e)
+        return MemoryBackend()
+    if name != "memory":
+        logger.warning("Unknown CACHE_BACKEND=%s, using process memory", name)
+    return MemoryBackend()
+
+
+def get_backend():
+    """Хранилище по умолчанию (создается при первом обращении)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+                logger.info("Cache backend: %s", type(_backend).__name__)
+    return _backend
+
+
+class Cache:
+    """
+    Пространство имен кэша.
+
+    ttl - время жизни значений в секундах (None - до явного сброса),
+    max_size - максимум значений (None - без ограничения).
+    Ошибки общего хранилища не прерывают запрос: значение считается
+    отсутствующим и загружается заново.
+    get_or_load и get_many_or_load блокируют поток на время загрузки и ожидания
+    чужой загрузки: из async-обработчиков они вызываются через run_in_threadpool.
+    """
+
+    # Блокировки single-flight: ключи распределяются по фиксированному набору
+    _LOCK_STRIPES = 64
+
+    def __init__(self, namespace: str, ttl: float = None, max_size: int = None, backend=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_size = max_size
+        self._backend = backend
+        # Меняется при сбросе: значение, загруженное до сброса, не сохраняется
+        self._generation = 0
+        self._locks = [threading.Lock() for _ in range(self._LOCK_STRIPES)]
+
+    @property
+    def backend(self):
+        return self._backend or get_backend()
+
+    def _call(self, method, *args, default=None):
+        try:
+            return getattr(self.backend, method)(self.namespace, *args)
+        except Exception as e:
+            logger.warning("Cache %s.%s failed: %s", self.namespace, method, e)
+            return default
+
+    def _count(self, hits: int, misses: int):
+        if hits:
+            CACHE_REQUESTS.labels(self.namespace, "hit").inc(hits)
+        if misses:
+            CACHE_REQUESTS.labels(self.namespace, "miss").inc(misses)
+
+    def get(self, key, default=None):
+        value = self._call("get", key, default=_MISSING)
+        self._count(value is not _MISSING, value is _MISSING)
+        return default if value is _MISSING else value
+
+    def get_many(self, keys) -> dict:
+        """Найденные значения {ключ: значение}; отсутствующих ключей в результате нет"""
+        keys = list(keys)
+        result = self._call("get_many", keys, default={})
+        self._count(len(result), len(keys) - len(result))
+        return result
+
+    def set(self, key, value, ttl: float = None):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, values: dict, ttl: float = None):
+        if values:
+            self._call("set_many", values, self.ttl if ttl is None else ttl, self.max_size)
+
+    def delete(self, key):
+        self._generation += 1
+        self._call("delete", key)
+
+    def clear(self):
+        self._generation += 1
+        self._call("clear")
+
+    def get_or_load(self, key, loader, ttl: float = None):
+        """Значение из кэша или результат loader(); одновременно значение загружает только один запрос"""
+        value = self._call("get", key, default=_MISSING)
+        if value is not _MISSING:
+            self._count(1, 0)
+            return value
+
+        with self._locks[hash(key) % self._LOCK_STRIPES]:
+            # Пока ждали блокировку, значение мог загрузить другой поток
+            value = self._call("get", key, default=_MISSING)
+            if value is not _MISSING:
+                self._count(1, 0)
+                return value
+            self._count(0, 1)
+            return self._load(key, loader, ttl)
+
+    def get_many_or_load(self, keys, loader, ttl: float = None) -> dict:
+        """
+        Значения ключей {ключ: значение}; отсутствующие загружаются одним вызовом
+        loader(missing) -> {ключ: значение}. Как и в get_or_load, значения,
+        загруженные во время сброса, не сохраняются.
+        """
+        keys = list(keys)
+        found = self.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            generation = self._generation
+            loaded = loader(missing)
+            if generation == self._generation:
+                self.set_many(loaded, ttl)
+            found.update(loaded)
+        return found
+
+    def _store_loaded(self, key, loader, ttl):
+        generation = self._generation
+        value = loader()
+        # None (объекта нет) не кэшируется
+        if value is not None and generation == self._generation:
+            self.set(key, value, ttl)
+        return value
+
+    def _load(self, key, loader, ttl):
+        """Загрузка с блокировкой в общем хранилище: остальные процессы ждут готовое значение"""
+        if not self.backend.shared:
+            return self._store_loaded(key, loader, ttl)
+
+        acquired = self._call("acquire", key, CACHE_LOAD_TIMEOUT, default=True)
+        deadline = time.monotonic() + CACHE_LOAD_TIMEOUT
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(_WAIT_INTERVAL)
+            value = self._call("get", key, default=_MISSING)
+            if value is not _MISSING:
+                return value
+            acquired = self._call("acquire", key, CACHE_LOAD_TIMEOUT, default=True)
+
+        try:
+            return self._store_loaded(key, loader, ttl)
+        finally:
+            if acquired:
+                self._call("release", key)
@@ -1,17 +1,116 @@
 import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql.dml import UpdateBase
 
 # URL для подключения к базе данных
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/rhcsa_db")
 
+# Реплики только для чтения через запятую (пусто - все запросы идут в основную БД)
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+
+# Сколько секунд после записи пользователь читает из основной БД (запас на отставание реплик)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+PRIMARY_COOKIE = "db_primary_until"
+
+
+def _create_engine(url: str, **kwargs):
+    # SQLite (например, для локального нагрузочного теста) используется из нескольких потоков
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    return create_engine(url, connect_args=connect_args, **kwargs)
+
+
 # Создаем движок SQLAlchemy
-engine = create_engine(DATABASE_URL)
+engine = _create_engine(DATABASE_URL)
+# Недоступная реплика обнаруживается при выдаче соединения из пула, а не посреди запроса
+replica_engines = [_create_engine(url, pool_pre_ping=True) for url in DATABASE_REPLICA_URLS]
+all_engines = [engine, *replica_engines]
+
+
+class RequestRouting:
+    """Маршрутизация чтения для одного HTTP-запроса"""
+
+    def __init__(self, sticky: bool = False):
+        # Пользователь недавно писал: читаем из основной БД
+        self.sticky = sticky
+        # В этом запросе была запись: ответ продлевает привязку к основной БД
+        self.wrote = False
+
+
+_current_routing = ContextVar("db_request_routing", default=None)
+
+
+def start_request(cookies: dict):
+    """Начинает маршрутизацию для запроса по cookie привязки; возвращает (routing, token)"""
+    try:
+        sticky = float(cookies.get(PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        sticky = False
+    routing = RequestRouting(sticky)
+    return routing, _current_routing.set(routing)
+
+
+def finish_request(token):
+    _current_routing.reset(token)
+
+
+def primary_cookie():
+    """Значение и срок жизни cookie привязки к основной БД после записи"""
+    return str(int(time.time() + READ_YOUR_WRITES_SECONDS) + 1), int(READ_YOUR_WRITES_SECONDS) + 1
+
+
+def _mark_write(session):
+    session.info["primary"] = True
+    routing = _current_routing.get()
+    if routing is not None:
+        routing.wrote = True
+
+
+class RoutingSession(Session):
+    """Сессия для чтения: запросы идут на одну из реплик, запись и все после нее - в основную БД"""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or isinstance(clause, UpdateBase):
+            _mark_write(self)
+        if self.info.get("primary") or not replica_engines:
+            # Основная БД (bind фабрики сессий)
+            return super().get_bind(mapper, clause=clause, **kwargs)
+        # Одна реплика на всю сессию: данные в пределах запроса согласованы между собой
+        if "replica" not in self.info:
+            self.info["replica"] = random.choice(replica_engines)
+        return self.info["replica"]
+
 
 # Создаем фабрику сессий
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=RoutingSession)
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    _mark_write(session)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_orm_execute(orm_execute_state):
+    # Массовые UPDATE/DELETE через query().update()/delete() не проходят через flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        _mark_write(orm_execute_state.session)
+
+
+def dialect_insert(table):
+    """INSERT с поддержкой ON CONFLICT для диалекта основной БД"""
+    if engine.dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
 
 # Базовый класс для моделей
 Base = declarative_base()
@@ -24,3 +123,35 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    """Сессия для эндпоинтов, которые только читают: реплика, если пользователь недавно не писал"""
+    routing = _current_routing.get()
+    if not replica_engines or (routing is not None and routing.sticky):
+        db = SessionLocal()
+    else:
+        db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@contextmanager
+def primary_session(db: Session):
+    """
+    Сессия основной БД для заполнения общих кэшей.
+
+    Реплика может отставать: строка, прочитанная с нее сразу после сброса кэша,
+    вернула бы в кэш старое значение. Промах кэша читается из основной БД,
+    попадания по-прежнему не нагружают ее.
+    """
+    if not replica_engines or not isinstance(db, RoutingSession):
+        yield db
+        return
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
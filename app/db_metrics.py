@@ -0,0 +1,108 @@
+"""Подсчет SQL-запросов и времени работы БД в рамках одного HTTP-запроса"""
+import os
+import re
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+# Пороги, при превышении которых запрос логируется с отпечатками SQL
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "1.0"))
+SLOW_REQUEST_QUERIES = int(os.getenv("SLOW_REQUEST_QUERIES", "30"))
+
+# Сколько самых частых отпечатков выводить в лог
+FINGERPRINT_LIMIT = 5
+
+_current_stats = ContextVar("db_request_stats", default=None)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_PARAM_RE = re.compile(r"%\(\w+\)s|\?|:\w+|__\[POSTCOMPILE_\w+\]")
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_VALUES_RE = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+
+
+def fingerprint(statement: str) -> str:
+    """Нормализует SQL: параметры и литералы заменяются на ?, списки IN и VALUES сворачиваются"""
+    statement = _WHITESPACE_RE.sub(" ", statement).strip()
+    statement = _PARAM_RE.sub("?", statement)
+    statement = _LITERAL_RE.sub("?", statement)
+    statement = _IN_LIST_RE.sub("(?)", statement)
+    return _VALUES_RE.sub("(?), ...", statement)
+
+
+class RequestDbStats:
+    """Счетчики запросов к БД для одного HTTP-запроса"""
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+        # текст SQL -> [количество, суммарное время]
+        self.statements = defaultdict(lambda: [0, 0.0])
+
+    def record(self, statement: str, duration: float):
+        self.queries += 1
+        self.duration += duration
+        entry = self.statements[statement]
+        entry[0] += 1
+        entry[1] += duration
+
+    def top_fingerprints(self, limit: int = FINGERPRINT_LIMIT):
+        """Самые частые отпечатки: [(количество, время, отпечаток)]"""
+        rows = [(count, total, fingerprint(statement)) for statement, (count, total) in self.statements.items()]
+        # Разные тексты могут давать один отпечаток (например, IN с разным числом элементов)
+        merged = defaultdict(lambda: [0, 0.0])
+        for count, total, key in rows:
+            merged[key][0] += count
+            merged[key][1] += total
+        ordered = sorted(merged.items(), key=lambda item: (item[1][0], item[1][1]), reverse=True)
+        return [(count, total, key) for key, (count, total) in ordered[:limit]]
+
+    def server_timing(self, total_duration: float) -> str:
+        return (
+            f'db;dur={self.duration * 1000:.1f};desc="{self.queries} queries", '
+            f"app;dur={total_duration * 1000:.1f}"
+        )
+
+    def is_slow(self, total_duration: float) -> bool:
+        return total_duration >= SLOW_REQUEST_SECONDS or self.queries >= SLOW_REQUEST_QUERIES
+
+
+def start_request():
+    """Начинает сбор статистики для текущего запроса; возвращает (stats, token)"""
+    stats = RequestDbStats()
+    return stats, _current_stats.set(stats)
+
+
+def finish_request(token):
+    _current_stats.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get("query_start_time")
+    if not start_times:
+        return
+    duration = time.perf_counter() - start_times.pop()
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(statement, duration)
+
+
+def _handle_error(exception_context):
+    # Запрос завершился ошибкой: убираем его время начала из стека
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_start_time"):
+        connection.info["query_start_time"].pop()
+
+
+def install(engine):
+    """Подключает обработчики событий SQLAlchemy к движку"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
@@ -0,0 +1,108 @@
+"""
+Отладочная трассировка запросов.
+
+Трассировка включается для доли запросов через TRACE_ENABLED и TRACE_SAMPLE_RATE
+или для отдельного запроса заголовком X-Debug-Trace: 1. Заголовок учитывается,
+только если включен TRACE_ALLOW_HEADER и запрос пришел от администратора
+(признак adm в токене, проверенном middleware) или с адреса из TRACE_TRUSTED_IPS.
+Обращений к БД при этом нет.
+События запроса собираются в память и пишутся одной структурированной записью
+логгера "trace" после ответа. Если трассировка выключена, enabled() - это
+одно чтение ContextVar, а аргументы событий не вычисляются.
+"""
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from contextvars import ContextVar
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "0") == "1"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_ALLOW_HEADER = os.getenv("TRACE_ALLOW_HEADER", "0") == "1"
+# Адреса непосредственного клиента (не X-Forwarded-For), которым заголовок разрешен без входа
+TRACE_TRUSTED_IPS = {ip.strip() for ip in os.getenv("TRACE_TRUSTED_IPS", "").split(",") if ip.strip()}
+TRACE_HEADER = "x-debug-trace"
+
+logger = logging.getLogger("trace")
+
+_current_trace = ContextVar("request_trace", default=None)
+
+
+class Trace:
+    """События одного запроса"""
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.events = []
+
+    def add(self, name, fields):
+        self.events.append({
+            "event": name,
+            "at_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            **fields
+        })
+
+
+def enabled() -> bool:
+    """Включена ли трассировка для текущего запроса"""
+    return _current_trace.get() is not None
+
+
+def event(name: str, **fields):
+    """Добавляет событие в трассировку текущего запроса (без трассировки ничего не делает)"""
+    current = _current_trace.get()
+    if current is not None:
+        current.add(name, fields)
+
+
+def _header_allowed(client_ip, auth_payload) -> bool:
+    """Трассировку по заголовку может включить только доверенный адрес или администратор"""
+    if client_ip in TRACE_TRUSTED_IPS:
+        return True
+    return bool(auth_payload and auth_payload.get("adm"))
+
+
+def _should_trace(headers, client_ip, auth_payload) -> bool:
+    if TRACE_ALLOW_HEADER and headers.get(TRACE_HEADER) == "1" and _header_allowed(client_ip, auth_payload):
+        return True
+    return TRACE_ENABLED and (TRACE_SAMPLE_RATE >= 1 or random.random() < TRACE_SAMPLE_RATE)
+
+
+def start_request(headers, client_ip=None, auth_payload=None):
+    """
+    Начинает трассировку, если она нужна; возвращает (trace или None, token).
+
+    client_ip - адрес непосредственного клиента, auth_payload - данные токена пользователя.
+    """
+    if not _should_trace(headers, client_ip, auth_payload):
+        return None, None
+    current = Trace()
+    return current, _current_trace.set(current)
+
+
+def finish_request(current, token, method: str, path: str, status_code: int):
+    """Завершает трассировку и пишет ее одной записью"""
+    if current is None:
+        return
+    _current_trace.reset(token)
+    duration = round((time.perf_counter() - current.started) * 1000, 2)
+    logger.info(
+        "Trace %s: %s %s status=%s duration=%sms events=%s",
+        current.trace_id, method, path, status_code, duration,
+        # Текст событий собирается только в потоке записи логов
+        _LazyJson(current.events),
+        extra={"trace_id": current.trace_id, "trace_events": current.events}
+    )
+
+
+class _LazyJson:
+    """Сериализует значение в JSON только при форматировании записи"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return json.dumps(self.value, ensure_ascii=False, default=str)
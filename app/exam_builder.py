@@ -0,0 +1,228 @@
+"""Сборка адаптивного теста фиксированной длины"""
+import logging
+import os
+import random
+from collections import defaultdict
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, selectinload
+
+from cache import Cache
+from database import primary_session
+from models import Question, TestAttempt, UserAnswer, UserCategoryStats
+
+logger = logging.getLogger("exam_builder")
+
+# Количество вопросов в тесте по умолчанию и максимально допустимое
+EXAM_QUESTION_COUNT = int(os.getenv("EXAM_QUESTION_COUNT", "20"))
+EXAM_MAX_QUESTION_COUNT = int(os.getenv("EXAM_MAX_QUESTION_COUNT", "100"))
+
+# Время жизни кэша пула вопросов в секундах
+EXAM_POOL_TTL = int(os.getenv("EXAM_POOL_TTL", "300"))
+
+# Размер порции вопросов при постраничной выдаче теста
+EXAM_PAGE_SIZE = int(os.getenv("EXAM_PAGE_SIZE", "10"))
+EXAM_MAX_PAGE_SIZE = 50
+
+# Вопросы из скольких последних попыток считаются недавно показанными
+RECENT_ATTEMPTS = int(os.getenv("EXAM_RECENT_ATTEMPTS", "3"))
+
+DIFFICULTIES = ("easy", "medium", "hard")
+EXAM_TYPES = ("rhcsa", "cka")
+
+
+def exam_type_label(exam_type) -> str:
+    """Метка метрики для типа экзамена: неизвестные значения сводятся в other"""
+    return exam_type if exam_type in EXAM_TYPES else "other"
+
+
+# Пулы кандидатов: exam_type -> список (id, category, difficulty)
+_candidate_pools = Cache("candidate_pool", ttl=EXAM_POOL_TTL)
+
+
+def invalidate_candidate_pool(exam_type: str = None):
+    """Сбрасывает кэш пула вопросов (для одного типа экзамена или для всех)"""
+    if exam_type is None:
+        _candidate_pools.clear()
+    else:
+        _candidate_pools.delete(exam_type)
+
+
+def _load_candidate_pool(db: Session, exam_type: str):
+    # Кэш заполняется только из основной БД: реплика может отставать
+    with primary_session(db) as session:
+        rows = session.execute(
+            select(Question.id, Question.category, Question.difficulty)
+            .where(Question.exam_type == exam_type)
+            .order_by(Question.id)
+        ).all()
+    pool = [tuple(row) for row in rows]
+    logger.info("Candidate pool loaded: exam_type=%s size=%s", exam_type, len(pool))
+    return pool
+
+
+def get_candidate_pool(db: Session, exam_type: str):
+    """Возвращает легковесный пул (id, category, difficulty) всех вопросов типа экзамена"""
+    return _candidate_pools.get_or_load(exam_type, lambda: _load_candidate_pool(db, exam_type))
+
+
+def get_exam_facets(db: Session):
+    """Категории по типам экзамена и уровни сложности для страницы выбора теста (из пулов вопросов)"""
+    categories = {}
+    difficulties = set()
+    for exam_type in EXAM_TYPES:
+        pool = get_candidate_pool(db, exam_type)
+        categories[exam_type] = sorted({category for _, category, _ in pool if category})
+        difficulties.update(difficulty for _, _, difficulty in pool if difficulty)
+    ordered = [difficulty for difficulty in DIFFICULTIES if difficulty in difficulties]
+    return categories, ordered + sorted(difficulties - set(DIFFICULTIES))
+
+
+def get_category_weights(db: Session, user_id: int, exam_type: str):
+    """
+    Веса категорий по доле ошибок пользователя из user_category_stats.
+
+    Используется сглаживание Лапласа: для незнакомой категории вес 0.5,
+    поэтому новые темы не вытесняются полностью слабыми.
+    """
+    rows = db.query(
+        UserCategoryStats.category,
+        UserCategoryStats.answered,
+        UserCategoryStats.correct
+    ).filter(
+        UserCategoryStats.user_id == user_id,
+        UserCategoryStats.exam_type == exam_type
+    ).all()
+    return {
+        category: (answered - correct + 1) / (answered + 2)
+        for category, answered, correct in rows
+    }
+
+
+def get_recent_question_ids(db: Session, user_id: int, limit: int = RECENT_ATTEMPTS):
+    """ID вопросов из последних попыток пользователя"""
+    recent_attempts = select(TestAttempt.id).where(
+        TestAttempt.user_id == user_id
+    ).order_by(TestAttempt.start_time.desc(), TestAttempt.id.desc()).limit(limit).subquery()
+
+    rows = db.execute(
+        select(func.distinct(UserAnswer.question_id)).where(
+            UserAnswer.test_attempt_id.in_(select(recent_attempts.c.id))
+        )
+    ).all()
+    return {question_id for (question_id,) in rows}
+
+
+def allocate_counts(available, weights, total):
+    """
+    Распределяет total вопросов по категориям пропорционально весам.
+
+    Не выдает категории больше вопросов, чем в ней есть: излишек
+    перераспределяется между остальными категориями.
+    """
+    counts = {category: 0 for category in available}
+    remaining = min(total, sum(available.values()))
+    open_categories = [category for category in available if available[category] > 0]
+
+    while remaining > 0 and open_categories:
+        weight_sum = sum(weights[category] for category in open_categories)
+        shares = {
+            category: remaining * weights[category] / weight_sum
+            for category in open_categories
+        }
+        # Целые части, затем остаток по наибольшим дробным частям
+        grant = {category: int(share) for category, share in shares.items()}
+        leftover = remaining - sum(grant.values())
+        by_fraction = sorted(open_categories, key=lambda c: shares[c] - grant[c], reverse=True)
+        for category in by_fraction[:leftover]:
+            grant[category] += 1
+
+        for category in open_categories:
+            granted = min(grant[category], available[category] - counts[category])
+            counts[category] += granted
+            remaining -= granted
+        open_categories = [c for c in open_categories if counts[c] < available[c]]
+
+    return counts
+
+
+def pick_balanced(candidates, count, recent_ids, rng):
+    """
+    Выбирает count вопросов категории, чередуя уровни сложности.
+
+    Недавно показанные вопросы берутся только если новых не хватает.
+    """
+    buckets = defaultdict(list)
+    for question_id, difficulty in candidates:
+        buckets[difficulty].append(question_id)
+    for ids in buckets.values():
+        rng.shuffle(ids)
+        # Стабильная сортировка: сначала не показанные недавно
+        ids.sort(key=lambda question_id: question_id in recent_ids)
+
+    order = [d for d in DIFFICULTIES if d in buckets] + [d for d in buckets if d not in DIFFICULTIES]
+    rng.shuffle(order)
+
+    picked = []
+    while len(picked) < count:
+        # Сначала проходим по новым вопросам всех уровней, потом по недавним
+        fresh = [d for d in order if buckets[d] and buckets[d][0] not in recent_ids]
+        source = fresh or [d for d in order if buckets[d]]
+        if not source:
+            break
+        for difficulty in source:
+            if len(picked) == count:
+                break
+            picked.append(buckets[difficulty].pop(0))
+    return picked
+
+
+def build_exam(
+    db: Session,
+    user_id: int,
+    exam_type: str,
+    categories=None,
+    difficulties=None,
+    count: int = EXAM_QUESTION_COUNT,
+    rng: random.Random = None
+):
+    """Собирает тест из count вопросов и возвращает список их ID в порядке показа"""
+    rng = rng or random.Random()
+    categories = set(categories or [])
+    difficulties = set(difficulties or [])
+
+    by_category = defaultdict(list)
+    for question_id, category, difficulty in get_candidate_pool(db, exam_type):
+        if categories and category not in categories:
+            continue
+        if difficulties and difficulty not in difficulties:
+            continue
+        by_category[category].append((question_id, difficulty))
+
+    if not by_category:
+        return []
+
+    known_weights = get_category_weights(db, user_id, exam_type)
+    weights = {category: known_weights.get(category, 0.5) for category in by_category}
+    available = {category: len(items) for category, items in by_category.items()}
+    counts = allocate_counts(available, weights, count)
+
+    recent_ids = get_recent_question_ids(db, user_id)
+    question_ids = []
+    for category, category_count in counts.items():
+        if category_count:
+            question_ids.extend(pick_balanced(by_category[category], category_count, recent_ids, rng))
+    rng.shuffle(question_ids)
+    return question_ids
+
+
+def load_questions(db: Session, question_ids):
+    """Загружает вопросы с ответами одним запросом, сохраняя порядок question_ids"""
+    if not question_ids:
+        return []
+    questions = db.query(Question).options(
+        selectinload(Question.answers)
+    ).filter(Question.id.in_(question_ids)).all()
+    # Вопрос мог быть удален после выдачи - просто пропускаем его
+    by_id = {question.id: question for question in questions}
+    return [by_id[question_id] for question_id in question_ids if question_id in by_id]
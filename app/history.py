@@ -0,0 +1,115 @@
+"""Постраничная (keyset) выборка истории тестирования"""
+import base64
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, load_only
+
+from models import TestAttempt
+
+# Размер страницы истории по умолчанию и максимально допустимый
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+# Допустимые варианты сортировки
+HISTORY_ORDERS = ("desc", "asc")
+
+
+def encode_cursor(attempt: TestAttempt) -> str:
+    """Кодирует позицию последней записи страницы в непрозрачный курсор"""
+    raw = f"{attempt.start_time.isoformat()}|{attempt.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """Декодирует курсор в пару (start_time, id); ValueError при неверном формате"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        start_time, attempt_id = raw.split("|")
+        return datetime.fromisoformat(start_time), int(attempt_id)
+    except Exception as e:
+        raise ValueError("Некорректный курсор") from e
+
+
+def fetch_history_page(
+    db: Session,
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = HISTORY_PAGE_SIZE,
+    order: str = "desc",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    exam_type: Optional[str] = None,
+    finished_only: bool = True
+):
+    """
+    Возвращает страницу попыток пользователя и курсор следующей страницы.
+
+    Сортировка идет по (start_time, id), поэтому каждая страница - это
+    диапазонное сканирование индекса ix_test_attempts_user_history
+    независимо от того, насколько далеко пролистана история.
+    """
+    if order not in HISTORY_ORDERS:
+        raise ValueError("Некорректный порядок сортировки")
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+
+    query = db.query(TestAttempt).options(
+        load_only(
+            TestAttempt.id,
+            TestAttempt.user_id,
+            TestAttempt.start_time,
+            TestAttempt.end_time,
+            TestAttempt.score,
+            TestAttempt.max_score,
+            TestAttempt.exam_type
+        )
+    ).filter(TestAttempt.user_id == user_id)
+
+    if finished_only:
+        query = query.filter(TestAttempt.end_time.is_not(None))
+    if exam_type:
+        query = query.filter(TestAttempt.exam_type == exam_type)
+    if date_from:
+        query = query.filter(TestAttempt.start_time >= datetime.combine(date_from, time.min))
+    if date_to:
+        # Дата окончания включается в диапазон целиком
+        query = query.filter(TestAttempt.start_time < datetime.combine(date_to + timedelta(days=1), time.min))
+
+    key = tuple_(TestAttempt.start_time, TestAttempt.id)
+    if cursor:
+        position = decode_cursor(cursor)
+        query = query.filter(key < position if order == "desc" else key > position)
+
+    if order == "desc":
+        query = query.order_by(TestAttempt.start_time.desc(), TestAttempt.id.desc())
+    else:
+        query = query.order_by(TestAttempt.start_time.asc(), TestAttempt.id.asc())
+
+    # Запрашиваем на одну запись больше, чтобы понять, есть ли следующая страница
+    attempts = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(attempts) > limit:
+        attempts = attempts[:limit]
+        next_cursor = encode_cursor(attempts[-1])
+
+    return attempts, next_cursor
+
+
+def attempt_to_dict(attempt: TestAttempt) -> dict:
+    """Представление попытки для JSON-ответа истории"""
+    percentage = (attempt.score / attempt.max_score * 100) if attempt.max_score else 0
+    duration = None
+    if attempt.end_time:
+        duration = int((attempt.end_time - attempt.start_time).total_seconds())
+
+    return {
+        "id": attempt.id,
+        "exam_type": attempt.exam_type,
+        "start_time": attempt.start_time.isoformat(),
+        "end_time": attempt.end_time.isoformat() if attempt.end_time else None,
+        "score": attempt.score,
+        "max_score": attempt.max_score,
+        "percentage": round(percentage, 1),
+        "duration_seconds": duration
+    }
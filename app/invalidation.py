@@ -0,0 +1,178 @@
+"""
+Шина сброса кэшей между воркерами и хостами.
+
+После записи вызывается publish(entity, entity_id): кэши текущего процесса
+сбрасываются сразу, а остальным процессам отправляется
+NOTIFY cache_invalidate, '<entity>:<id>' (id "*" - все объекты сущности).
+Каждый воркер слушает канал в фоновом потоке на отдельном соединении psycopg2
+и сбрасывает свои кэши. Без PostgreSQL (например, SQLite) шина работает
+только внутри процесса.
+"""
+import contextlib
+import logging
+import os
+import select
+import threading
+
+from sqlalchemy import text
+
+from database import engine
+from exam_builder import invalidate_candidate_pool
+from payloads import invalidate_payloads, question_payloads, topic_payloads
+from theory_tree import invalidate_theory_tree
+
+logger = logging.getLogger("invalidation")
+
+CHANNEL = "cache_invalidate"
+
+# Пауза перед переподключением слушателя после ошибки
+INVALIDATION_RECONNECT_SECONDS = float(os.getenv("INVALIDATION_RECONNECT_SECONDS", "5"))
+# Как часто слушатель проверяет флаг остановки
+_POLL_SECONDS = 5
+
+ALL = "*"
+
+
+def _evict_question(entity_id):
+    invalidate_candidate_pool()
+    if entity_id == ALL:
+        question_payloads.clear()
+    else:
+        question_payloads.delete(int(entity_id))
+    # Вопросы входят в ответ темы
+    topic_payloads.clear()
+
+
+def _evict_topic(entity_id):
+    # Тема входит в ответы родителя и корневой список, поэтому сбрасывается все дерево
+    invalidate_theory_tree()
+    topic_payloads.clear()
+
+
+def _evict_category(entity_id):
+    invalidate_candidate_pool()
+    invalidate_payloads()
+
+
+# Сущность -> функция сброса локальных кэшей
+_HANDLERS = {
+    "question": _evict_question,
+    "topic": _evict_topic,
+    "category": _evict_category,
+}
+
+_listener = None
+_stop = threading.Event()
+# Оповещение не отправилось: слушатель разошлет полный сброс на следующем опросе
+_unpublished = threading.Event()
+
+
+def evict(entity: str, entity_id=ALL):
+    """Сбрасывает кэши текущего процесса для объекта"""
+    handler = _HANDLERS.get(entity)
+    if handler is None:
+        logger.warning("Unknown cache entity: %s", entity)
+        return
+    handler(str(entity_id))
+
+
+def evict_all():
+    """Сбрасывает все кэши текущего процесса"""
+    for entity in _HANDLERS:
+        evict(entity)
+
+
+def _is_postgres() -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+def publish(entity: str, entity_id=ALL):
+    """Сбрасывает кэши объекта в этом процессе и оповещает остальные (вызывать после commit)"""
+    evict(entity, entity_id)
+    if not _is_postgres():
+        return
+    try:
+        with engine.begin() as connection:
+            connection.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": CHANNEL, "payload": f"{entity}:{entity_id}"}
+            )
+    except Exception as e:
+        # Запись уже сохранена. Слушатель повторит оповещение полным сбросом,
+        # а до тех пор устаревание остальных воркеров ограничено TTL кэшей
+        logger.warning("Cache invalidation not published: %s:%s: %s", entity, entity_id, e)
+        _unpublished.set()
+
+
+def _publish_pending(connection):
+    """Рассылает полный сброс кэшей после неудачного publish() в этом процессе"""
+    if not _unpublished.is_set():
+        return
+    _unpublished.clear()
+    try:
+        with connection.cursor() as cursor:
+            for entity in _HANDLERS:
+                cursor.execute("SELECT pg_notify(%s, %s)", (CHANNEL, f"{entity}:{ALL}"))
+    except Exception:
+        _unpublished.set()
+        raise
+    logger.info("Published full cache invalidation after an earlier failure")
+
+
+def _handle(payload: str):
+    entity, _, entity_id = payload.partition(":")
+    try:
+        evict(entity, entity_id or ALL)
+    except ValueError:
+        logger.warning("Malformed cache invalidation: %s", payload)
+
+
+def _connect():
+    """Отдельное соединение вне пула: оно занято слушателем все время работы"""
+    cargs, cparams = engine.dialect.create_connect_args(engine.url)
+    connection = engine.dialect.loaded_dbapi.connect(*cargs, **cparams)
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute(f"LISTEN {CHANNEL}")
+    return connection
+
+
+def _listen():
+    while not _stop.is_set():
+        connection = None
+        try:
+            connection = _connect()
+            # Пока слушателя не было, оповещения могли потеряться
+            evict_all()
+            logger.info("Listening for cache invalidations on channel %s", CHANNEL)
+            while not _stop.is_set():
+                _publish_pending(connection)
+                if select.select([connection], [], [], _POLL_SECONDS) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    _handle(connection.notifies.pop(0).payload)
+        except Exception as e:
+            logger.warning("Cache invalidation listener failed: %s", e)
+            _stop.wait(INVALIDATION_RECONNECT_SECONDS)
+        finally:
+            if connection is not None:
+                with contextlib.suppress(Exception):
+                    connection.close()
+
+
+def start_listener():
+    """Запускает фоновый поток слушателя (только для PostgreSQL)"""
+    global _listener
+    if not _is_postgres():
+        logger.info("Cache invalidation bus is local: database is not PostgreSQL")
+        return
+    if _listener is not None and _listener.is_alive():
+        return
+    _stop.clear()
+    _listener = threading.Thread(target=_listen, name="cache-invalidation", daemon=True)
+    _listener.start()
+
+
+def stop_listener():
+    _stop.set()
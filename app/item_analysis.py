@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Скрипт для анализа качества вопросов (item analysis).
+
+Потоково читает user_answers порциями и для каждого вопроса считает:
+- p-value: долю правильных ответов (question_stats.correct / answered);
+- дискриминацию: точечно-бисериальную корреляцию правильности ответа
+  с результатом остальной части попытки;
+- долю выбора и средний результат для каждого варианта ответа.
+
+Результаты пишутся в те же таблицы question_stats и answer_option_stats, что
+обновляет refresh_analytics: счетчики ответов принадлежат ему, а анализ
+заполняет показатели качества (строки без счетчиков создаются со счетчиками
+анализа, они считаются по тем же завершенным попыткам).
+"""
+import logging
+import os
+import sys
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+import numpy as np
+from sqlalchemy import func, select, update
+
+from database import SessionLocal, dialect_insert, engine
+from models import (
+    Answer,
+    AnswerOptionStats,
+    Base,
+    Question,
+    QuestionStats,
+    TestAttempt,
+    UserAnswer,
+)
+
+# Настройка логирования
+log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+os.makedirs(log_dir, exist_ok=True)
+log_file = os.path.join(log_dir, "item_analysis.log")
+
+logger = logging.getLogger("item_analysis")
+logger.setLevel(logging.INFO)
+handler = RotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024, backupCount=5)
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Размер порции строк, читаемых из БД за раз
+CHUNK_SIZE = int(os.getenv("ITEM_ANALYSIS_CHUNK_SIZE", "50000"))
+
+# Размер пакета при записи результатов
+WRITE_BATCH_SIZE = 1000
+
+
+class ItemAccumulator:
+    """Накопитель сумм по вопросам и вариантам ответов, индексированных по ID"""
+
+    def __init__(self, max_question_id, max_answer_id):
+        q_size = max_question_id + 1
+        a_size = max_answer_id + 1
+        # Все ответы: количество и число правильных
+        self.responses = np.zeros(q_size)
+        self.correct = np.zeros(q_size)
+        # Ответы с определенным остаточным результатом (для корреляции)
+        self.n = np.zeros(q_size)
+        self.sum_x = np.zeros(q_size)
+        self.sum_y = np.zeros(q_size)
+        self.sum_yy = np.zeros(q_size)
+        self.sum_xy = np.zeros(q_size)
+        # Варианты ответов: число выборов и сумма результатов выбравших
+        self.selected = np.zeros(a_size)
+        self.selected_score = np.zeros(a_size)
+
+    def add_chunk(self, rows):
+        """Добавляет порцию строк (question_id, answer_id, is_correct, score, max_score)"""
+        data = np.array(rows, dtype=float)
+        question_ids = data[:, 0].astype(np.int64)
+        answer_ids = data[:, 1].astype(np.int64)
+        x = data[:, 2]
+        score = data[:, 3]
+        max_score = data[:, 4]
+
+        q_size = self.responses.size
+        self.responses += np.bincount(question_ids, minlength=q_size)
+        self.correct += np.bincount(question_ids, weights=x, minlength=q_size)
+
+        total = score / max_score
+        a_size = self.selected.size
+        self.selected += np.bincount(answer_ids, minlength=a_size)
+        self.selected_score += np.bincount(answer_ids, weights=total, minlength=a_size)
+
+        # Остаточный результат: доля правильных ответов без учета самого вопроса
+        has_rest = max_score > 1
+        rest_ids = question_ids[has_rest]
+        rest_x = x[has_rest]
+        rest_y = (score[has_rest] - rest_x) / (max_score[has_rest] - 1)
+
+        self.n += np.bincount(rest_ids, minlength=q_size)
+        self.sum_x += np.bincount(rest_ids, weights=rest_x, minlength=q_size)
+        self.sum_y += np.bincount(rest_ids, weights=rest_y, minlength=q_size)
+        self.sum_yy += np.bincount(rest_ids, weights=rest_y * rest_y, minlength=q_size)
+        self.sum_xy += np.bincount(rest_ids, weights=rest_x * rest_y, minlength=q_size)
+
+    def discrimination(self):
+        """Точечно-бисериальная корреляция; x бинарный, поэтому sum(x^2) = sum(x)"""
+        n = self.n
+        with np.errstate(invalid="ignore", divide="ignore"):
+            numerator = n * self.sum_xy - self.sum_x * self.sum_y
+            denominator = np.sqrt((n * self.sum_x - self.sum_x ** 2) * (n * self.sum_yy - self.sum_y ** 2))
+            return numerator / denominator
+
+
+def _optional(value):
+    """Преобразует NaN/inf в None для записи в БД"""
+    return float(value) if np.isfinite(value) else None
+
+
+def _upsert(db, model, key, rows, columns):
+    """Вставляет строки пакетами; у существующих строк обновляются только columns"""
+    for start in range(0, len(rows), WRITE_BATCH_SIZE):
+        stmt = dialect_insert(model.__table__).values(rows[start:start + WRITE_BATCH_SIZE])
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[key],
+            set_={column: stmt.excluded[column] for column in columns}
+        ))
+
+
+def stream_responses(db, max_question_id, max_answer_id, chunk_size=CHUNK_SIZE):
+    """
+    Потоково отдает ответы завершенных попыток порциями по chunk_size строк.
+
+    Ответы на вопросы и варианты, созданные после начала анализа (ID больше
+    max_question_id / max_answer_id), не читаются: под них нет места в накопителе.
+    """
+    stmt = select(
+        UserAnswer.question_id,
+        UserAnswer.answer_id,
+        UserAnswer.is_correct,
+        TestAttempt.score,
+        TestAttempt.max_score
+    ).join(
+        TestAttempt, UserAnswer.test_attempt_id == TestAttempt.id
+    ).where(
+        TestAttempt.end_time.is_not(None),
+        TestAttempt.max_score > 0,
+        UserAnswer.question_id.is_not(None),
+        UserAnswer.answer_id.is_not(None),
+        UserAnswer.question_id <= max_question_id,
+        UserAnswer.answer_id <= max_answer_id
+    ).execution_options(yield_per=chunk_size)
+
+    for partition in db.execute(stmt).partitions():
+        yield [
+            (question_id, answer_id, 1 if is_correct else 0, score or 0, max_score)
+            for question_id, answer_id, is_correct, score, max_score in partition
+        ]
+
+
+def run_item_analysis(chunk_size=CHUNK_SIZE):
+    """Выполняет анализ и перезаписывает показатели качества в question_stats и answer_option_stats"""
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        # Ответы могут ссылаться на уже удаленные вопросы, поэтому учитываем оба максимума.
+        # Границы ID фиксируются до чтения: строки, созданные во время анализа, не учитываются
+        max_question_id = max(
+            db.query(func.max(Question.id)).scalar() or 0,
+            db.query(func.max(UserAnswer.question_id)).scalar() or 0
+        )
+        max_answer_id = max(
+            db.query(func.max(Answer.id)).scalar() or 0,
+            db.query(func.max(UserAnswer.answer_id)).scalar() or 0
+        )
+        accumulator = ItemAccumulator(max_question_id, max_answer_id)
+
+        rows_processed = 0
+        for chunk in stream_responses(db, max_question_id, max_answer_id, chunk_size):
+            accumulator.add_chunk(chunk)
+            rows_processed += len(chunk)
+            logger.info(f"Обработано строк: {rows_processed}")
+
+        discrimination = accumulator.discrimination()
+        computed_at = datetime.utcnow()
+
+        # Банк вариантов ответа нужен, чтобы учесть и варианты, которые никто не выбирал
+        # (в тех же границах ID, что и ответы: новые варианты в накопителе не учтены)
+        answers = db.query(Answer.id, Answer.question_id, Answer.is_correct).filter(
+            Answer.id <= max_answer_id,
+            Answer.question_id <= max_question_id
+        ).all()
+        weakest_distractor = {}
+        answer_rows = []
+        for answer_id, question_id, is_correct in answers:
+            responses = accumulator.responses[question_id]
+            if not responses:
+                continue
+            selected = accumulator.selected[answer_id]
+            rate = selected / responses
+            if not is_correct:
+                weakest_distractor[question_id] = min(weakest_distractor.get(question_id, rate), rate)
+            # Невыбранные варианты в answer_option_stats не хранятся
+            if selected:
+                answer_rows.append({
+                    "answer_id": answer_id,
+                    "question_id": question_id,
+                    "selected": int(selected),
+                    "mean_score": float(accumulator.selected_score[answer_id] / selected)
+                })
+
+        question_ids = np.nonzero(accumulator.responses)[0]
+        # Вопросы могли быть удалены после ответа - пишем только существующие
+        existing_ids = {question_id for (question_id,) in db.query(Question.id)}
+        question_rows = [
+            {
+                "question_id": int(question_id),
+                "answered": int(accumulator.responses[question_id]),
+                "correct": int(accumulator.correct[question_id]),
+                "discrimination": _optional(discrimination[question_id]),
+                "weakest_distractor_rate": weakest_distractor.get(int(question_id)),
+                "item_computed_at": computed_at
+            }
+            for question_id in question_ids
+            if int(question_id) in existing_ids
+        ]
+        answer_rows = [row for row in answer_rows if row["question_id"] in existing_ids]
+
+        # Перезаписываем показатели одной транзакцией; счетчики refresh_analytics не меняются
+        db.execute(update(QuestionStats).values(
+            discrimination=None, weakest_distractor_rate=None, item_computed_at=None
+        ))
+        db.execute(update(AnswerOptionStats).values(mean_score=None))
+        _upsert(db, QuestionStats, "question_id", question_rows,
+                ["discrimination", "weakest_distractor_rate", "item_computed_at"])
+        _upsert(db, AnswerOptionStats, "answer_id", answer_rows, ["mean_score"])
+        db.commit()
+
+        logger.info(
+            f"Анализ завершен: {rows_processed} ответов, "
+            f"{len(question_rows)} вопросов, {len(answer_rows)} вариантов ответа"
+        )
+        return len(question_rows)
+
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Ошибка при анализе вопросов: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    # Можно указать размер порции: python item_analysis.py [chunk_size]
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else CHUNK_SIZE
+    analyzed = run_item_analysis(size)
+    print(f"Проанализировано вопросов: {analyzed}")
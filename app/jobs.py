@@ -0,0 +1,376 @@
+"""
+Фоновые задачи для долгих операций админки.
+
+Задача сохраняется в таблице background_jobs и выполняется в фоновом потоке
+воркера приложения, а не внутри HTTP-запроса. Задачу забирает воркер, который
+первым сменит ее статус pending -> running условным UPDATE, поэтому при
+нескольких воркерах она выполняется один раз.
+
+Работа идет порциями: каждая порция - отдельная транзакция, поэтому блокировки
+держатся недолго, а прогресс сохраняется. Отмена срабатывает только между
+пакетами вопросов: пакет удаляется целиком, даже если его ответы пользователей
+удаляются несколькими транзакциями. Задача упавшего воркера через
+JOB_STALE_SECONDS без отметки о работе снова забирается и продолжается
+(обработчики можно запускать повторно).
+
+После удаления ответов пользователей баллы попыток пересчитываются в той же
+транзакции, а статистика затронутых пользователей - по завершении задачи.
+"""
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from invalidation import publish
+from models import (
+    Answer,
+    BackgroundJob,
+    Question,
+    TestAttempt,
+    User,
+    UserAnswer,
+    topic_questions,
+)
+from stats import rebuild_user_stats
+
+logger = logging.getLogger("jobs")
+
+JOBS_ENABLED = os.getenv("JOBS_ENABLED", "1") == "1"
+# Строк в одной транзакции при удалении ответов пользователей
+JOB_CHUNK_SIZE = int(os.getenv("JOB_CHUNK_SIZE", "1000"))
+# Вопросов (вместе с вариантами ответов) в одной транзакции
+JOB_QUESTION_BATCH = int(os.getenv("JOB_QUESTION_BATCH", "100"))
+# Как часто воркер проверяет очередь, если его не разбудили
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "300"))
+
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATUSES = (PENDING, RUNNING)
+
+_handlers = {}
+_wakeup = threading.Event()
+_stop = threading.Event()
+_runner = None
+
+
+class JobCancelled(Exception):
+    """Задачу отменили: обработчик прерывается на ближайшей границе пакета"""
+
+
+class JobContext:
+    """Сессия, параметры и прогресс задачи для обработчика"""
+
+    def __init__(self, db: Session, job: BackgroundJob):
+        self.db = db
+        self.job = job
+        self.params = job.params or {}
+
+    def set_total(self, total: int):
+        self.job.total = total
+        self.checkpoint()
+
+    def add_result(self, **counts):
+        """Прибавляет счетчики к итогам задачи"""
+        result = dict(self.job.result or {})
+        for key, value in counts.items():
+            result[key] = result.get(key, 0) + value
+        # JSON-колонка отслеживается только при присваивании нового объекта
+        self.job.result = result
+
+    def add_stats_users(self, user_ids):
+        """Запоминает пользователей, чью статистику нужно пересчитать по завершении задачи"""
+        known = set(self.params.get("stats_user_ids", []))
+        if not set(user_ids) - known:
+            return
+        self.params = {**self.params, "stats_user_ids": sorted(known | set(user_ids))}
+        self.job.params = self.params
+
+    def advance(self, count: int):
+        self.job.processed = (self.job.processed or 0) + count
+        self.checkpoint()
+
+    def save(self):
+        """Фиксирует порцию вместе с прогрессом, не проверяя отмену"""
+        self.job.heartbeat_at = datetime.utcnow()
+        self.db.commit()
+
+    def checkpoint(self):
+        """Фиксирует порцию вместе с прогрессом и проверяет, не отменена ли задача"""
+        self.save()
+        # После commit атрибуты перечитываются из БД: отмену видно из другого воркера
+        if self.job.cancel_requested:
+            raise JobCancelled()
+
+
+def job_handler(kind: str):
+    """Регистрирует обработчик задач типа kind: handler(ctx: JobContext)"""
+    def register(handler):
+        _handlers[kind] = handler
+        return handler
+    return register
+
+
+def _delete_question_batch(ctx: JobContext, question_ids):
+    """
+    Удаляет вопросы со всеми связанными строками; ответы пользователей - порциями.
+
+    Отмена проверяется только после удаления самих вопросов, чтобы не оставлять
+    вопросы с частично удаленной историей ответов.
+    """
+    db = ctx.db
+    while True:
+        rows = db.execute(
+            select(UserAnswer.id, UserAnswer.test_attempt_id, TestAttempt.user_id)
+            .join(TestAttempt, UserAnswer.test_attempt_id == TestAttempt.id, isouter=True)
+            .where(UserAnswer.question_id.in_(question_ids))
+            .limit(JOB_CHUNK_SIZE)
+        ).all()
+        if not rows:
+            break
+        db.execute(
+            delete(UserAnswer).where(UserAnswer.id.in_([row.id for row in rows])),
+            execution_options={"synchronize_session": False}
+        )
+        _recount_scores(db, {row.test_attempt_id for row in rows if row.test_attempt_id is not None})
+        ctx.add_stats_users({row.user_id for row in rows if row.user_id is not None})
+        ctx.add_result(user_answers=len(rows))
+        ctx.save()
+
+    answers = db.execute(
+        delete(Answer).where(Answer.question_id.in_(question_ids)),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    db.execute(delete(topic_questions).where(topic_questions.c.question_id.in_(question_ids)))
+    questions = db.execute(
+        delete(Question).where(Question.id.in_(question_ids)),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    ctx.add_result(questions=questions, answers=answers)
+    ctx.advance(len(question_ids))
+    # Удаленные вопросы не должны попадать в тесты, пока задача еще идет
+    publish("question")
+
+
+def _recount_scores(db: Session, attempt_ids):
+    """Пересчитывает баллы завершенных попыток по оставшимся ответам"""
+    if not attempt_ids:
+        return
+    score = select(func.count(UserAnswer.id)).where(
+        UserAnswer.test_attempt_id == TestAttempt.id,
+        UserAnswer.is_correct.is_(True)
+    ).scalar_subquery()
+    db.execute(
+        update(TestAttempt)
+        .where(TestAttempt.id.in_(attempt_ids), TestAttempt.end_time.is_not(None))
+        .values(score=score),
+        execution_options={"synchronize_session": False}
+    )
+
+
+def _rebuild_stats(db: Session, job: BackgroundJob):
+    """Пересчитывает статистику пользователей, чьи ответы удалила задача"""
+    user_ids = (job.params or {}).get("stats_user_ids", [])
+    for user_id in user_ids:
+        rebuild_user_stats(db, user_id)
+    if user_ids:
+        logger.info("Job %s: rebuilt stats for %s users", job.id, len(user_ids))
+
+
+@job_handler("delete_questions")
+def delete_questions(ctx: JobContext):
+    """Удаление вопросов по списку: params = {"question_ids": [...]}"""
+    question_ids = sorted({int(question_id) for question_id in ctx.params.get("question_ids", [])})
+    if ctx.job.total is None:
+        ctx.set_total(len(question_ids))
+    for start in range(0, len(question_ids), JOB_QUESTION_BATCH):
+        # При повторном запуске уже удаленные вопросы пропускаются
+        existing = ctx.db.scalars(
+            select(Question.id).where(Question.id.in_(question_ids[start:start + JOB_QUESTION_BATCH]))
+        ).all()
+        if existing:
+            _delete_question_batch(ctx, existing)
+
+
+@job_handler("delete_category_questions")
+def delete_category_questions(ctx: JobContext):
+    """Удаление всех вопросов категории: params = {"category": ..., "exam_type": ... или None}"""
+    query = select(Question.id).where(Question.category == ctx.params["category"])
+    if ctx.params.get("exam_type"):
+        query = query.where(Question.exam_type == ctx.params["exam_type"])
+    if ctx.job.total is None:
+        ctx.set_total(ctx.db.scalar(select(func.count()).select_from(query.subquery())))
+    while True:
+        question_ids = ctx.db.scalars(query.order_by(Question.id).limit(JOB_QUESTION_BATCH)).all()
+        if not question_ids:
+            break
+        _delete_question_batch(ctx, question_ids)
+
+
+def submit(db: Session, kind: str, params: dict, user: User = None) -> BackgroundJob:
+    """Ставит задачу в очередь и будит фоновый поток"""
+    if kind not in _handlers:
+        raise ValueError(f"Неизвестный тип задачи: {kind}")
+    job = BackgroundJob(kind=kind, params=params, status=PENDING, created_by=user.id if user else None)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    logger.info("Job %s (%s) submitted by %s", job.id, kind, user.email if user else None)
+    _wakeup.set()
+    return job
+
+
+def request_cancel(db: Session, job_id: int) -> bool:
+    """Отменяет ожидающую задачу сразу, выполняющуюся - на ближайшей порции"""
+    now = datetime.utcnow()
+    cancelled = db.execute(
+        update(BackgroundJob)
+        .where(BackgroundJob.id == job_id, BackgroundJob.status == PENDING)
+        .values(status=CANCELLED, finished_at=now)
+    ).rowcount
+    if not cancelled:
+        cancelled = db.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job_id, BackgroundJob.status == RUNNING)
+            .values(cancel_requested=True)
+        ).rowcount
+    db.commit()
+    return bool(cancelled)
+
+
+def job_to_dict(job: BackgroundJob) -> dict:
+    percentage = None
+    if job.status == COMPLETED:
+        percentage = 100.0
+    elif job.total:
+        percentage = round(min(job.processed or 0, job.total) / job.total * 100, 1)
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "params": job.params,
+        "total": job.total,
+        "processed": job.processed or 0,
+        "percentage": percentage,
+        "result": job.result or {},
+        "error": job.error,
+        "cancel_requested": bool(job.cancel_requested),
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+def get_recent_jobs(db: Session, limit: int = 50):
+    return db.query(BackgroundJob).order_by(BackgroundJob.id.desc()).limit(limit).all()
+
+
+def _claimable(now: datetime):
+    """Ожидающие задачи и задачи, воркер которых перестал отмечаться"""
+    stale_before = now - timedelta(seconds=JOB_STALE_SECONDS)
+    return or_(
+        BackgroundJob.status == PENDING,
+        and_(BackgroundJob.status == RUNNING, BackgroundJob.heartbeat_at < stale_before)
+    )
+
+
+def _claim(db: Session):
+    """Забирает одну задачу; условный UPDATE не дает двум воркерам взять одну и ту же"""
+    now = datetime.utcnow()
+    candidates = db.scalars(
+        select(BackgroundJob.id).where(_claimable(now)).order_by(BackgroundJob.id).limit(5)
+    ).all()
+    for job_id in candidates:
+        claimed = db.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job_id, _claimable(now))
+            .values(status=RUNNING, started_at=func.coalesce(BackgroundJob.started_at, now), heartbeat_at=now)
+        ).rowcount
+        db.commit()
+        if claimed:
+            return db.get(BackgroundJob, job_id)
+    return None
+
+
+def execute(db: Session, job: BackgroundJob):
+    """Выполняет забранную задачу и сохраняет итоговый статус"""
+    logger.info("Job %s (%s) started", job.id, job.kind)
+    try:
+        handler = _handlers.get(job.kind)
+        if handler is None:
+            raise ValueError(f"Неизвестный тип задачи: {job.kind}")
+        handler(JobContext(db, job))
+        status = COMPLETED
+    except JobCancelled:
+        db.rollback()
+        status = CANCELLED
+    except Exception as e:
+        db.rollback()
+        logger.exception("Job %s (%s) failed", job.id, job.kind)
+        job.error = str(e)
+        status = FAILED
+
+    # Удаленные ответы уже зафиксированы при любом исходе задачи
+    try:
+        _rebuild_stats(db, job)
+    except Exception as e:
+        db.rollback()
+        logger.exception("Job %s (%s): stats rebuild failed", job.id, job.kind)
+        job.error = job.error or f"Ошибка пересчета статистики: {e}"
+        status = FAILED
+
+    job.status = status
+    job.finished_at = datetime.utcnow()
+    db.commit()
+    logger.info("Job %s (%s) %s: processed %s of %s", job.id, job.kind, status, job.processed, job.total)
+
+
+def run_pending():
+    """Выполняет задачи из очереди, пока они есть; возвращает число выполненных"""
+    count = 0
+    while not _stop.is_set():
+        db = SessionLocal()
+        try:
+            job = _claim(db)
+            if job is None:
+                return count
+            execute(db, job)
+            count += 1
+        finally:
+            db.close()
+    return count
+
+
+def _run():
+    while not _stop.is_set():
+        try:
+            run_pending()
+        except Exception as e:
+            logger.warning("Job runner error: %s", e)
+        _wakeup.wait(JOB_POLL_SECONDS)
+        _wakeup.clear()
+
+
+def start():
+    """Запускает фоновый поток выполнения задач"""
+    global _runner
+    if not JOBS_ENABLED:
+        logger.info("Background jobs are disabled in this worker")
+        return
+    if _runner is not None and _runner.is_alive():
+        return
+    _stop.clear()
+    _runner = threading.Thread(target=_run, name="background-jobs", daemon=True)
+    _runner.start()
+
+
+def stop():
+    _stop.set()
+    _wakeup.set()
@@ -1,10 +1,76 @@
+import atexit
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Формат записей: "text" (по умолчанию) или "json"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+# Доля сохраняемых высокочастотных INFO-записей (помеченных extra={"sample": True})
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
+# Стандартные атрибуты LogRecord, которые не попадают в поля JSON
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sample"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись в одну строку JSON; поля из extra добавляются как есть"""
+
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю rate записей, помеченных extra={"sample": True}"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if self.rate >= 1 or not getattr(record, "sample", False) or record.levelno > logging.INFO:
+            return True
+        return random.random() < self.rate
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Кладет запись в очередь без форматирования.
+
+    Сообщение собирается из шаблона и аргументов уже в потоке QueueListener,
+    поэтому на пути обработки запроса остается только помещение в очередь.
+    """
+
+    def prepare(self, record):
+        return record
 
 
 def setup_logger():
     """Configure application logging"""
+    global _listener
+
+    logger = logging.getLogger()
+    # Повторный вызов (например, при повторном импорте) не добавляет обработчики
+    if _listener is not None:
+        return logger
+
     # Create logs directory if it doesn't exist
     logs_dir = os.path.join(os.path.dirname(__file__), "logs")
     os.makedirs(logs_dir, exist_ok=True)
@@ -20,21 +86,24 @@ def setup_logger():
         logs_dir = "."
 
     # Configure root logger
-    logger = logging.getLogger()
     logger.setLevel(logging.INFO)
 
     # Log format
-    log_format = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
+    if LOG_FORMAT == "json":
+        log_format = JsonFormatter()
+    else:
+        log_format = logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+        )
 
     # Console handler
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(log_format)
-    logger.addHandler(console_handler)
+    handlers = [console_handler]
 
     # File handler with rotation
     log_file = os.path.join(logs_dir, "app.log")
+    file_error = None
     try:
         file_handler = RotatingFileHandler(
             log_file,
@@ -42,8 +111,22 @@ def setup_logger():
             backupCount=10,
         )
         file_handler.setFormatter(log_format)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
     except (PermissionError, IOError) as e:
-        logger.warning(f"Could not create log file: {e}. Logging to console only.")
+        file_error = e
+
+    # Handlers write (and rotate) in the listener thread, never on the request path
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+    logger.addHandler(queue_handler)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Дописываем оставшиеся в очереди записи при завершении процесса
+    atexit.register(_listener.stop)
+
+    if file_error:
+        logger.warning("Could not create log file: %s. Logging to console only.", file_error)
 
     return logger
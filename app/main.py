@@ -1,16 +1,21 @@
-import time
-
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-
-from database import engine
+from fastapi.responses import ORJSONResponse, Response
+
+import db_metrics
+import invalidation
+import jobs
+import metrics
+import warmup
+from assets import AssetStaticFiles
+from compression import CompressionMiddleware
+from database import all_engines, engine
 from logger import setup_logger
+from middleware import RequestMiddleware
 from models import Base
-from routers import admin, auth, questions, theory
+from routers import admin, auth, health, questions, theory
 from routers.auth import AuthService
+from templating import templates
 
 # Setup logging
 logger = setup_logger()
@@ -18,13 +23,18 @@ logger = setup_logger()
 # Создаем таблицы в базе данных
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="CLI-Flow")
+# Подсчет запросов к БД для каждого HTTP-запроса (основная БД и реплики)
+for database_engine in all_engines:
+    db_metrics.install(database_engine)
+    metrics.install_pool_metrics(database_engine)
+
+app = FastAPI(title="CLI-Flow", default_response_class=ORJSONResponse)
 
 # Подключаем статические файлы
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", AssetStaticFiles(directory="static"), name="static")
 
-# Настраиваем шаблоны
-templates = Jinja2Templates(directory="templates")
+# Сжатие HTML и JSON (внутренний слой: заголовки остальных middleware не сжимаются)
+app.add_middleware(CompressionMiddleware)
 
 # Add CORS middleware
 app.add_middleware(
@@ -36,86 +46,44 @@ app.add_middleware(
 )
 
 
-# Add request logging middleware
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = time.time()
+# Авторизация, логирование и метрики запросов одним ASGI-слоем
+app.add_middleware(RequestMiddleware)
 
-    # Get client IP
-    forwarded_for = request.headers.get("X-Forwarded-For")
-    client_ip = forwarded_for.split(",")[0] if forwarded_for else request.client.host
 
-    # Log request details
-    logger.info(
-        f"Request started: {request.method} {request.url.path} from {client_ip}"
-    )
+# Подключаем роутеры
+app.include_router(questions.router)
+app.include_router(auth.router)
+app.include_router(admin.router)
+app.include_router(theory.router)
+app.include_router(health.router)
 
-    response = await call_next(request)
 
-    # Calculate request processing time
-    process_time = time.time() - start_time
+@app.on_event("startup")
+def start_warmup():
+    """Прогреваем шаблоны и кэши данных до того, как воркер станет готов"""
+    warmup.start()
 
-    # Log response details
-    logger.info(
-        f"Request completed: {request.method} {request.url.path} "
-        f"status={response.status_code} duration={process_time:.3f}s"
-    )
 
-    return response
-
-
-# Middleware для проверки авторизации
-@app.middleware("http")
-async def auth_middleware(request: Request, call_next):
-    # Список публичных путей, не требующих авторизации
-    public_paths = [
-        "/login",
-        "/register",
-        "/auth/login",
-        "/auth/register",
-        "/static",
-        "/health",
-        "/docs",
-        "/openapi.json",
-        "/redoc",
-        "/theory"
-    ]
-
-    # Проверяем, является ли текущий путь публичным
-    current_path = request.url.path
-    is_public_path = False
-    for path in public_paths:
-        if current_path == path or current_path.startswith(path + "/"):
-            is_public_path = True
-            break
-
-    # Если путь публичный, пропускаем проверку
-    if is_public_path:
-        return await call_next(request)
-
-    # Проверяем наличие токена авторизации
-    auth_token = request.cookies.get("access_token")
-    if not auth_token:
-        logger.warning(f"Unauthorized access attempt to {current_path} from {request.client.host}")
-        return RedirectResponse(url="/login")
+@app.on_event("startup")
+def start_invalidation_listener():
+    """Слушаем сброс кэшей от других воркеров"""
+    invalidation.start_listener()
 
-    # Проверяем валидность токена
-    payload = AuthService.decode_access_token(auth_token)
-    if not payload or "sub" not in payload:
-        logger.warning(f"Invalid token access attempt to {current_path} from {request.client.host}")
-        response = RedirectResponse(url="/login")
-        response.delete_cookie(key="access_token")
-        return response
 
-    # Если всё в порядке, продолжаем обработку запроса
-    return await call_next(request)
+@app.on_event("startup")
+def start_job_runner():
+    """Выполняем фоновые задачи админки (массовое удаление вопросов)"""
+    jobs.start()
 
 
-# Подключаем роутеры
-app.include_router(questions.router)
-app.include_router(auth.router)
-app.include_router(admin.router)
-app.include_router(theory.router)
+@app.on_event("shutdown")
+def stop_invalidation_listener():
+    invalidation.stop_listener()
+
+
+@app.on_event("shutdown")
+def stop_job_runner():
+    jobs.stop()
 
 
 @app.get("/")
@@ -126,7 +94,7 @@ async def home(request: Request):
     auth_token = request.cookies.get("access_token")
 
     if auth_token:
-        payload = AuthService.decode_access_token(auth_token)
+        payload = AuthService.get_token_payload(request, auth_token)
         if payload and "sub" in payload:
             # Передаем email пользователя в шаблон
             user = {"email": payload["sub"]}
@@ -153,7 +121,8 @@ async def register_page(request: Request):
     return templates.TemplateResponse("register.html", {"request": request, "title": "Регистрация"})
 
 
-@app.get("/health")
-async def health_check():
-    """Проверка работоспособности API"""
-    return {"status": "ok"}
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Метрики в формате Prometheus"""
+    data, content_type = metrics.render_latest()
+    return Response(content=data, media_type=content_type)
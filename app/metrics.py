@@ -0,0 +1,149 @@
+"""
+Метрики Prometheus.
+
+При нескольких воркерах задайте PROMETHEUS_MULTIPROC_DIR (пустой каталог,
+очищаемый при старте): каждый процесс пишет значения в общий каталог,
+а /metrics собирает их через MultiProcessCollector.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+# Метка маршрута для запросов, не совпавших ни с одним маршрутом
+UNMATCHED_ROUTE = "unmatched"
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "Количество HTTP-запросов",
+    ["method", "route", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Длительность обработки HTTP-запросов",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Запросы в обработке",
+    multiprocess_mode="livesum"
+)
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Соединения, выданные из пула",
+    multiprocess_mode="livesum"
+)
+DB_POOL_CONNECTIONS = Counter(
+    "db_pool_connections_created_total",
+    "Новые соединения с БД, открытые пулом"
+)
+DB_POOL_CHECKOUTS = Counter(
+    "db_pool_checkouts_total",
+    "Выдачи соединений из пула"
+)
+
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Обращения к кэшу приложения",
+    ["namespace", "result"]
+)
+
+PASSWORD_HASHING = Histogram(
+    "auth_password_seconds",
+    "Время хеширования и проверки пароля bcrypt",
+    ["operation"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 2, 5)
+)
+LOGINS = Counter(
+    "auth_logins_total",
+    "Попытки входа",
+    ["result"]
+)
+
+TESTS_STARTED = Counter(
+    "exam_tests_started_total",
+    "Начатые тесты",
+    ["exam_type"]
+)
+TESTS_SUBMITTED = Counter(
+    "exam_tests_submitted_total",
+    "Отправленные тесты",
+    ["exam_type"]
+)
+QUESTIONS_PER_TEST = Histogram(
+    "exam_questions_per_test",
+    "Количество вопросов в выданном тесте (среднее = sum / count)",
+    ["exam_type"],
+    buckets=(5, 10, 20, 40, 60, 100, 200, 500)
+)
+
+# Кэш соответствия endpoint -> шаблон пути маршрута
+_route_templates = {}
+
+
+def route_template(app, scope) -> str:
+    """Шаблон пути маршрута (например, /questions/attempts/{attempt_id}) для метки"""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return UNMATCHED_ROUTE
+    if not _route_templates:
+        for route in app.routes:
+            target = getattr(route, "endpoint", None) or getattr(route, "app", None)
+            _route_templates.setdefault(target, route.path)
+    return _route_templates.get(endpoint, UNMATCHED_ROUTE)
+
+
+@contextmanager
+def time_password(operation: str):
+    """Измеряет время операции с паролем"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        PASSWORD_HASHING.labels(operation).observe(time.perf_counter() - start)
+
+
+def _on_connect(dbapi_connection, connection_record):
+    DB_POOL_CONNECTIONS.inc()
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    DB_POOL_CHECKOUTS.inc()
+    DB_POOL_CHECKED_OUT.inc()
+
+
+def _on_checkin(dbapi_connection, connection_record):
+    DB_POOL_CHECKED_OUT.dec()
+
+
+def install_pool_metrics(engine):
+    """Подключает счетчики пула соединений к движку"""
+    if not event.contains(engine, "checkout", _on_checkout):
+        event.listen(engine, "connect", _on_connect)
+        event.listen(engine, "checkout", _on_checkout)
+        event.listen(engine, "checkin", _on_checkin)
+
+
+def render_latest():
+    """Текст метрик и Content-Type для ответа /metrics"""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,161 @@
+"""
+ASGI-middleware обработки запросов.
+
+Один слой вместо нескольких @app.middleware("http"): проверка авторизации,
+журнал запросов, метрики Prometheus, статистика БД и отладочная трассировка.
+В отличие от BaseHTTPMiddleware здесь нет отдельной задачи и потока тела
+ответа на каждый запрос, поэтому накладные расходы минимальны, в том числе для /static.
+"""
+import logging
+import re
+import time
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import cookie_parser
+from starlette.responses import RedirectResponse
+
+import database
+import db_metrics
+import debug_trace
+import metrics
+from routers.auth import AuthService
+
+logger = logging.getLogger()
+
+# Пути, не требующие авторизации (вместе со всеми вложенными путями)
+PUBLIC_PATHS = (
+    "/login",
+    "/register",
+    "/auth/login",
+    "/auth/register",
+    "/static",
+    "/health",
+    "/metrics",
+    "/docs",
+    "/openapi.json",
+    "/redoc",
+    "/theory",
+)
+
+
+def compile_prefix_matcher(prefixes):
+    """Одно регулярное выражение: путь равен префиксу или начинается с префикс + "/" """
+    pattern = "|".join(re.escape(prefix) for prefix in sorted(prefixes, key=len, reverse=True))
+    return re.compile(f"(?:{pattern})(?:/|$)").match
+
+
+class RequestMiddleware:
+    """
+    Авторизация, логирование, метрики и статистика БД для HTTP-запросов.
+
+    Проверенная полезная нагрузка токена сохраняется в request.state
+    (auth_token, auth_payload), чтобы зависимости не декодировали JWT повторно.
+    """
+
+    def __init__(self, app, public_paths=PUBLIC_PATHS):
+        self.app = app
+        self.is_public = compile_prefix_matcher(public_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        method = scope["method"]
+        path = scope["path"]
+        headers = Headers(scope=scope)
+        cookies = cookie_parser(headers.get("cookie", ""))
+
+        # Get client IP
+        forwarded_for = headers.get("x-forwarded-for")
+        client = scope.get("client")
+        client_ip = forwarded_for.split(",")[0] if forwarded_for else (client[0] if client else "unknown")
+
+        # Проверка авторизации до любой другой работы
+        if not self.is_public(path):
+            token = cookies.get("access_token")
+            if not token:
+                logger.warning("Unauthorized access attempt to %s from %s", path, client_ip)
+                await self.redirect_to_login(scope, receive, send, method)
+                return
+            payload = AuthService.decode_access_token(token)
+            if not payload or "sub" not in payload:
+                logger.warning("Invalid token access attempt to %s from %s", path, client_ip)
+                await self.redirect_to_login(scope, receive, send, method, clear_token=True)
+                return
+            state = scope.setdefault("state", {})
+            state["auth_token"] = token
+            state["auth_payload"] = payload
+
+        logger.info("Request started: %s %s from %s", method, path, client_ip, extra={"sample": True})
+
+        metrics.IN_FLIGHT.inc()
+        db_stats, db_stats_token = db_metrics.start_request()
+        scope.setdefault("state", {})["db_stats"] = db_stats
+        # Debug trace: only for sampled requests or admin/trusted requests with X-Debug-Trace: 1
+        request_trace, trace_token = debug_trace.start_request(
+            headers, client[0] if client else None, scope["state"].get("auth_payload")
+        )
+        # Read replicas: reads stick to the primary for a while after the user's write
+        db_routing, routing_token = database.start_request(cookies)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_headers = MutableHeaders(scope=message)
+                response_headers["X-DB-Queries"] = str(db_stats.queries)
+                response_headers["Server-Timing"] = db_stats.server_timing(time.perf_counter() - start_time)
+                if request_trace is not None:
+                    response_headers["X-Trace-Id"] = request_trace.trace_id
+                if db_routing.wrote and database.replica_engines and database.READ_YOUR_WRITES_SECONDS > 0:
+                    value, max_age = database.primary_cookie()
+                    response_headers.append(
+                        "set-cookie",
+                        f"{database.PRIMARY_COOKIE}={value}; Max-Age={max_age}; Path=/; HttpOnly; SameSite=lax"
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            db_metrics.finish_request(db_stats_token)
+            database.finish_request(routing_token)
+            debug_trace.finish_request(request_trace, trace_token, method, path, status_code)
+            process_time = time.perf_counter() - start_time
+            metrics.IN_FLIGHT.dec()
+            # Label by route template, not raw path, to keep cardinality bounded
+            route = metrics.route_template(scope["app"], scope)
+            metrics.REQUESTS.labels(method, route, str(status_code)).inc()
+            metrics.REQUEST_LATENCY.labels(method, route).observe(process_time)
+            self.log_completed(method, path, status_code, process_time, db_stats)
+
+    @staticmethod
+    async def redirect_to_login(scope, receive, send, method, clear_token=False):
+        response = RedirectResponse(url="/login")
+        if clear_token:
+            response.delete_cookie(key="access_token")
+        await response(scope, receive, send)
+        # Counted under one route label: the raw path of an unauthenticated request is unbounded
+        metrics.REQUESTS.labels(method, "unauthenticated", str(response.status_code)).inc()
+
+    @staticmethod
+    def log_completed(method, path, status_code, process_time, db_stats):
+        logger.info(
+            "Request completed: %s %s status=%s duration=%.3fs db_queries=%s db_time=%.3fs",
+            method, path, status_code, process_time, db_stats.queries, db_stats.duration,
+            extra={"sample": True}
+        )
+
+        # Slow or query-heavy requests are logged with SQL fingerprints to spot N+1 patterns
+        if db_stats.is_slow(process_time):
+            fingerprints = "\n".join(
+                f"  {count}x {total * 1000:.1f}ms {statement}"
+                for count, total, statement in db_stats.top_fingerprints()
+            )
+            logger.warning(
+                "Slow request: %s %s duration=%.3fs db_queries=%s db_time=%.3fs\n%s",
+                method, path, process_time, db_stats.queries, db_stats.duration, fingerprints
+            )
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Применяет миграции схемы к существующей базе данных.
+
+Запускается перед стартом приложения (см. docker-compose.yml): create_all
+создает только новые таблицы, а столбцы, индексы и ограничения в уже
+существующих таблицах добавляют скрипты update_*.py. Все шаги можно
+запускать повторно. Скрипты обращаются к information_schema PostgreSQL;
+для SQLite схема целиком создается create_all.
+"""
+import sys
+
+from database import engine
+from models import Base
+from update_question_stats import add_item_columns
+from update_test_attempts import (
+    add_exam_type_column,
+    add_session_columns,
+    create_history_index,
+)
+from update_user_answers import add_unique_constraint
+
+# Шаги по порядку; каждый возвращает True при успехе
+MIGRATIONS = (
+    add_exam_type_column,
+    add_session_columns,
+    create_history_index,
+    add_unique_constraint,
+    add_item_columns,
+)
+
+
+def migrate():
+    """Создает недостающие таблицы и выполняет шаги миграции"""
+    Base.metadata.create_all(bind=engine)
+    if engine.dialect.name != "postgresql":
+        print("Миграции столбцов выполняются только для PostgreSQL.")
+        return True
+
+    for step in MIGRATIONS:
+        if not step():
+            print(f"Миграция остановлена на шаге {step.__name__}.")
+            return False
+    return True
+
+
+if __name__ == "__main__":
+    if not migrate():
+        sys.exit(1)
+    print("Схема базы данных актуальна.")
@@ -1,14 +1,19 @@
 from datetime import datetime
 
 from sqlalchemy import (
+    JSON,
     Boolean,
     Column,
+    Date,
     DateTime,
+    Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     Table,
     Text,
+    UniqueConstraint,
 )
 from sqlalchemy.orm import relationship
 
@@ -47,6 +52,9 @@ class Question(Base):
     # Связь с категорией
     category_relation = relationship("QuestionCategory", back_populates="questions")
 
+    # Статистика ответов и результаты анализа качества вопроса (refresh_analytics и item_analysis.py)
+    item_stats = relationship("QuestionStats", uselist=False, viewonly=True)
+
 
 class User(Base):
     """Модель пользователя системы"""
@@ -58,6 +66,8 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     is_superuser = Column(Boolean, default=False)
     test_attempts = relationship("TestAttempt", back_populates="user")
+    stats = relationship("UserStats", back_populates="user", uselist=False)
+    category_stats = relationship("UserCategoryStats", back_populates="user")
 
 
 class Answer(Base):
@@ -83,6 +93,22 @@ class TestAttempt(Base):
     end_time = Column(DateTime, nullable=True)
     score = Column(Integer, default=0)
     max_score = Column(Integer, default=0)
+    exam_type = Column(String(50), default="rhcsa")  # тип экзамена: rhcsa или cka
+    # Выданные вопросы в порядке показа и параметры, с которыми собран тест
+    question_ids = Column(JSON, nullable=True)
+    filters = Column(JSON, nullable=True)
+
+    # Покрывающий индекс для постраничной истории: страница читается
+    # диапазонным сканированием по (user_id, start_time, id) без обращения к таблице
+    __table_args__ = (
+        Index(
+            "ix_test_attempts_user_history",
+            "user_id",
+            "start_time",
+            "id",
+            postgresql_include=["end_time", "score", "max_score", "exam_type"]
+        ),
+    )
 
     # Связь с пользователем
     user = relationship("User", back_populates="test_attempts")
@@ -100,12 +126,184 @@ class UserAnswer(Base):
     answer_id = Column(Integer, ForeignKey("answers.id"))
     is_correct = Column(Boolean, default=False)
 
+    # Один ответ на вопрос в попытке: автосохранение перезаписывает его через ON CONFLICT
+    __table_args__ = (
+        UniqueConstraint("test_attempt_id", "question_id", name="uq_user_answers_attempt_question"),
+    )
+
     # Связи
     test_attempt = relationship("TestAttempt", back_populates="user_answers")
     question = relationship("Question")
     answer = relationship("Answer")
 
 
+class UserStats(Base):
+    """Модель для агрегированной статистики пользователя по завершенным тестам"""
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    attempts_count = Column(Integer, default=0)
+    total_score = Column(Integer, default=0)
+    total_max_score = Column(Integer, default=0)
+    best_percentage = Column(Float, default=0)
+    percentage_sum = Column(Float, default=0)  # сумма процентов для расчета среднего
+    last_percentage = Column(Float, nullable=True)
+    last_attempt_at = Column(DateTime, nullable=True)
+
+    # Связь с пользователем
+    user = relationship("User", back_populates="stats")
+
+    @property
+    def average_percentage(self):
+        """Средний процент правильных ответов по всем попыткам"""
+        if not self.attempts_count:
+            return 0
+        return self.percentage_sum / self.attempts_count
+
+
+class UserCategoryStats(Base):
+    """Модель для статистики пользователя по категориям вопросов"""
+    __tablename__ = "user_category_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    exam_type = Column(String(50), primary_key=True)
+    category = Column(String(255), primary_key=True)
+    answered = Column(Integer, default=0)
+    correct = Column(Integer, default=0)
+    last_answered_at = Column(DateTime, nullable=True)
+
+    # Связь с пользователем
+    user = relationship("User", back_populates="category_stats")
+
+    @property
+    def accuracy(self):
+        """Процент правильных ответов в категории"""
+        if not self.answered:
+            return 0
+        return self.correct / self.answered * 100
+
+
+class QuestionStats(Base):
+    """
+    Предрассчитанная статистика ответов на вопрос.
+
+    Счетчики обновляет refresh_analytics, показатели качества вопроса -
+    item_analysis.py.
+    """
+    __tablename__ = "question_stats"
+
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+    answered = Column(Integer, default=0)
+    correct = Column(Integer, default=0)
+    discrimination = Column(Float, nullable=True)  # точечно-бисериальная корреляция с остальным результатом
+    weakest_distractor_rate = Column(Float, nullable=True)  # минимальная доля выбора неверного варианта
+    item_computed_at = Column(DateTime, nullable=True)
+
+    # Связь с вопросом
+    question = relationship("Question")
+
+    @property
+    def percent_correct(self):
+        """Процент правильных ответов на вопрос"""
+        if not self.answered:
+            return 0
+        return self.correct / self.answered * 100
+
+    @property
+    def p_value(self):
+        """Доля правильных ответов (None, если ответов нет)"""
+        if not self.answered:
+            return None
+        return self.correct / self.answered
+
+
+class AnswerOptionStats(Base):
+    """Предрассчитанная статистика выбора вариантов ответа"""
+    __tablename__ = "answer_option_stats"
+
+    answer_id = Column(Integer, ForeignKey("answers.id", ondelete="CASCADE"), primary_key=True)
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), index=True)
+    selected = Column(Integer, default=0)
+    mean_score = Column(Float, nullable=True)  # средний результат попыток, выбравших вариант (item_analysis.py)
+
+    # Связь с вариантом ответа
+    answer = relationship("Answer")
+
+
+class CategoryStats(Base):
+    """Предрассчитанная статистика ответов по категориям вопросов"""
+    __tablename__ = "category_stats"
+
+    exam_type = Column(String(50), primary_key=True)
+    category = Column(String(255), primary_key=True)
+    answered = Column(Integer, default=0)
+    correct = Column(Integer, default=0)
+
+    @property
+    def percent_correct(self):
+        """Процент правильных ответов в категории"""
+        if not self.answered:
+            return 0
+        return self.correct / self.answered * 100
+
+
+class DailyAttemptStats(Base):
+    """Предрассчитанная статистика завершенных попыток по дням"""
+    __tablename__ = "daily_attempt_stats"
+
+    day = Column(Date, primary_key=True)
+    exam_type = Column(String(50), primary_key=True)
+    attempts = Column(Integer, default=0)
+    passed = Column(Integer, default=0)
+    percentage_sum = Column(Float, default=0)
+
+    @property
+    def average_percentage(self):
+        """Средний результат за день"""
+        if not self.attempts:
+            return 0
+        return self.percentage_sum / self.attempts
+
+    @property
+    def pass_rate(self):
+        """Доля успешно сданных попыток за день"""
+        if not self.attempts:
+            return 0
+        return self.passed / self.attempts * 100
+
+
+class AnalyticsRefresh(Base):
+    """Журнал обновлений аналитических агрегатов"""
+    __tablename__ = "analytics_refreshes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    full = Column(Boolean, default=False)
+
+
+class BackgroundJob(Base):
+    """Фоновая задача (например, массовое удаление вопросов) с прогрессом выполнения"""
+    __tablename__ = "background_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)
+    # pending, running, completed, failed, cancelled
+    status = Column(String(20), nullable=False, default="pending", index=True)
+    params = Column(JSON, nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    total = Column(Integer, nullable=True)
+    processed = Column(Integer, default=0)
+    cancel_requested = Column(Boolean, default=False)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    # Обновляется после каждой порции: по нему находятся задачи упавших воркеров
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
 # Связующая таблица между темами теории и вопросами
 topic_questions = Table(
     "topic_questions",
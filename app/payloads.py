@@ -0,0 +1,135 @@
+"""
+Быстрые JSON-ответы для вопросов и тем теории.
+
+Объекты из БД сериализуются напрямую в словари той же формы, что и схемы
+QuestionResponse / TheoryTopicResponse / TheoryTopicDetail, без проверки
+pydantic, и кодируются orjson. Готовые байты вопросов и тем кэшируются по id
+и сбрасываются шиной invalidation.publish() после изменения данных.
+Промахи кэша читаются из основной БД, а не с реплики.
+"""
+import os
+
+import orjson
+from fastapi.responses import Response
+from sqlalchemy.orm import Session, selectinload
+
+from cache import Cache
+from database import primary_session
+from models import Question, TheoryTopic
+
+# Максимум объектов в каждом кэше; при переполнении вытесняются давно не использованные
+PAYLOAD_CACHE_SIZE = int(os.getenv("PAYLOAD_CACHE_SIZE", "20000"))
+# Время жизни в секундах: ограничивает устаревание, если оповещение о сбросе потерялось
+PAYLOAD_CACHE_TTL = int(os.getenv("PAYLOAD_CACHE_TTL", "600"))
+
+question_payloads = Cache("question_json", ttl=PAYLOAD_CACHE_TTL, max_size=PAYLOAD_CACHE_SIZE)
+topic_payloads = Cache("topic_json", ttl=PAYLOAD_CACHE_TTL, max_size=PAYLOAD_CACHE_SIZE)
+
+
+def invalidate_payloads():
+    """Сбрасывает кэши ответов (вопросы входят в ответ темы, поэтому сбрасываются оба)"""
+    question_payloads.clear()
+    topic_payloads.clear()
+
+
+def json_response(body: bytes, status_code: int = 200) -> Response:
+    """Ответ с уже сериализованным JSON"""
+    return Response(content=body, status_code=status_code, media_type="application/json")
+
+
+def question_to_dict(question: Question) -> dict:
+    """Вопрос в форме QuestionResponse"""
+    return {
+        "text": question.text,
+        "difficulty": question.difficulty,
+        "category": question.category,
+        "exam_type": question.exam_type,
+        "id": question.id,
+        "answers": [
+            {
+                "text": answer.text,
+                "is_correct": answer.is_correct,
+                "id": answer.id,
+                "question_id": answer.question_id
+            }
+            for answer in question.answers
+        ]
+    }
+
+
+def topic_to_dict(topic: TheoryTopic) -> dict:
+    """Тема в форме TheoryTopicResponse"""
+    return {
+        "title": topic.title,
+        "description": topic.description,
+        "exam_type": topic.exam_type,
+        "order": topic.order,
+        "id": topic.id,
+        "parent_id": topic.parent_id
+    }
+
+
+def topic_detail_to_dict(topic: TheoryTopic) -> dict:
+    """Тема в форме TheoryTopicDetail; в схеме одно содержимое - берется первое"""
+    content = topic.content[0] if topic.content else None
+    return {
+        **topic_to_dict(topic),
+        "content": {
+            "content": content.content,
+            "id": content.id,
+            "topic_id": content.topic_id,
+            "created_at": content.created_at,
+            "updated_at": content.updated_at
+        } if content else None,
+        "resources": [
+            {
+                "title": resource.title,
+                "url": resource.url,
+                "resource_type": resource.resource_type,
+                "id": resource.id,
+                "topic_id": resource.topic_id
+            }
+            for resource in topic.resources
+        ],
+        "children": [topic_to_dict(child) for child in topic.children],
+        "questions": [question_to_dict(question) for question in topic.questions]
+    }
+
+
+def _load_question_payloads(db: Session, question_ids) -> dict:
+    """Готовые JSON вопросов {id: bytes}; в БД загружаются только отсутствующие в кэше"""
+    def load(missing):
+        with primary_session(db) as session:
+            questions = session.query(Question).options(
+                selectinload(Question.answers)
+            ).filter(Question.id.in_(missing)).all()
+            return {question.id: orjson.dumps(question_to_dict(question)) for question in questions}
+
+    return question_payloads.get_many_or_load(question_ids, load)
+
+
+def questions_payload(db: Session, question_ids) -> bytes:
+    """JSON-массив вопросов в порядке question_ids"""
+    payloads = _load_question_payloads(db, question_ids)
+    # Вопрос мог быть удален между запросами
+    return b"[" + b",".join(payloads[question_id] for question_id in question_ids if question_id in payloads) + b"]"
+
+
+def question_payload(db: Session, question_id: int):
+    """JSON вопроса (None, если вопроса нет)"""
+    return _load_question_payloads(db, [question_id]).get(question_id)
+
+
+def topic_detail_payload(db: Session, topic_id: int):
+    """JSON темы со связанными данными (None, если темы нет)"""
+    def load():
+        with primary_session(db) as session:
+            topic = session.query(TheoryTopic).options(
+                selectinload(TheoryTopic.content),
+                selectinload(TheoryTopic.resources),
+                selectinload(TheoryTopic.children),
+                selectinload(TheoryTopic.questions).selectinload(Question.answers)
+            ).filter(TheoryTopic.id == topic_id).first()
+            return orjson.dumps(topic_detail_to_dict(topic)) if topic is not None else None
+
+    return topic_payloads.get_or_load(topic_id, load)
@@ -0,0 +1,33 @@
+import os
+import sys
+
+from database import SessionLocal, engine
+from models import Base
+from stats import rebuild_user_stats
+
+# Добавляем корневую директорию проекта в sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def rebuild(user_id=None):
+    """Пересчет таблиц user_stats и user_category_stats по истории тестов"""
+    # Создаем таблицы статистики, если их еще нет
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        users_count = rebuild_user_stats(db, user_id)
+        print(f"Статистика пересчитана для {users_count} пользователей.")
+        return True
+    except Exception as e:
+        db.rollback()
+        print(f"Ошибка при пересчете статистики: {str(e)}")
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    # Можно указать ID пользователя для пересчета только его статистики
+    rebuild(int(sys.argv[1]) if len(sys.argv) > 1 else None)
+    print("Миграция завершена.")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Скрипт для обновления аналитических агрегатов админ-панели
+"""
+import logging
+import os
+import sys
+import time
+from logging.handlers import RotatingFileHandler
+
+from analytics import refresh_analytics
+from database import SessionLocal, engine
+from models import Base
+
+# Настройка логирования
+log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+os.makedirs(log_dir, exist_ok=True)
+log_file = os.path.join(log_dir, "analytics.log")
+
+logger = logging.getLogger("analytics")
+logger.setLevel(logging.INFO)
+handler = RotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024, backupCount=5)
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+def run_refresh(full=False):
+    """Выполняет одно обновление агрегатов"""
+    db = SessionLocal()
+    try:
+        refresh_analytics(db, full=full)
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении аналитики: {e}")
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    # Создаем таблицы агрегатов, если их еще нет
+    Base.metadata.create_all(bind=engine)
+
+    full = "--full" in sys.argv
+
+    if "--daemon" in sys.argv:
+        # Запуск в режиме демона: первый проход полный, далее инкрементальный
+        refresh_interval = int(os.getenv("ANALYTICS_REFRESH_INTERVAL", "600"))  # По умолчанию 10 минут
+        logger.info(f"Запуск в режиме демона с интервалом {refresh_interval} секунд")
+
+        run_refresh(full=True)
+        while True:
+            try:
+                time.sleep(refresh_interval)
+                run_refresh(full=full)
+            except KeyboardInterrupt:
+                logger.info("Обновление аналитики остановлено.")
+                break
+            except Exception as e:
+                logger.error(f"Неожиданная ошибка: {e}")
+                time.sleep(60)  # В случае ошибки ждем минуту перед следующей попыткой
+    else:
+        if run_refresh(full=full):
+            print("Аналитика обновлена.")
+        else:
+            print("Ошибка при обновлении аналитики. Подробности в logs/analytics.log")
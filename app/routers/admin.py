@@ -1,19 +1,26 @@
 import logging
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, Form, HTTPException, Query, Request, Security
 from fastapi.responses import RedirectResponse
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from fastapi.templating import Jinja2Templates
+from sqlalchemy import func
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session, contains_eager, joinedload
 
+import jobs
+from analytics import get_analytics
+from analytics import rename_category as rename_category_rollups
 from database import get_db
+from history import HISTORY_PAGE_SIZE, attempt_to_dict, fetch_history_page
+from invalidation import publish
 from models import (
     Answer,
+    BackgroundJob,
     Question,
     QuestionCategory,
+    QuestionStats,
     TestAttempt,
     TheoryContent,
     TheoryResource,
@@ -22,6 +29,9 @@ from models import (
     UserAnswer,
 )
 from routers.auth import AuthService
+from stats import get_user_stats
+from stats import rename_category as rename_user_category_stats
+from templating import templates
 
 # Setup logger
 logger = logging.getLogger("admin")
@@ -32,10 +42,18 @@ router = APIRouter(
     responses={404: {"description": "Не найдено"}},
 )
 
-templates = Jinja2Templates(directory="templates")
 security = HTTPBearer(auto_error=False)
 
 
+# Допустимые поля сортировки списка вопросов (префикс "-" - по убыванию)
+QUESTION_SORTS = {
+    "p_value": QuestionStats.correct * 1.0 / func.nullif(QuestionStats.answered, 0),
+    "discrimination": QuestionStats.discrimination,
+    "distractor": QuestionStats.weakest_distractor_rate,
+    "responses": QuestionStats.answered,
+}
+
+
 # Вспомогательная функция для получения типов экзаменов
 def get_exam_types(db: Session):
     """Получает список уникальных типов экзаменов из базы данных"""
@@ -72,7 +90,7 @@ async def check_admin_access(
         auth_token = token
 
     if not auth_token:
-        logger.warning(f"Admin access attempt without token from IP: {request.client.host}")
+        logger.warning("Admin access attempt without token from IP: %s", request.client.host)
         raise HTTPException(
             status_code=403,
             detail="Не авторизован. Токен не найден."
@@ -80,9 +98,9 @@ async def check_admin_access(
 
     try:
         # Верификация токена
-        payload = AuthService.decode_access_token(auth_token)
+        payload = AuthService.get_token_payload(request, auth_token)
         if payload is None or "sub" not in payload:
-            logger.warning(f"Admin access attempt with invalid token from IP: {request.client.host}")
+            logger.warning("Admin access attempt with invalid token from IP: %s", request.client.host)
             raise HTTPException(
                 status_code=403,
                 detail="Недействительный токен авторизации."
@@ -91,7 +109,7 @@ async def check_admin_access(
         # Проверка пользователя
         user = db.query(User).filter(User.email == payload["sub"]).first()
         if not user:
-            logger.warning(f"Admin access attempt with non-existent user: {payload.get('sub', 'unknown')} from IP: {request.client.host}")
+            logger.warning("Admin access attempt with non-existent user: %s from IP: %s", payload.get('sub', 'unknown'), request.client.host)
             raise HTTPException(
                 status_code=403,
                 detail="Пользователь не найден."
@@ -99,17 +117,17 @@ async def check_admin_access(
 
         # Проверка прав администратора
         if not user.is_superuser:
-            logger.warning(f"Admin access attempt by non-admin user: {user.email} from IP: {request.client.host}")
+            logger.warning("Admin access attempt by non-admin user: %s from IP: %s", user.email, request.client.host)
             raise HTTPException(
                 status_code=403,
                 detail="Недостаточно прав для доступа к административной панели."
             )
 
-        logger.info(f"Admin access granted to: {user.email} from IP: {request.client.host}")
+        logger.info("Admin access granted to: %s from IP: %s", user.email, request.client.host, extra={"sample": True})
         return user
 
     except Exception as e:
-        logger.error(f"Admin access error: {str(e)} from IP: {request.client.host}")
+        logger.error("Admin access error: %s from IP: %s", e, request.client.host)
         raise HTTPException(
             status_code=403,
             detail=f"Ошибка авторизации: {str(e)}"
@@ -130,7 +148,7 @@ async def admin_dashboard(
     questions_count = db.query(Question).count()
     topics_count = db.query(TheoryTopic).count()
 
-    logger.info(f"Admin dashboard accessed by: {admin.email}")
+    logger.info("Admin dashboard accessed by: %s", admin.email)
     return templates.TemplateResponse(
         "admin/dashboard.html",
         {
@@ -146,6 +164,45 @@ async def admin_dashboard(
     )
 
 
+# Аналитика по результатам тестирования
+@router.get("/analytics", response_model=None)
+async def admin_analytics(
+    request: Request,
+    token: Optional[str] = Query(None),
+    days: int = Query(30),
+    admin: User = Depends(check_admin_access),
+    db: Session = Depends(get_db)
+):
+    """Страница аналитики (читает только предрассчитанные агрегаты)"""
+    analytics = get_analytics(db, days=days)
+
+    logger.info("Analytics accessed by admin: %s", admin.email)
+    return templates.TemplateResponse(
+        "admin/analytics.html",
+        {
+            "request": request,
+            "title": "Аналитика",
+            "admin": admin,
+            "analytics": analytics,
+            "days": days,
+            "token": token
+        }
+    )
+
+
+# JSON API аналитики
+@router.get("/api/analytics", response_model=None)
+async def admin_analytics_api(
+    days: int = Query(30),
+    questions_limit: int = Query(20),
+    min_answers: int = Query(5),
+    admin: User = Depends(check_admin_access),
+    db: Session = Depends(get_db)
+):
+    """Аналитика в формате JSON"""
+    return get_analytics(db, days=days, questions_limit=questions_limit, min_answers=min_answers)
+
+
 # Управление пользователями
 @router.get("/users", response_model=None)
 async def admin_users(
@@ -157,7 +214,7 @@ async def admin_users(
     """Список пользователей"""
     users = db.query(User).all()
 
-    logger.info(f"User management accessed by admin: {admin.email}")
+    logger.info("User management accessed by admin: %s", admin.email)
     return templates.TemplateResponse(
         "admin/users.html",
         {
@@ -184,7 +241,7 @@ async def admin_edit_user(
     """Редактирование пользователя"""
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
-        logger.warning(f"Admin {admin.email} attempted to edit non-existent user ID: {user_id}")
+        logger.warning("Admin %s attempted to edit non-existent user ID: %s", admin.email, user_id)
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
     # Convert string values to boolean
@@ -196,9 +253,8 @@ async def admin_edit_user(
     db.commit()
 
     logger.info(
-        f"User {user.email} (ID: {user_id}) updated by admin {admin.email}: "
-        f"is_active: {old_is_active} -> {user.is_active}, "
-        f"is_superuser: {old_is_superuser} -> {user.is_superuser}"
+        "User %s (ID: %s) updated by admin %s: is_active: %s -> %s, is_superuser: %s -> %s",
+        user.email, user_id, admin.email, old_is_active, user.is_active, old_is_superuser, user.is_superuser
     )
 
     # Перенаправляем на страницу со списком пользователей, добавляя токен
@@ -217,12 +273,15 @@ async def admin_questions(
     category: Optional[str] = Query(None),
     difficulty: Optional[str] = Query(None),
     exam_type: Optional[str] = Query(None),
+    sort: Optional[str] = Query(None),
     admin: User = Depends(check_admin_access),
     db: Session = Depends(get_db)
 ):
     """Список вопросов с возможностью фильтрации"""
-    # Базовый запрос
-    query = db.query(Question)
+    # Базовый запрос вместе с результатами анализа качества вопросов
+    query = db.query(Question).outerjoin(Question.item_stats).options(
+        contains_eager(Question.item_stats)
+    )
 
     # Применяем фильтры, если они указаны
     if category:
@@ -232,6 +291,14 @@ async def admin_questions(
     if exam_type:
         query = query.filter(Question.exam_type == exam_type)
 
+    # Сортировка по показателям анализа качества (вопросы без анализа в конце)
+    sort_column = QUESTION_SORTS.get((sort or "").lstrip("-"))
+    if sort_column is not None:
+        direction = sort_column.desc() if sort.startswith("-") else sort_column.asc()
+        query = query.order_by(sort_column.is_(None), direction, Question.id)
+    else:
+        query = query.order_by(Question.id)
+
     # Получаем отфильтрованные вопросы
     questions = query.all()
 
@@ -247,7 +314,7 @@ async def admin_questions(
     exam_types = db.query(Question.exam_type).distinct().all()
     exam_types = [et[0] for et in exam_types]
 
-    logger.info(f"Question management accessed by admin: {admin.email}")
+    logger.info("Question management accessed by admin: %s", admin.email)
     return templates.TemplateResponse(
         "admin/questions.html",
         {
@@ -261,6 +328,7 @@ async def admin_questions(
             "selected_category": category,
             "selected_difficulty": difficulty,
             "selected_exam_type": exam_type,
+            "selected_sort": sort,
             "token": token
         }
     )
@@ -278,7 +346,7 @@ async def admin_add_question_form(
     # Получаем все категории вопросов
     categories = db.query(QuestionCategory).order_by(QuestionCategory.name).all()
 
-    logger.info(f"Question add form accessed by admin: {admin.email}")
+    logger.info("Question add form accessed by admin: %s", admin.email)
     return templates.TemplateResponse(
         "admin/question_form.html",
         {
@@ -330,7 +398,7 @@ async def admin_add_question(
             db.add(new_cat)
             db.flush()  # Получаем ID без коммита
             category_id = new_cat.id
-            logger.info(f"New category '{category_name}' created by admin: {admin.email}")
+            logger.info("New category '%s' created by admin: %s", category_name, admin.email)
 
     # Создаем вопрос
     question = Question(
@@ -355,10 +423,11 @@ async def admin_add_question(
         db.add(answer)
 
     db.commit()
+    publish("question", question.id)
 
     logger.info(
-        f"New question added by admin {admin.email}: "
-        f"ID: {question.id}, Category: {category_name}, Difficulty: {difficulty}, Exam type: {exam_type}"
+        "New question added by admin %s: ID: %s, Category: %s, Difficulty: %s, Exam type: %s",
+        admin.email, question.id, category_name, difficulty, exam_type
     )
 
     # Перенаправляем на страницу со списком вопросов, добавляя токен
@@ -380,7 +449,7 @@ async def admin_delete_question(
     """Удаление вопроса"""
     question = db.query(Question).filter(Question.id == question_id).first()
     if question:
-        logger.info(f"Question ID: {question_id} deleted by admin: {admin.email}")
+        logger.info("Question ID: %s deleted by admin: %s", question_id, admin.email)
         # Удаляем связанные ответы
         db.query(Answer).filter(Answer.question_id == question_id).delete()
         # Удаляем связанные ответы пользователей
@@ -388,8 +457,9 @@ async def admin_delete_question(
         # Удаляем сам вопрос
         db.delete(question)
         db.commit()
+        publish("question", question_id)
     else:
-        logger.warning(f"Admin {admin.email} attempted to delete non-existent question ID: {question_id}")
+        logger.warning("Admin %s attempted to delete non-existent question ID: %s", admin.email, question_id)
 
     # Перенаправляем на страницу со списком вопросов, добавляя токен
     redirect_url = "/admin/questions"
@@ -407,81 +477,36 @@ async def admin_batch_delete_questions(
     admin: User = Depends(check_admin_access),
     db: Session = Depends(get_db)
 ):
-    """Массовое удаление вопросов"""
-    try:
-        # Получаем данные формы
-        form = await request.form()
-
-        # Преобразуем MultiDict формы в обычный dict для логирования
-        form_data = dict(form)
-        logger.info(f"Received form data keys: {list(form_data.keys())}")
-
-        # Используем встроенный метод getlist для получения всех значений с одинаковым ключом
-        question_ids_raw = form.getlist('question_ids')
-        logger.info(f"Raw question_ids from form.getlist: {question_ids_raw}")
-
-        # Преобразуем строковые ID в целочисленные
-        question_ids = []
-        for id_str in question_ids_raw:
-            try:
-                question_id = int(id_str)
-                question_ids.append(question_id)
-            except ValueError:
-                logger.warning(f"Invalid question ID format: {id_str}")
-
-        if question_ids:
-            logger.info(f"Attempting to delete {len(question_ids)} questions: {question_ids}")
-
-            try:
-                # Удаляем связанные ответы пользователей
-                user_answers_deleted = db.query(UserAnswer).filter(
-                    UserAnswer.question_id.in_(question_ids)
-                ).delete(synchronize_session=False)
-
-                # Удаляем связанные ответы
-                answers_deleted = db.query(Answer).filter(
-                    Answer.question_id.in_(question_ids)
-                ).delete(synchronize_session=False)
-
-                # Удаляем сами вопросы
-                deleted_count = db.query(Question).filter(
-                    Question.id.in_(question_ids)
-                ).delete(synchronize_session=False)
-
-                db.commit()
-
-                logger.info(
-                    f"Batch deletion by admin: {admin.email}. "
-                    f"Deleted {deleted_count} questions, {answers_deleted} answers, "
-                    f"{user_answers_deleted} user answers. Question IDs: {question_ids}"
-                )
-            except Exception as e:
-                db.rollback()
-                logger.error(f"Error during batch deletion: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"Error during batch deletion: {str(e)}") from e
-        else:
-            logger.warning(f"Batch delete request without valid question IDs from admin: {admin.email}")
-
-    except Exception as e:
-        logger.error(f"Unexpected error in batch delete: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}") from e
-
-    # Перенаправляем на страницу со списком вопросов, сохраняя фильтры
-    redirect_url = "/admin/questions"
-    params = []
-
-    if token:
-        params.append(f"token={token}")
+    """Массовое удаление вопросов (выполняется фоновой задачей)"""
+    form = await request.form()
 
-    # Сохраняем текущие фильтры
-    for key, value in form.items():
-        if key in ["category", "difficulty", "exam_type"] and value:
-            params.append(f"{key}={value}")
+    # Используем встроенный метод getlist для получения всех значений с одинаковым ключом
+    question_ids_raw = form.getlist('question_ids')
+    logger.debug("Raw question_ids from form.getlist: %s", question_ids_raw)
 
-    if params:
-        redirect_url += "?" + "&".join(params)
-
-    return RedirectResponse(url=redirect_url, status_code=303)
+    # Преобразуем строковые ID в целочисленные
+    question_ids = []
+    for id_str in question_ids_raw:
+        try:
+            question_ids.append(int(id_str))
+        except ValueError:
+            logger.warning("Invalid question ID format: %s", id_str)
+
+    if not question_ids:
+        logger.warning("Batch delete request without valid question IDs from admin: %s", admin.email)
+        # Перенаправляем на страницу со списком вопросов, сохраняя фильтры
+        params = [f"token={token}"] if token else []
+        for key, value in form.items():
+            if key in ["category", "difficulty", "exam_type"] and value:
+                params.append(f"{key}={value}")
+        redirect_url = "/admin/questions"
+        if params:
+            redirect_url += "?" + "&".join(params)
+        return RedirectResponse(url=redirect_url, status_code=303)
+
+    job = jobs.submit(db, "delete_questions", {"question_ids": question_ids}, admin)
+    logger.info("Batch deletion of %s questions queued as job %s by admin: %s", len(question_ids), job.id, admin.email)
+    return RedirectResponse(url=_jobs_url(token, job.id), status_code=303)
 
 
 # Удаление категории вопросов
@@ -492,83 +517,100 @@ async def admin_delete_category(
     admin: User = Depends(check_admin_access),
     db: Session = Depends(get_db)
 ):
-    """Удаление всех вопросов определенной категории"""
-    try:
-        form = await request.form()
-        form_data = dict(form)
-
-        logger.info(f"Category deletion form data: {form_data}")
+    """Удаление всех вопросов определенной категории (выполняется фоновой задачей)"""
+    form = await request.form()
+    category = form.get("category")
+    exam_type = form.get("exam_type")
 
-        category = form.get("category")
-        exam_type = form.get("exam_type")
+    if not category:
+        logger.warning("Category deletion request without category from admin: %s", admin.email)
+        raise HTTPException(status_code=400, detail="Категория не указана")
 
-        if not category:
-            logger.warning(f"Category deletion request without category from admin: {admin.email}")
-            raise HTTPException(status_code=400, detail="Категория не указана")
-
-        logger.info(f"Attempting to delete category '{category}' with exam_type filter: {exam_type}")
-
-        try:
-            # Строим базовый запрос
-            query = db.query(Question).filter(Question.category == category)
-
-            # Если указан тип экзамена, добавляем его в фильтр
-            if exam_type:
-                query = query.filter(Question.exam_type == exam_type)
-
-            # Получаем ID вопросов для удаления
-            questions = query.all()
-            question_ids = [q.id for q in questions]
-
-            logger.info(f"Found {len(question_ids)} questions in category '{category}' to delete")
+    job = jobs.submit(
+        db, "delete_category_questions", {"category": category, "exam_type": exam_type or None}, admin
+    )
+    logger.info(
+        "Deletion of category '%s' (exam_type: %s) queued as job %s by admin: %s", category, exam_type, job.id, admin.email
+    )
+    return RedirectResponse(url=_jobs_url(token, job.id), status_code=303)
 
-            if question_ids:
-                # Удаляем связанные ответы пользователей
-                user_answers_deleted = db.query(UserAnswer).filter(
-                    UserAnswer.question_id.in_(question_ids)
-                ).delete(synchronize_session=False)
 
-                # Удаляем связанные ответы
-                answers_deleted = db.query(Answer).filter(
-                    Answer.question_id.in_(question_ids)
-                ).delete(synchronize_session=False)
+def _jobs_url(token: Optional[str], job_id: Optional[int] = None) -> str:
+    params = []
+    if token:
+        params.append(f"token={token}")
+    if job_id is not None:
+        params.append(f"job={job_id}")
+    return "/admin/jobs" + ("?" + "&".join(params) if params else "")
 
-                # Удаляем сами вопросы
-                deleted_count = query.delete(synchronize_session=False)
 
-                db.commit()
+# Фоновые задачи
+@router.get("/jobs", response_model=None)
+async def admin_jobs(
+    request: Request,
+    token: Optional[str] = Query(None),
+    job: Optional[int] = Query(None),
+    admin: User = Depends(check_admin_access),
+    db: Session = Depends(get_db)
+):
+    """Список фоновых задач с прогрессом"""
+    recent_jobs = [jobs.job_to_dict(item) for item in jobs.get_recent_jobs(db)]
 
-                logger.info(
-                    f"Category '{category}' deletion by admin: {admin.email}. "
-                    f"Deleted {deleted_count} questions, {answers_deleted} answers, "
-                    f"{user_answers_deleted} user answers."
-                )
-            else:
-                logger.info(f"No questions found in category '{category}' to delete")
+    logger.info("Background jobs accessed by admin: %s", admin.email)
+    return templates.TemplateResponse(
+        "admin/jobs.html",
+        {
+            "request": request,
+            "title": "Фоновые задачи",
+            "admin": admin,
+            "jobs": recent_jobs,
+            "active_statuses": jobs.ACTIVE_STATUSES,
+            "highlight_job": job,
+            "token": token
+        }
+    )
 
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Error during category deletion: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error during category deletion: {str(e)}") from e
 
-    except Exception as e:
-        logger.error(f"Unexpected error in category deletion: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}") from e
+# JSON API фоновых задач
+@router.get("/api/jobs", response_model=None)
+async def admin_jobs_api(
+    admin: User = Depends(check_admin_access),
+    db: Session = Depends(get_db)
+):
+    """Последние фоновые задачи в формате JSON (для опроса прогресса)"""
+    return [jobs.job_to_dict(item) for item in jobs.get_recent_jobs(db)]
 
-    # Перенаправляем на страницу со списком вопросов, добавляя токен и сохраняя фильтры
-    redirect_url = "/admin/questions"
-    params = []
 
-    if token:
-        params.append(f"token={token}")
+@router.get("/api/jobs/{job_id}", response_model=None)
+async def admin_job_api(
+    job_id: int,
+    admin: User = Depends(check_admin_access),
+    db: Session = Depends(get_db)
+):
+    """Состояние фоновой задачи в формате JSON"""
+    job = db.get(BackgroundJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return jobs.job_to_dict(job)
 
-    if exam_type:
-        params.append(f"exam_type={exam_type}")
 
-    if params:
-        redirect_url += "?" + "&".join(params)
+# Отмена фоновой задачи
+@router.post("/jobs/{job_id}/cancel", response_model=None)
+async def admin_cancel_job(
+    job_id: int,
+    token: Optional[str] = Query(None),
+    admin: User = Depends(check_admin_access),
+    db: Session = Depends(get_db)
+):
+    """Отмена фоновой задачи: ожидающая отменяется сразу, выполняющаяся - после текущей порции"""
+    if db.get(BackgroundJob, job_id) is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
 
-    return RedirectResponse(url=redirect_url, status_code=303)
+    if jobs.request_cancel(db, job_id):
+        logger.info("Job %s cancellation requested by admin: %s", job_id, admin.email)
+    else:
+        logger.info("Job %s is already finished, cancellation by admin %s ignored", job_id, admin.email)
+    return RedirectResponse(url=_jobs_url(token), status_code=303)
 
 
 # Форма редактирования вопроса
@@ -648,7 +690,7 @@ async def admin_update_question(
             db.add(new_cat)
             db.flush()  # Получаем ID без коммита
             category_id = new_cat.id
-            logger.info(f"New category '{category_name}' created by admin: {admin.email}")
+            logger.info("New category '%s' created by admin: %s", category_name, admin.email)
 
     # Обновляем данные вопроса
     question.text = text
@@ -682,10 +724,11 @@ async def admin_update_question(
         db.add(answer)
 
     db.commit()
+    publish("question", question.id)
 
     logger.info(
-        f"Question updated by admin {admin.email}: "
-        f"ID: {question.id}, Category: {category_name}, Difficulty: {difficulty}, Exam type: {exam_type}"
+        "Question updated by admin %s: ID: %s, Category: %s, Difficulty: %s, Exam type: %s",
+        admin.email, question.id, category_name, difficulty, exam_type
     )
 
     # Перенаправляем на страницу со списком вопросов, добавляя токен
@@ -702,6 +745,10 @@ async def admin_user_test_history(
     user_id: int,
     request: Request,
     token: Optional[str] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    exam_type: Optional[str] = Query(None),
+    order: str = Query("desc"),
     admin: User = Depends(check_admin_access),
     db: Session = Depends(get_db)
 ):
@@ -709,15 +756,27 @@ async def admin_user_test_history(
     # Проверяем существование пользователя
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
-        logger.warning(f"Admin {admin.email} attempted to view history of non-existent user ID: {user_id}")
+        logger.warning("Admin %s attempted to view history of non-existent user ID: %s", admin.email, user_id)
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
-    # Получаем историю тестирования пользователя
-    test_attempts = db.query(TestAttempt).filter(
-        TestAttempt.user_id == user_id
-    ).order_by(TestAttempt.start_time.desc()).all()
+    # Получаем первую страницу истории, включая незавершенные попытки
+    try:
+        test_attempts, next_cursor = fetch_history_page(
+            db,
+            user_id,
+            order=order,
+            date_from=date_from,
+            date_to=date_to,
+            exam_type=exam_type,
+            finished_only=False
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    # Агрегированная статистика пользователя
+    user_stats, category_stats = get_user_stats(db, user_id)
 
-    logger.info(f"Admin {admin.email} viewed test history of user {user.email} (ID: {user_id})")
+    logger.info("Admin %s viewed test history of user %s (ID: %s)", admin.email, user.email, user_id)
 
     return templates.TemplateResponse(
         "admin/user_test_history.html",
@@ -727,11 +786,55 @@ async def admin_user_test_history(
             "admin": admin,
             "user": user,
             "test_attempts": test_attempts,
+            "next_cursor": next_cursor,
+            "filters": {
+                "date_from": date_from,
+                "date_to": date_to,
+                "exam_type": exam_type,
+                "order": order
+            },
+            "user_stats": user_stats,
+            "category_stats": category_stats,
             "token": token
         }
     )
 
 
+# Страница истории тестирования пользователя в формате JSON
+@router.get("/users/{user_id}/history/data", response_model=None)
+async def admin_user_test_history_data(
+    user_id: int,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(HISTORY_PAGE_SIZE),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    exam_type: Optional[str] = Query(None),
+    order: str = Query("desc"),
+    admin: User = Depends(check_admin_access),
+    db: Session = Depends(get_db)
+):
+    """Следующая страница истории тестирования пользователя для бесконечной прокрутки"""
+    try:
+        test_attempts, next_cursor = fetch_history_page(
+            db,
+            user_id,
+            cursor=cursor,
+            limit=limit,
+            order=order,
+            date_from=date_from,
+            date_to=date_to,
+            exam_type=exam_type,
+            finished_only=False
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    return {
+        "items": [attempt_to_dict(attempt) for attempt in test_attempts],
+        "next_cursor": next_cursor
+    }
+
+
 # Просмотр деталей попытки тестирования
 @router.get("/test_attempts/{attempt_id}", response_model=None)
 async def admin_test_attempt_details(
@@ -745,7 +848,7 @@ async def admin_test_attempt_details(
     # Получаем попытку тестирования
     test_attempt = db.query(TestAttempt).filter(TestAttempt.id == attempt_id).first()
     if not test_attempt:
-        logger.warning(f"Admin {admin.email} attempted to view non-existent test attempt ID: {attempt_id}")
+        logger.warning("Admin %s attempted to view non-existent test attempt ID: %s", admin.email, attempt_id)
         raise HTTPException(status_code=404, detail="Попытка тестирования не найдена")
 
     # Получаем пользователя
@@ -756,7 +859,7 @@ async def admin_test_attempt_details(
         UserAnswer.test_attempt_id == attempt_id
     ).all()
 
-    logger.info(f"Admin {admin.email} viewed test attempt details (ID: {attempt_id}) of user {user.email}")
+    logger.info("Admin %s viewed test attempt details (ID: %s) of user %s", admin.email, attempt_id, user.email)
 
     return templates.TemplateResponse(
         "admin/test_attempt_details.html",
@@ -801,7 +904,7 @@ async def admin_theory(
         exam_types = db.query(Question.exam_type).distinct().all()
         exam_types = [t[0] for t in exam_types if t[0]]
 
-    logger.info(f"Theory management accessed by admin: {admin.email}")
+    logger.info("Theory management accessed by admin: %s", admin.email)
     return templates.TemplateResponse(
         "admin/theory.html",
         {
@@ -843,7 +946,7 @@ async def admin_add_topic_form(
     if not exam_types:
         exam_types = ["rhcsa", "cka"]
 
-    logger.info(f"Topic add form accessed by admin: {admin.email}")
+    logger.info("Topic add form accessed by admin: %s", admin.email)
     return templates.TemplateResponse(
         "admin/theory_add.html",
         {
@@ -876,7 +979,7 @@ async def admin_add_topic(
     if parent_id:
         parent_topic = db.query(TheoryTopic).filter(TheoryTopic.id == parent_id).first()
         if not parent_topic:
-            logger.warning(f"Admin {admin.email} attempted to add topic with non-existent parent ID: {parent_id}")
+            logger.warning("Admin %s attempted to add topic with non-existent parent ID: %s", admin.email, parent_id)
             raise HTTPException(status_code=404, detail="Родительская тема не найдена")
 
     # Создаем новую тему
@@ -889,9 +992,10 @@ async def admin_add_topic(
     )
     db.add(new_topic)
     db.commit()
+    publish("topic", new_topic.id)
     db.refresh(new_topic)
 
-    logger.info(f"Topic '{title}' (ID: {new_topic.id}) added by admin: {admin.email}")
+    logger.info("Topic '%s' (ID: %s) added by admin: %s", title, new_topic.id, admin.email)
 
     # Перенаправляем на страницу просмотра темы
     redirect_url = f"/admin/theory/{new_topic.id}"
@@ -922,7 +1026,7 @@ async def admin_view_topic(
     ).filter(TheoryTopic.id == topic_id).first()
 
     if not topic:
-        logger.warning(f"Admin {admin.email} attempted to view non-existent topic ID: {topic_id}")
+        logger.warning("Admin %s attempted to view non-existent topic ID: %s", admin.email, topic_id)
         raise HTTPException(status_code=404, detail="Тема не найдена")
 
     # Получаем все темы для выбора родительской
@@ -939,7 +1043,7 @@ async def admin_view_topic(
     if not exam_types:
         exam_types = ["rhcsa", "cka"]
 
-    logger.info(f"Topic '{topic.title}' (ID: {topic_id}) viewed by admin: {admin.email}")
+    logger.info("Topic '%s' (ID: %s) viewed by admin: %s", topic.title, topic_id, admin.email)
     return templates.TemplateResponse(
         "admin/theory_edit.html",
         {
@@ -973,27 +1077,27 @@ async def admin_update_topic(
     # Получаем тему
     topic = db.query(TheoryTopic).filter(TheoryTopic.id == topic_id).first()
     if not topic:
-        logger.warning(f"Admin {admin.email} attempted to update non-existent topic ID: {topic_id}")
+        logger.warning("Admin %s attempted to update non-existent topic ID: %s", admin.email, topic_id)
         raise HTTPException(status_code=404, detail="Тема не найдена")
 
     # Проверяем на циклические зависимости при выборе родителя
     new_parent_id = None if parent_id == "0" else int(parent_id) if parent_id else None
 
     if new_parent_id and new_parent_id == topic_id:
-        logger.warning(f"Admin {admin.email} attempted to set topic as its own parent, topic ID: {topic_id}")
+        logger.warning("Admin %s attempted to set topic as its own parent, topic ID: %s", admin.email, topic_id)
         raise HTTPException(status_code=400, detail="Тема не может быть родительской для самой себя")
 
     # Проверяем, не создаст ли новый родитель циклическую зависимость
     if new_parent_id:
         current_parent = db.query(TheoryTopic).filter(TheoryTopic.id == new_parent_id).first()
         if not current_parent:
-            logger.warning(f"Admin {admin.email} attempted to set non-existent parent ID: {new_parent_id}")
+            logger.warning("Admin %s attempted to set non-existent parent ID: %s", admin.email, new_parent_id)
             raise HTTPException(status_code=404, detail="Родительская тема не найдена")
 
         # Проверяем, нет ли циклической зависимости
         while current_parent:
             if current_parent.id == topic_id:
-                logger.warning(f"Admin {admin.email} attempted to create circular dependency in topic hierarchy")
+                logger.warning("Admin %s attempted to create circular dependency in topic hierarchy", admin.email)
                 raise HTTPException(
                     status_code=400,
                     detail="Невозможно создать циклическую зависимость в иерархии тем"
@@ -1010,9 +1114,10 @@ async def admin_update_topic(
     topic.order = order
 
     db.commit()
+    publish("topic", topic_id)
     db.refresh(topic)
 
-    logger.info(f"Topic '{title}' (ID: {topic_id}) updated by admin: {admin.email}")
+    logger.info("Topic '%s' (ID: %s) updated by admin: %s", title, topic_id, admin.email)
 
     # Перенаправляем на страницу просмотра темы с активной вкладкой основной информации
     redirect_url = f"/admin/theory/{topic_id}?tab=info"
@@ -1035,7 +1140,7 @@ async def admin_update_topic_content(
     # Получаем тему
     topic = db.query(TheoryTopic).filter(TheoryTopic.id == topic_id).first()
     if not topic:
-        logger.warning(f"Admin {admin.email} attempted to update content for non-existent topic ID: {topic_id}")
+        logger.warning("Admin %s attempted to update content for non-existent topic ID: %s", admin.email, topic_id)
         raise HTTPException(status_code=404, detail="Тема не найдена")
 
     # Проверяем, существует ли уже содержимое для этой темы
@@ -1054,10 +1159,11 @@ async def admin_update_topic_content(
         db.add(new_content)
 
     db.commit()
+    publish("topic", topic_id)
     # Обновляем тему, чтобы обновить связанные данные
     db.refresh(topic)
 
-    logger.info(f"Content for topic ID: {topic_id} updated by admin: {admin.email}")
+    logger.info("Content for topic ID: %s updated by admin: %s", topic_id, admin.email)
 
     # Перенаправляем на страницу просмотра темы с активной вкладкой содержимого
     redirect_url = f"/admin/theory/{topic_id}?tab=content"
@@ -1082,7 +1188,7 @@ async def admin_add_resource(
     # Получаем тему
     topic = db.query(TheoryTopic).filter(TheoryTopic.id == topic_id).first()
     if not topic:
-        logger.warning(f"Admin {admin.email} attempted to add resource to non-existent topic ID: {topic_id}")
+        logger.warning("Admin %s attempted to add resource to non-existent topic ID: %s", admin.email, topic_id)
         raise HTTPException(status_code=404, detail="Тема не найдена")
 
     # Создаем новый ресурс
@@ -1094,8 +1200,9 @@ async def admin_add_resource(
     )
     db.add(new_resource)
     db.commit()
+    publish("topic", topic_id)
 
-    logger.info(f"Resource '{title}' added to topic ID: {topic_id} by admin: {admin.email}")
+    logger.info("Resource '%s' added to topic ID: %s by admin: %s", title, topic_id, admin.email)
 
     # Перенаправляем на страницу просмотра темы с активной вкладкой ресурсов
     redirect_url = f"/admin/theory/{topic_id}?tab=resources"
@@ -1117,7 +1224,7 @@ async def admin_delete_resource(
     # Получаем ресурс
     resource = db.query(TheoryResource).filter(TheoryResource.id == resource_id).first()
     if not resource:
-        logger.warning(f"Admin {admin.email} attempted to delete non-existent resource ID: {resource_id}")
+        logger.warning("Admin %s attempted to delete non-existent resource ID: %s", admin.email, resource_id)
         raise HTTPException(status_code=404, detail="Ресурс не найден")
 
     # Запоминаем ID темы для перенаправления
@@ -1126,8 +1233,9 @@ async def admin_delete_resource(
     # Удаляем ресурс
     db.delete(resource)
     db.commit()
+    publish("topic", topic_id)
 
-    logger.info(f"Resource ID: {resource_id} deleted by admin: {admin.email}")
+    logger.info("Resource ID: %s deleted by admin: %s", resource_id, admin.email)
 
     # Перенаправляем на страницу просмотра темы с активной вкладкой ресурсов
     redirect_url = f"/admin/theory/{topic_id}?tab=resources"
@@ -1150,23 +1258,24 @@ async def admin_link_question(
     # Получаем тему
     topic = db.query(TheoryTopic).filter(TheoryTopic.id == topic_id).first()
     if not topic:
-        logger.warning(f"Admin {admin.email} attempted to link question to non-existent topic ID: {topic_id}")
+        logger.warning("Admin %s attempted to link question to non-existent topic ID: %s", admin.email, topic_id)
         raise HTTPException(status_code=404, detail="Тема не найдена")
 
     # Получаем вопрос
     question = db.query(Question).filter(Question.id == question_id).first()
     if not question:
-        logger.warning(f"Admin {admin.email} attempted to link non-existent question ID: {question_id}")
+        logger.warning("Admin %s attempted to link non-existent question ID: %s", admin.email, question_id)
         raise HTTPException(status_code=404, detail="Вопрос не найден")
 
     # Проверяем, не связан ли уже вопрос с этой темой
     if question in topic.questions:
-        logger.info(f"Question ID: {question_id} already linked to topic ID: {topic_id}")
+        logger.info("Question ID: %s already linked to topic ID: %s", question_id, topic_id)
     else:
         # Связываем вопрос с темой
         topic.questions.append(question)
         db.commit()
-        logger.info(f"Question ID: {question_id} linked to topic ID: {topic_id} by admin: {admin.email}")
+        publish("topic", topic_id)
+        logger.info("Question ID: %s linked to topic ID: %s by admin: %s", question_id, topic_id, admin.email)
 
     # Перенаправляем на страницу просмотра темы с активной вкладкой вопросов
     redirect_url = f"/admin/theory/{topic_id}?tab=questions"
@@ -1189,13 +1298,13 @@ async def admin_unlink_question(
     # Получаем тему
     topic = db.query(TheoryTopic).filter(TheoryTopic.id == topic_id).first()
     if not topic:
-        logger.warning(f"Admin {admin.email} attempted to unlink question from non-existent topic ID: {topic_id}")
+        logger.warning("Admin %s attempted to unlink question from non-existent topic ID: %s", admin.email, topic_id)
         raise HTTPException(status_code=404, detail="Тема не найдена")
 
     # Получаем вопрос
     question = db.query(Question).filter(Question.id == question_id).first()
     if not question:
-        logger.warning(f"Admin {admin.email} attempted to unlink non-existent question ID: {question_id}")
+        logger.warning("Admin %s attempted to unlink non-existent question ID: %s", admin.email, question_id)
         raise HTTPException(status_code=404, detail="Вопрос не найден")
 
     # Проверяем, связан ли вопрос с этой темой
@@ -1203,9 +1312,10 @@ async def admin_unlink_question(
         # Удаляем связь вопроса с темой
         topic.questions.remove(question)
         db.commit()
-        logger.info(f"Question ID: {question_id} unlinked from topic ID: {topic_id} by admin: {admin.email}")
+        publish("topic", topic_id)
+        logger.info("Question ID: %s unlinked from topic ID: %s by admin: %s", question_id, topic_id, admin.email)
     else:
-        logger.info(f"Question ID: {question_id} was not linked to topic ID: {topic_id}")
+        logger.info("Question ID: %s was not linked to topic ID: %s", question_id, topic_id)
 
     # Перенаправляем на страницу просмотра темы с активной вкладкой вопросов
     redirect_url = f"/admin/theory/{topic_id}?tab=questions"
@@ -1227,13 +1337,13 @@ async def admin_delete_topic(
     # Получаем тему
     topic = db.query(TheoryTopic).filter(TheoryTopic.id == topic_id).first()
     if not topic:
-        logger.warning(f"Admin {admin.email} attempted to delete non-existent topic ID: {topic_id}")
+        logger.warning("Admin %s attempted to delete non-existent topic ID: %s", admin.email, topic_id)
         raise HTTPException(status_code=404, detail="Тема не найдена")
 
     # Проверяем наличие дочерних тем
     child_topics = db.query(TheoryTopic).filter(TheoryTopic.parent_id == topic_id).count()
     if child_topics > 0:
-        logger.warning(f"Admin {admin.email} attempted to delete topic ID: {topic_id} with {child_topics} child topics")
+        logger.warning("Admin %s attempted to delete topic ID: %s with %s child topics", admin.email, topic_id, child_topics)
         raise HTTPException(
             status_code=400,
             detail=f"Невозможно удалить тему с дочерними темами. Сначала удалите {child_topics} дочерних тем."
@@ -1246,8 +1356,9 @@ async def admin_delete_topic(
     # Удаляем тему
     db.delete(topic)
     db.commit()
+    publish("topic", topic_id)
 
-    logger.info(f"Topic ID: {topic_id} deleted by admin: {admin.email}")
+    logger.info("Topic ID: %s deleted by admin: %s", topic_id, admin.email)
 
     # Перенаправляем на родительскую тему или на список тем
     if parent_id:
@@ -1284,7 +1395,7 @@ async def admin_categories(
     # Получаем типы экзаменов
     exam_types = get_exam_types(db)
 
-    logger.info(f"Category management accessed by admin: {admin.email}")
+    logger.info("Category management accessed by admin: %s", admin.email)
     return templates.TemplateResponse(
         "admin/categories.html",
         {
@@ -1318,7 +1429,7 @@ async def admin_add_category(
         ).first()
 
         if existing_category:
-            logger.warning(f"Attempt to create duplicate category '{name}' by admin: {admin.email}")
+            logger.warning("Attempt to create duplicate category '%s' by admin: %s", name, admin.email)
             # Получаем типы экзаменов
             exam_types = get_exam_types(db)
 
@@ -1348,11 +1459,11 @@ async def admin_add_category(
         db.add(category)
         db.commit()
 
-        logger.info(f"New category '{name}' added by admin: {admin.email}")
+        logger.info("New category '%s' added by admin: %s", name, admin.email)
 
     except IntegrityError as e:
         db.rollback()
-        logger.error(f"Integrity error when adding category '{name}' by admin: {admin.email}. Error: {str(e)}")
+        logger.error("Integrity error when adding category '%s' by admin: %s. Error: %s", name, admin.email, e)
         # Получаем типы экзаменов
         exam_types = get_exam_types(db)
 
@@ -1373,7 +1484,7 @@ async def admin_add_category(
 
     except Exception as e:
         db.rollback()
-        logger.error(f"Error adding category '{name}': {str(e)}")
+        logger.error("Error adding category '%s': %s", name, e)
         logger.exception("Exception details:")
         # Получаем типы экзаменов
         exam_types = get_exam_types(db)
@@ -1433,28 +1544,42 @@ async def admin_edit_category(
             if existing_category:
                 raise HTTPException(status_code=400, detail="Категория с таким названием уже существует")
 
+        old_name = category.name
+
         # Обновляем данные категории
         category.name = name
         category.exam_type = exam_type
         category.description = description
 
-        # Если категория изменила имя, обновляем поле category у вопросов
-        if category.name != name:
-            for question in category.questions:
-                question.category = name
+        # Если категория изменила имя, обновляем поле category у вопросов одним UPDATE в той же транзакции,
+        # а вместе с ним статистику пользователей и агрегаты аналитики, которые хранят имя категории
+        renamed_count = 0
+        if old_name != name:
+            renamed_count = db.query(Question).filter(
+                Question.category_id == category_id
+            ).update({Question.category: name}, synchronize_session=False)
+            rename_user_category_stats(db, old_name, name)
+            rename_category_rollups(db, old_name, name)
 
         db.commit()
+        publish("category", category_id)
 
-        logger.info(f"Category ID: {category_id} updated by admin: {admin.email}")
+        logger.info(
+            "Category ID: %s updated by admin: %s, questions renamed: %s",
+            category_id, admin.email, renamed_count
+        )
+
+    except HTTPException:
+        raise
 
     except IntegrityError as e:
         db.rollback()
-        logger.error(f"Integrity error when updating category ID: {category_id} by admin: {admin.email}")
+        logger.error("Integrity error when updating category ID: %s by admin: %s", category_id, admin.email)
         raise HTTPException(status_code=400, detail="Ошибка при обновлении категории") from e
 
     except Exception as e:
         db.rollback()
-        logger.error(f"Error updating category: {str(e)}")
+        logger.error("Error updating category: %s", e)
         raise HTTPException(status_code=500, detail=f"Ошибка при обновлении категории: {str(e)}") from e
 
     # Перенаправляем на страницу со списком категорий
@@ -1481,22 +1606,30 @@ async def admin_delete_question_category(
         ).first()
 
         if not category:
-            logger.warning(f"Admin {admin.email} attempted to delete non-existent category ID: {category_id}")
+            logger.warning("Admin %s attempted to delete non-existent category ID: %s", admin.email, category_id)
             raise HTTPException(status_code=404, detail="Категория не найдена")
 
-        # Обновляем связанные вопросы
-        for question in category.questions:
-            question.category_id = None
-
-        # Удаляем категорию
-        db.delete(category)
+        # Отвязываем вопросы и удаляем категорию без загрузки вопросов в сессию
+        unlinked_count = db.query(Question).filter(
+            Question.category_id == category_id
+        ).update({Question.category_id: None}, synchronize_session=False)
+        db.query(QuestionCategory).filter(
+            QuestionCategory.id == category_id
+        ).delete(synchronize_session=False)
         db.commit()
+        publish("category", category_id)
+
+        logger.info(
+            "Category ID: %s deleted by admin: %s, questions unlinked: %s",
+            category_id, admin.email, unlinked_count
+        )
 
-        logger.info(f"Category ID: {category_id} deleted by admin: {admin.email}")
+    except HTTPException:
+        raise
 
     except Exception as e:
         db.rollback()
-        logger.error(f"Error deleting category: {str(e)}")
+        logger.error("Error deleting category: %s", e)
         raise HTTPException(status_code=500, detail=f"Ошибка при удалении категории: {str(e)}") from e
 
     # Перенаправляем на страницу со списком категорий
@@ -23,6 +23,7 @@ from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
 from database import get_db
+from metrics import LOGINS, time_password
 from models import User
 from schemas import UserCreate
 
@@ -43,11 +44,13 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 class AuthService:
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str):
-        return pwd_context.verify(plain_password, hashed_password)
+        with time_password("verify"):
+            return pwd_context.verify(plain_password, hashed_password)
 
     @staticmethod
     def get_password_hash(password: str):
-        return pwd_context.hash(password)
+        with time_password("hash"):
+            return pwd_context.hash(password)
 
     @staticmethod
     def create_access_token(data: dict):
@@ -64,6 +67,14 @@ class AuthService:
         except JWTError:
             return None
 
+    @staticmethod
+    def get_token_payload(request: Request, token: str):
+        """Полезная нагрузка токена; токен, уже проверенный middleware, повторно не декодируется"""
+        state = request.scope.get("state", {}) if request else {}
+        if token and state.get("auth_token") == token:
+            return state["auth_payload"]
+        return AuthService.decode_access_token(token)
+
     @staticmethod
     def set_auth_cookie(response: Response, token: str):
         """Устанавливает куки с токеном авторизации"""
@@ -101,17 +112,17 @@ def get_current_user(
         logger.warning("No authentication token provided")
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
-    payload = AuthService.decode_access_token(auth_token)
+    payload = AuthService.get_token_payload(request, auth_token)
     if payload is None or "sub" not in payload:
         logger.warning("Invalid authentication attempt with token")
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
     user = db.query(User).filter(User.email == payload["sub"]).first()
     if user is None:
-        logger.warning(f"Authentication attempt with valid token but user not found: {payload['sub']}")
+        logger.warning("Authentication attempt with valid token but user not found: %s", payload['sub'])
         raise HTTPException(status_code=401, detail="User not found")
 
-    logger.info(f"User authenticated: {user.email}")
+    logger.info("User authenticated: %s", user.email, extra={"sample": True})
     return user
 
 
@@ -121,7 +132,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db), request
 
     existing_user = db.query(User).filter(User.email == user_data.email).first()
     if existing_user:
-        logger.warning(f"Registration attempt with existing email: {user_data.email} from IP: {client_ip}")
+        logger.warning("Registration attempt with existing email: %s from IP: %s", user_data.email, client_ip)
         raise HTTPException(status_code=400, detail="Email already registered")
 
     hashed_password = AuthService.get_password_hash(user_data.password)
@@ -129,7 +140,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db), request
     db.add(db_user)
     db.commit()
 
-    logger.info(f"New user registered: {user_data.email} from IP: {client_ip}")
+    logger.info("New user registered: %s from IP: %s", user_data.email, client_ip)
     return {"message": "User created successfully"}
 
 
@@ -144,15 +155,22 @@ async def login(
 
     user = db.query(User).filter(User.email == form_data.username).first()
     if not user or not AuthService.verify_password(form_data.password, user.hashed_password):
-        logger.warning(f"Failed login attempt for user: {form_data.username} from IP: {client_ip}")
+        LOGINS.labels("failure").inc()
+        logger.warning("Failed login attempt for user: %s from IP: %s", form_data.username, client_ip)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token = AuthService.create_access_token(data={"sub": user.email})
-    logger.info(f"Successful login: {user.email} from IP: {client_ip}")
+    # Признак администратора в токене нужен только для отладочной трассировки (debug_trace);
+    # права в админке по-прежнему проверяются по БД
+    token_data = {"sub": user.email}
+    if user.is_superuser:
+        token_data["adm"] = True
+    access_token = AuthService.create_access_token(data=token_data)
+    LOGINS.labels("success").inc()
+    logger.info("Successful login: %s from IP: %s", user.email, client_ip)
 
     # Устанавливаем токен в куки
     AuthService.set_auth_cookie(response, access_token)
@@ -171,10 +189,10 @@ async def check_admin_rights(
         user = get_current_user(request, credentials, db)
 
         if not user.is_superuser:
-            logger.warning(f"Admin access attempt by non-admin user: {user.email}")
+            logger.warning("Admin access attempt by non-admin user: %s", user.email)
             raise HTTPException(status_code=403, detail="Not an admin")
 
-        logger.info(f"Admin access granted to: {user.email}")
+        logger.info("Admin access granted to: %s", user.email, extra={"sample": True})
         return {"is_admin": True}
     except HTTPException:
         # Re-raise the exception
@@ -0,0 +1,149 @@
+import logging
+import os
+import threading
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from sqlalchemy import inspect, text
+
+import warmup
+from database import Base, SessionLocal, engine
+from exam_builder import EXAM_TYPES, get_candidate_pool
+
+logger = logging.getLogger("health")
+
+router = APIRouter(
+    prefix="/health",
+    tags=["health"],
+)
+
+# Сколько секунд переиспользуется результат проверки (частые пробы балансировщика не нагружают БД)
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "5"))
+# Схема меняется только при деплое, поэтому ее сверяем реже
+HEALTH_SCHEMA_CACHE_SECONDS = float(os.getenv("HEALTH_SCHEMA_CACHE_SECONDS", "60"))
+
+
+class CachedProbe:
+    """
+    Проверка с кэшированием результата.
+
+    Пока одна проверка выполняется, остальные запросы получают предыдущий результат
+    и не встают в очередь к БД. Проверка возвращает (ok, details).
+    """
+
+    def __init__(self, name, check, ttl):
+        self.name = name
+        self.check = check
+        self.ttl = ttl
+        self.result = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.result is not None and time.monotonic() - self.checked_at < self.ttl:
+            return self.result
+        # Проверка уже идет в другом потоке: отдаем последний известный результат
+        if not self.lock.acquire(blocking=self.result is None):
+            return self.result
+        try:
+            if self.result is None or time.monotonic() - self.checked_at >= self.ttl:
+                self.result = self._run()
+                self.checked_at = time.monotonic()
+            return self.result
+        finally:
+            self.lock.release()
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            ok, details = self.check()
+        except Exception as e:
+            logger.warning("Health probe %s failed: %s", self.name, e)
+            ok, details = False, {"error": str(e)}
+        return {
+            "ok": ok,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+            **details
+        }
+
+
+def check_database():
+    """Соединение из общего пула и простой запрос"""
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    return True, {}
+
+
+def check_migrations():
+    """Сверяет таблицы, столбцы и именованные ограничения уникальности с моделями"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    pending = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            pending.append(table.name)
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        pending.extend(f"{table.name}.{column.name}" for column in table.columns if column.name not in columns)
+        constraints = {constraint["name"] for constraint in inspector.get_unique_constraints(table.name)}
+        pending.extend(
+            f"{table.name}.{constraint.name}"
+            for constraint in table.constraints
+            if constraint.__visit_name__ == "unique_constraint" and constraint.name and constraint.name not in constraints
+        )
+    return not pending, {"pending": pending}
+
+
+def check_cache():
+    """Пулы вопросов для всех типов экзамена загружены (при необходимости загружаются)"""
+    db = SessionLocal()
+    try:
+        pools = {exam_type: len(get_candidate_pool(db, exam_type)) for exam_type in EXAM_TYPES}
+    finally:
+        db.close()
+    return True, {"candidate_pools": pools}
+
+
+def check_warmup():
+    """Прогрев при старте завершен"""
+    return warmup.is_complete(), warmup.status()
+
+
+READINESS_PROBES = [
+    CachedProbe("database", check_database, HEALTH_CACHE_SECONDS),
+    # Флаг в памяти: проверяется при каждом запросе, чтобы готовность наступала сразу после прогрева
+    CachedProbe("warmup", check_warmup, 0),
+    CachedProbe("migrations", check_migrations, HEALTH_SCHEMA_CACHE_SECONDS),
+    CachedProbe("cache", check_cache, HEALTH_CACHE_SECONDS),
+]
+
+
+@router.get("")
+async def health_check():
+    """Проверка работоспособности API"""
+    return {"status": "ok"}
+
+
+@router.get("/live")
+async def liveness():
+    """Процесс жив и обрабатывает запросы (без обращения к БД)"""
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+def readiness():
+    """Готовность принимать трафик: БД, схема и кэши; 503, если что-то не готово"""
+    checks = {}
+    ready = True
+    for probe in READINESS_PROBES:
+        # Без БД остальные проверки не имеют смысла
+        if checks and not checks["database"]["ok"]:
+            checks[probe.name] = {"ok": False, "skipped": True}
+            continue
+        checks[probe.name] = probe.get()
+        ready = ready and checks[probe.name]["ok"]
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ok" if ready else "unavailable", "checks": checks}
+    )
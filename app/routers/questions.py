@@ -1,15 +1,34 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, Form, HTTPException, Query, Request, Security
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 
-from database import get_db
+import debug_trace
+from answer_store import upsert_user_answers
+from database import get_db, get_read_db
+from exam_builder import (
+    EXAM_MAX_PAGE_SIZE,
+    EXAM_MAX_QUESTION_COUNT,
+    EXAM_PAGE_SIZE,
+    EXAM_QUESTION_COUNT,
+    EXAM_TYPES,
+    build_exam,
+    exam_type_label,
+    get_exam_facets,
+    load_questions,
+)
+from history import HISTORY_PAGE_SIZE, attempt_to_dict, fetch_history_page
+from invalidation import publish
+from metrics import QUESTIONS_PER_TEST, TESTS_STARTED, TESTS_SUBMITTED
 from models import Answer, Question, TestAttempt, User, UserAnswer
+from payloads import json_response, question_payload, questions_payload
 from routers.auth import AuthService
-from schemas import QuestionCreate, QuestionResponse
+from schemas import AnswersPatch, QuestionCreate, QuestionResponse
+from stats import get_user_stats, update_user_stats
+from templating import templates
 
 router = APIRouter(
     prefix="/questions",
@@ -17,7 +36,6 @@ router = APIRouter(
     responses={404: {"description": "Не найдено"}},
 )
 
-templates = Jinja2Templates(directory="templates")
 security = HTTPBearer(auto_error=False)
 
 
@@ -29,6 +47,25 @@ async def get_current_user(
     token: Optional[str] = Query(None)
 ):
     """Получение текущего пользователя из токена"""
+    return _authenticate(request, db, credentials, token)
+
+
+async def get_current_reader(
+    request: Request,
+    db: Session = Depends(get_read_db),
+    credentials: Optional[HTTPAuthorizationCredentials] = Security(security),
+    token: Optional[str] = Query(None)
+):
+    """Текущий пользователь для эндпоинтов на get_read_db: та же сессия, без второго соединения"""
+    return _authenticate(request, db, credentials, token)
+
+
+def _authenticate(
+    request: Request,
+    db: Session,
+    credentials: Optional[HTTPAuthorizationCredentials],
+    token: Optional[str]
+) -> User:
     auth_token = None
 
     # Приоритет 1: Проверяем куки
@@ -50,7 +87,7 @@ async def get_current_user(
 
     try:
         # Верификация токена
-        payload = AuthService.decode_access_token(auth_token)
+        payload = AuthService.get_token_payload(request, auth_token)
         if payload is None or "sub" not in payload:
             raise HTTPException(
                 status_code=403,
@@ -95,51 +132,45 @@ async def create_question(question: QuestionCreate, db: Session = Depends(get_db
         db.add(db_answer)
 
     db.commit()
+    publish("question", db_question.id)
     db.refresh(db_question)
     return db_question
 
 
 @router.get("/", response_model=List[QuestionResponse])
-async def read_questions(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def read_questions(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     """Получение списка вопросов"""
-    questions = db.query(Question).offset(skip).limit(limit).all()
-    return questions
+    # Ответ собирается из готовых JSON вопросов, без проверки схемой
+    question_ids = [
+        question_id for (question_id,) in
+        db.query(Question.id).order_by(Question.id).offset(skip).limit(limit)
+    ]
+    return json_response(await run_in_threadpool(questions_payload, db, question_ids))
 
 
 @router.get("/test", response_model=None)
 async def test_page(
     request: Request,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    user: User = Depends(get_current_reader),
     exam_type: Optional[str] = Query(None)
 ):
     """Страница выбора категорий и сложности для теста (требует авторизации)"""
-    # Получаем категории для RHCSA
-    rhcsa_categories = db.query(Question.category).filter(
-        Question.exam_type == 'rhcsa'
-    ).distinct().all()
-    rhcsa_categories = [cat[0] for cat in rhcsa_categories]
-
-    # Получаем категории для CKA
-    cka_categories = db.query(Question.category).filter(
-        Question.exam_type == 'cka'
-    ).distinct().all()
-    cka_categories = [cat[0] for cat in cka_categories]
-
-    # Получаем все уникальные уровни сложности
-    difficulties = db.query(Question.difficulty).distinct().all()
-    difficulties = [diff[0] for diff in difficulties]
+    # Категории и уровни сложности берутся из кэшированных пулов вопросов
+    # (загрузка пула и ожидание чужой загрузки идут вне цикла событий)
+    categories, difficulties = await run_in_threadpool(get_exam_facets, db)
 
     return templates.TemplateResponse(
         "test_categories.html",
         {
             "request": request,
-            "rhcsa_categories": rhcsa_categories,
-            "cka_categories": cka_categories,
+            "rhcsa_categories": categories["rhcsa"],
+            "cka_categories": categories["cka"],
             "difficulties": difficulties,
             "title": "Выбор параметров для тестирования",
             "user": user,
-            "selected_exam_type": exam_type
+            "selected_exam_type": exam_type,
+            "question_count": EXAM_QUESTION_COUNT
         }
     )
 
@@ -153,13 +184,10 @@ async def start_test(
     """Начать тест с выбранными категориями и сложностью"""
     form_data = await request.form()
 
-    # Отладочная информация
-    print("DEBUG: Form data:")
-    for key, value in form_data.items():
-        print(f"DEBUG: {key}: {value}")
-
     # Получаем выбранный тип экзамена
     exam_type = form_data.get("exam_type", "rhcsa")
+    if exam_type not in EXAM_TYPES:
+        raise HTTPException(status_code=400, detail="Неизвестный тип экзамена")
 
     # Получаем выбранные категории из формы
     selected_categories = []
@@ -167,59 +195,185 @@ async def start_test(
         if key.startswith("category_"):
             selected_categories.append(value)
 
-    print(f"DEBUG: Selected categories: {selected_categories}")
-
     # Получаем выбранные уровни сложности из формы
     selected_difficulties = []
     for key, value in form_data.items():
         if key.startswith("difficulty_"):
             selected_difficulties.append(value)
 
-    print(f"DEBUG: Selected difficulties: {selected_difficulties}")
-
-    # Строим запрос на основе выбранных фильтров
-    query = db.query(Question).filter(Question.exam_type == exam_type)
-
-    # Применяем фильтр по категориям, если они выбраны
-    if selected_categories:
-        query = query.filter(Question.category.in_(selected_categories))
-
-    # Применяем фильтр по сложности, если она выбрана
-    if selected_difficulties:
-        query = query.filter(Question.difficulty.in_(selected_difficulties))
+    if debug_trace.enabled():
+        debug_trace.event(
+            "start_test.form",
+            # Только имена полей: значения формы в лог не пишутся
+            fields=sorted(form_data.keys()),
+            exam_type=exam_type,
+            categories=selected_categories,
+            difficulties=selected_difficulties
+        )
 
-    # Получаем отфильтрованные вопросы
-    questions = query.all()
+    # Количество вопросов в тесте
+    try:
+        question_count = int(form_data.get("question_count", EXAM_QUESTION_COUNT))
+    except ValueError:
+        question_count = EXAM_QUESTION_COUNT
+    question_count = max(1, min(question_count, EXAM_MAX_QUESTION_COUNT))
+
+    # Собираем тест с учетом слабых тем пользователя (пул вопросов может загружаться из БД)
+    question_ids = await run_in_threadpool(
+        build_exam,
+        db,
+        user.id,
+        exam_type,
+        categories=selected_categories,
+        difficulties=selected_difficulties,
+        count=question_count
+    )
 
     # Создаем новую попытку прохождения теста
     test_attempt = TestAttempt(
         user_id=user.id,
         start_time=datetime.utcnow(),
-        max_score=len(questions)
+        max_score=len(question_ids),
+        exam_type=exam_type,
+        question_ids=question_ids,
+        filters={
+            "categories": selected_categories,
+            "difficulties": selected_difficulties
+        }
     )
     db.add(test_attempt)
     db.commit()
     db.refresh(test_attempt)
 
+    TESTS_STARTED.labels(exam_type_label(exam_type)).inc()
+    QUESTIONS_PER_TEST.labels(exam_type_label(exam_type)).observe(len(question_ids))
+
+    return render_exam(request, user, test_attempt)
+
+
+def get_open_attempt(db: Session, user: User, attempt_id: int) -> TestAttempt:
+    """Незавершенная попытка пользователя с сохраненной сессией теста"""
+    test_attempt = db.query(TestAttempt).filter(
+        TestAttempt.id == attempt_id,
+        TestAttempt.user_id == user.id
+    ).first()
+
+    if not test_attempt or test_attempt.question_ids is None:
+        raise HTTPException(status_code=404, detail="Попытка прохождения теста не найдена")
+
+    if test_attempt.end_time is not None:
+        raise HTTPException(status_code=400, detail="Тест уже завершен")
+
+    return test_attempt
+
+
+def render_exam(request: Request, user: User, test_attempt: TestAttempt):
+    """Каркас страницы теста, вопросы подгружаются порциями через JSON API"""
+    filters = test_attempt.filters or {}
+    exam_type = test_attempt.exam_type or "rhcsa"
+
     # Определяем заголовок в зависимости от типа экзамена
     test_title = "Теоретический тест RHCSA" if exam_type == "rhcsa" else "Теоретический тест CKA"
 
-    # Add selected categories as hidden fields to pass them to the results page
     return templates.TemplateResponse(
         "test.html",
         {
             "request": request,
-            "questions": questions,
+            "total_questions": len(test_attempt.question_ids),
+            "page_size": EXAM_PAGE_SIZE,
             "title": test_title,
             "test_attempt_id": test_attempt.id,
             "user": user,
             "exam_type": exam_type,
-            "selected_categories": selected_categories,
-            "selected_difficulties": selected_difficulties
+            "selected_categories": filters.get("categories", []),
+            "selected_difficulties": filters.get("difficulties", [])
         }
     )
 
 
+@router.get("/attempts/{attempt_id}", response_model=None)
+async def resume_test(
+    request: Request,
+    attempt_id: int,
+    db: Session = Depends(get_read_db),
+    user: User = Depends(get_current_reader)
+):
+    """Продолжение незавершенного теста (например, после обрыва соединения)"""
+    test_attempt = get_open_attempt(db, user, attempt_id)
+    return render_exam(request, user, test_attempt)
+
+
+@router.get("/attempts/{attempt_id}/questions", response_model=None)
+async def attempt_questions(
+    attempt_id: int,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(EXAM_PAGE_SIZE, ge=1, le=EXAM_MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+    user: User = Depends(get_current_reader)
+):
+    """Порция вопросов незавершенного теста (без признака правильности ответов)"""
+    test_attempt = get_open_attempt(db, user, attempt_id)
+
+    issued_ids = test_attempt.question_ids
+    page_ids = issued_ids[offset:offset + limit]
+    next_offset = offset + limit if offset + limit < len(issued_ids) else None
+
+    questions_by_id = {question.id: question for question in load_questions(db, page_ids)}
+
+    # Сохраненные ответы (автосохранение пишет их в БД сразу)
+    saved = dict(db.query(UserAnswer.question_id, UserAnswer.answer_id).filter(
+        UserAnswer.test_attempt_id == test_attempt.id,
+        UserAnswer.question_id.in_(page_ids)
+    ).all()) if page_ids else {}
+
+    items = []
+    for number, question_id in enumerate(page_ids, start=offset + 1):
+        question = questions_by_id.get(question_id)
+        if not question:
+            continue
+        items.append({
+            "id": question.id,
+            "number": number,
+            "text": question.text,
+            "difficulty": question.difficulty,
+            "category": question.category,
+            "answers": [{"id": answer.id, "text": answer.text} for answer in question.answers],
+            "selected_answer_id": saved.get(question.id)
+        })
+
+    return {
+        "total": len(issued_ids),
+        "offset": offset,
+        "next_offset": next_offset,
+        "items": items
+    }
+
+
+@router.patch("/attempts/{attempt_id}/answers", response_model=None)
+async def autosave_answers(
+    attempt_id: int,
+    payload: AnswersPatch,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user)
+):
+    """Автосохранение ответов: подтверждаются только ответы, уже записанные в БД"""
+    test_attempt = get_open_attempt(db, user, attempt_id)
+
+    # Принимаем ответы только на выданные в этой попытке вопросы
+    issued_ids = set(test_attempt.question_ids)
+    accepted = {
+        question_id: answer_id
+        for question_id, answer_id in payload.answers.items()
+        if question_id in issued_ids
+    }
+    # Клиент сам откладывает и объединяет сохранения, поэтому запрос - один пакетный UPSERT
+    if accepted:
+        upsert_user_answers(db, {test_attempt.id: accepted})
+        db.commit()
+
+    return {"accepted": sorted(accepted)}
+
+
 @router.post("/submit", response_model=None)
 async def submit_test(
     request: Request,
@@ -228,94 +382,112 @@ async def submit_test(
     test_attempt_id: int = Form(...),
 ):
     """Отправка и проверка ответов на тест"""
-    # Получаем текущую попытку прохождения теста
+    # Получаем текущую попытку прохождения теста. Строка блокируется до commit:
+    # повторная отправка (двойной клик, повтор запроса) дождется завершения
+    # первой и увидит end_time, а не оценит тест второй раз
     test_attempt = db.query(TestAttempt).filter(
         TestAttempt.id == test_attempt_id,
         TestAttempt.user_id == user.id
-    ).first()
+    ).with_for_update().first()
 
     if not test_attempt:
         raise HTTPException(status_code=404, detail="Попытка прохождения теста не найдена")
 
-    # Завершаем попытку
-    test_attempt.end_time = datetime.utcnow()
+    if test_attempt.end_time is not None:
+        raise HTTPException(status_code=400, detail="Тест уже завершен")
 
     # Обрабатываем данные формы
     form_data = await request.form()
 
-    # Получаем выбранные категории и сложности
-    selected_categories = []
-    selected_difficulties = []
+    # Тип экзамена и фильтры берем из сохраненной сессии теста
+    filters = test_attempt.filters or {}
+    exam_type = test_attempt.exam_type or form_data.get("exam_type", "rhcsa")
+    selected_categories = filters.get("categories", [])
+    selected_difficulties = filters.get("difficulties", [])
 
-    # Получаем тип экзамена
-    exam_type = form_data.get("exam_type", "rhcsa")
-
-    # Получаем выбранные категории
+    # Ответы из формы: question_id -> answer_id
+    submitted = {}
     for key, value in form_data.items():
-        if key == "selected_categories":
-            selected_categories.append(value)
+        if key.startswith('question_'):
+            try:
+                submitted[int(key.replace('question_', ''))] = int(value)
+            except ValueError:
+                continue
+
+    stored = dict(db.query(UserAnswer.question_id, UserAnswer.answer_id).filter(
+        UserAnswer.test_attempt_id == test_attempt.id
+    ).all())
+
+    # Оцениваются только выданные вопросы; для старых попыток без сессии - присланные
+    issued_ids = test_attempt.question_ids
+    if issued_ids is None:
+        issued_ids = list(dict.fromkeys([*stored, *submitted]))
+
+    # Ответы из формы новее автосохраненных - дописываем их тем же UPSERT
+    issued_set = set(issued_ids)
+    submitted = {
+        question_id: answer_id
+        for question_id, answer_id in submitted.items()
+        if question_id in issued_set and stored.get(question_id) != answer_id
+    }
+    if submitted:
+        upsert_user_answers(db, {test_attempt.id: submitted})
+        stored.update(submitted)
 
-    # Получаем выбранные уровни сложности
-    for key, value in form_data.items():
-        if key == "selected_difficulties":
-            selected_difficulties.append(value)
+    # Завершаем попытку (после записи ответов: в завершенную попытку они не пишутся)
+    test_attempt.end_time = datetime.utcnow()
+
+    # Загружаем все вопросы вместе с вариантами ответов одним запросом
+    questions_by_id = {question.id: question for question in load_questions(db, issued_ids)}
 
     # Словарь для результатов
     results = {
         "score": 0,
-        "max_score": 0,
+        "max_score": len(issued_ids),
         "correct_answers": 0,
-        "total_questions": 0,
+        "total_questions": len(issued_ids),
         "details": []
     }
 
-    # Обрабатываем ответы
-    for key, value in form_data.items():
-        if key.startswith('question_') and key != 'test_attempt_id':
-            question_id = int(key.replace('question_', ''))
-            answer_id = int(value)
-
-            # Получаем вопрос и ответ
-            question = db.query(Question).filter(Question.id == question_id).first()
-            answer = db.query(Answer).filter(Answer.id == answer_id).first()
-
-            if question and answer:
-                results["total_questions"] += 1
-                results["max_score"] += 1
-
-                # Проверяем правильность ответа
-                is_correct = answer.is_correct
-                if is_correct:
-                    results["correct_answers"] += 1
-                    results["score"] += 1
-
-                # Сохраняем ответ пользователя
-                user_answer = UserAnswer(
-                    test_attempt_id=test_attempt.id,
-                    question_id=question_id,
-                    answer_id=answer_id,
-                    is_correct=is_correct
-                )
-                db.add(user_answer)
-
-                # Добавляем детали для отображения
-                correct_answer = db.query(Answer).filter(
-                    Answer.question_id == question_id,
-                    Answer.is_correct == True  # noqa: E712
-                ).first()
-
-                results["details"].append({
-                    "question_id": question_id,
-                    "question_text": question.text,
-                    "user_answer": answer.text,
-                    "is_correct": is_correct,
-                    "correct_answer": correct_answer.text if correct_answer else "Нет правильного ответа"
-                })
+    # Ответы для обновления статистики по категориям: (exam_type, category, is_correct)
+    graded_answers = []
+
+    # Обрабатываем ответы в порядке выдачи вопросов
+    for question_id in issued_ids:
+        question = questions_by_id.get(question_id)
+        if not question:
+            continue
+
+        answers_by_id = {answer.id: answer for answer in question.answers}
+        correct_answer = next((answer for answer in question.answers if answer.is_correct), None)
+        # Ответ засчитывается, только если он принадлежит этому вопросу
+        answer = answers_by_id.get(stored.get(question_id))
+        is_correct = bool(answer and answer.is_correct)
+
+        if is_correct:
+            results["correct_answers"] += 1
+            results["score"] += 1
+
+        if answer:
+            graded_answers.append((question.exam_type or "rhcsa", question.category, is_correct))
+
+        # Добавляем детали для отображения
+        results["details"].append({
+            "question_id": question_id,
+            "question_text": question.text,
+            "user_answer": answer.text if answer else "Нет ответа",
+            "is_correct": is_correct,
+            "correct_answer": correct_answer.text if correct_answer else "Нет правильного ответа"
+        })
 
     # Обновляем результаты теста
     test_attempt.score = results["score"]
     test_attempt.max_score = results["max_score"]
+
+    # Обновляем агрегированную статистику в той же транзакции
+    update_user_stats(db, test_attempt, graded_answers)
     db.commit()
+    TESTS_SUBMITTED.labels(exam_type_label(exam_type)).inc()
 
     # Рассчитываем процент правильных ответов
     results["percentage"] = (results["score"] / results["max_score"]) * 100 if results["max_score"] > 0 else 0
@@ -338,15 +510,29 @@ async def submit_test(
 @router.get("/history", response_model=None)
 async def test_history(
     request: Request,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user)
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    exam_type: Optional[str] = Query(None),
+    order: str = Query("desc"),
+    db: Session = Depends(get_read_db),
+    user: User = Depends(get_current_reader)
 ):
     """История прохождения тестов пользователя"""
-    # Получаем историю прохождения тестов
-    test_attempts = db.query(TestAttempt).filter(
-        TestAttempt.user_id == user.id,
-        TestAttempt.end_time.is_not(None)  # noqa: E711
-    ).order_by(TestAttempt.end_time.desc()).all()
+    # Получаем первую страницу истории, остальные подгружаются через /history/data
+    try:
+        test_attempts, next_cursor = fetch_history_page(
+            db,
+            user.id,
+            order=order,
+            date_from=date_from,
+            date_to=date_to,
+            exam_type=exam_type
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    # Агрегированная статистика читается из предрассчитанных таблиц
+    user_stats, category_stats = get_user_stats(db, user.id)
 
     return templates.TemplateResponse(
         "test_history.html",
@@ -354,15 +540,56 @@ async def test_history(
             "request": request,
             "title": "История тестирования",
             "test_attempts": test_attempts,
+            "next_cursor": next_cursor,
+            "filters": {
+                "date_from": date_from,
+                "date_to": date_to,
+                "exam_type": exam_type,
+                "order": order
+            },
+            "user_stats": user_stats,
+            "category_stats": category_stats,
             "user": user
         }
     )
 
 
+@router.get("/history/data", response_model=None)
+async def test_history_data(
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(HISTORY_PAGE_SIZE),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    exam_type: Optional[str] = Query(None),
+    order: str = Query("desc"),
+    db: Session = Depends(get_read_db),
+    user: User = Depends(get_current_reader)
+):
+    """Страница истории тестирования в формате JSON для бесконечной прокрутки"""
+    try:
+        test_attempts, next_cursor = fetch_history_page(
+            db,
+            user.id,
+            cursor=cursor,
+            limit=limit,
+            order=order,
+            date_from=date_from,
+            date_to=date_to,
+            exam_type=exam_type
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    return {
+        "items": [attempt_to_dict(attempt) for attempt in test_attempts],
+        "next_cursor": next_cursor
+    }
+
+
 @router.get("/{question_id}", response_model=QuestionResponse)
-async def read_question(question_id: int, db: Session = Depends(get_db)):
+async def read_question(question_id: int, db: Session = Depends(get_read_db)):
     """Получение конкретного вопроса по ID"""
-    question = db.query(Question).filter(Question.id == question_id).first()
-    if question is None:
+    payload = await run_in_threadpool(question_payload, db, question_id)
+    if payload is None:
         raise HTTPException(status_code=404, detail="Вопрос не найден")
-    return question
+    return json_response(payload)
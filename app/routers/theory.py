@@ -1,13 +1,21 @@
 from typing import List, Optional
 
+import orjson
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session, joinedload
 
-from database import get_db
+import debug_trace
+from database import get_db, get_read_db
+from invalidation import publish
 from models import Question, TheoryContent, TheoryResource, TheoryTopic, User
-from routers.questions import get_current_user
+from payloads import (
+    json_response,
+    topic_detail_payload,
+    topic_to_dict,
+)
+from routers.questions import get_current_reader, get_current_user
 from schemas import (
     TheoryContentCreate,
     TheoryResourceCreate,
@@ -17,6 +25,8 @@ from schemas import (
     TheoryTopicUpdate,
 )
 from schemas import TheoryResource as TheoryResourceSchema
+from templating import templates
+from theory_tree import get_root_topics
 
 router = APIRouter(
     prefix="/theory",
@@ -24,8 +34,6 @@ router = APIRouter(
     responses={404: {"description": "Не найдено"}},
 )
 
-templates = Jinja2Templates(directory="templates")
-
 
 # API для работы с темами теории
 @router.post("/topics/", response_model=TheoryTopicResponse)
@@ -55,6 +63,7 @@ async def create_topic(
     )
     db.add(db_topic)
     db.commit()
+    publish("topic", db_topic.id)
     db.refresh(db_topic)
     return db_topic
 
@@ -65,7 +74,7 @@ async def read_topics(
     parent_id: Optional[int] = None,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Получение списка тем теории с возможностью фильтрации"""
     query = db.query(TheoryTopic)
@@ -78,31 +87,24 @@ async def read_topics(
         query = query.filter(TheoryTopic.parent_id == parent_id)
     else:
         # Если parent_id не указан, возвращаем только корневые темы
-        query = query.filter(TheoryTopic.parent_id is None)
+        query = query.filter(TheoryTopic.parent_id.is_(None))
 
     # Сортируем по порядку отображения
     query = query.order_by(TheoryTopic.order)
 
     # Применяем пагинацию
     topics = query.offset(skip).limit(limit).all()
-    return topics
+    return json_response(orjson.dumps([topic_to_dict(topic) for topic in topics]))
 
 
 @router.get("/topics/{topic_id}", response_model=TheoryTopicDetail)
-async def read_topic(topic_id: int, db: Session = Depends(get_db)):
+async def read_topic(topic_id: int, db: Session = Depends(get_read_db)):
     """Получение детальной информации о теме теории"""
-    # Загружаем тему с содержимым, ресурсами, дочерними темами и вопросами
-    topic = db.query(TheoryTopic).options(
-        joinedload(TheoryTopic.content),
-        joinedload(TheoryTopic.resources),
-        joinedload(TheoryTopic.children),
-        joinedload(TheoryTopic.questions)
-    ).filter(TheoryTopic.id == topic_id).first()
-
-    if not topic:
+    payload = await run_in_threadpool(topic_detail_payload, db, topic_id)
+    if payload is None:
         raise HTTPException(status_code=404, detail="Тема не найдена")
 
-    return topic
+    return json_response(payload)
 
 
 @router.put("/topics/{topic_id}", response_model=TheoryTopicResponse)
@@ -153,6 +155,7 @@ async def update_topic(
         setattr(db_topic, key, value)
 
     db.commit()
+    publish("topic", topic_id)
     db.refresh(db_topic)
     return db_topic
 
@@ -183,6 +186,7 @@ async def delete_topic(
 
     db.delete(db_topic)
     db.commit()
+    publish("topic", topic_id)
     return {"message": "Тема успешно удалена"}
 
 
@@ -211,6 +215,7 @@ async def create_or_update_content(
         # Обновляем существующее содержимое
         existing_content.content = content.content
         db.commit()
+        publish("topic", topic_id)
         db.refresh(existing_content)
     else:
         # Создаем новое содержимое
@@ -220,6 +225,7 @@ async def create_or_update_content(
         )
         db.add(new_content)
         db.commit()
+        publish("topic", topic_id)
 
     # Возвращаем обновленную тему с содержимым
     return await read_topic(topic_id, db)
@@ -252,6 +258,7 @@ async def create_resource(
     )
     db.add(db_resource)
     db.commit()
+    publish("topic", topic_id)
     db.refresh(db_resource)
     return db_resource
 
@@ -272,8 +279,10 @@ async def delete_resource(
     if not db_resource:
         raise HTTPException(status_code=404, detail="Ресурс не найден")
 
+    topic_id = db_resource.topic_id
     db.delete(db_resource)
     db.commit()
+    publish("topic", topic_id)
     return {"message": "Ресурс успешно удален"}
 
 
@@ -307,6 +316,7 @@ async def link_question_to_topic(
     # Связываем вопрос с темой
     topic.questions.append(question)
     db.commit()
+    publish("topic", topic_id)
     return {"message": "Вопрос успешно связан с темой"}
 
 
@@ -339,6 +349,7 @@ async def unlink_question_from_topic(
     # Удаляем связь вопроса с темой
     topic.questions.remove(question)
     db.commit()
+    publish("topic", topic_id)
     return {"message": "Связь вопроса с темой успешно удалена"}
 
 
@@ -347,16 +358,12 @@ async def unlink_question_from_topic(
 async def theory_page(
     request: Request,
     exam_type: str = "rhcsa",
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_reader)
 ):
     """Страница с теоретическими материалами"""
-    # Получаем корневые темы для выбранного типа экзамена
-    # Используем .filter(TheoryTopic.parent_id.is_(None)) для SQLAlchemy
-    root_topics = db.query(TheoryTopic).filter(
-        TheoryTopic.parent_id.is_(None),
-        TheoryTopic.exam_type == exam_type
-    ).order_by(TheoryTopic.order).all()
+    # Корневые темы для выбранного типа экзамена (кэшируются)
+    root_topics = await run_in_threadpool(get_root_topics, db, exam_type)
 
     return templates.TemplateResponse(
         "theory_index.html",
@@ -374,8 +381,8 @@ async def theory_page(
 async def theory_topic_page(
     request: Request,
     topic_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_reader)
 ):
     """Страница с содержимым темы теории"""
     # Загружаем тему с содержимым, ресурсами, дочерними темами и вопросами
@@ -389,16 +396,13 @@ async def theory_topic_page(
     if not topic:
         raise HTTPException(status_code=404, detail="Тема не найдена")
 
-    # Отладка - выводим информацию о содержимом темы
-    if hasattr(topic, 'content') and topic.content:
-        content_items = topic.content
-        if content_items and len(content_items) > 0:
-            print(f"DEBUG: Topic {topic_id} has {len(content_items)} content items")
-            print(f"DEBUG: First content item: {content_items[0].content[:100]}...")
-        else:
-            print(f"DEBUG: Topic {topic_id} has empty content list")
-    else:
-        print(f"DEBUG: Topic {topic_id} has no content attribute")
+    if debug_trace.enabled():
+        debug_trace.event(
+            "theory_topic.content",
+            topic_id=topic_id,
+            content_items=len(topic.content),
+            preview=topic.content[0].content[:100] if topic.content else None
+        )
 
     # Получаем путь к теме (хлебные крошки)
     breadcrumbs = []
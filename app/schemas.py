@@ -46,6 +46,11 @@ class QuestionResponse(QuestionBase):
         orm_mode = True
 
 
+class AnswersPatch(BaseModel):
+    """Схема для автосохранения ответов: question_id -> answer_id"""
+    answers: Dict[int, int]
+
+
 class UserBase(BaseModel):
     """Базовая схема пользователя"""
     email: str
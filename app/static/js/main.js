@@ -23,6 +23,215 @@ function getCookie(name) {
     return null;
 }
 
+// Постраничная выдача теста: вопросы подгружаются порциями с предзагрузкой следующей
+function initPagedExam(container) {
+    const attemptId = container.dataset.attemptId;
+    const total = parseInt(container.dataset.total, 10);
+    const pageSize = parseInt(container.dataset.pageSize, 10) || 10;
+    const form = document.getElementById('test-form');
+    const loader = document.getElementById('exam-loader');
+    const sentinel = document.getElementById('exam-sentinel');
+    const answeredCounter = document.getElementById('exam-answered');
+    const storageKey = 'exam_answers_' + attemptId;
+    const difficultyColors = {easy: 'success', medium: 'warning', hard: 'danger'};
+
+    // Выбранные ответы: question_id -> answer_id (копия в localStorage на случай потери соединения)
+    let answers = {};
+    try {
+        answers = JSON.parse(localStorage.getItem(storageKey)) || {};
+    } catch (e) {
+        answers = {};
+    }
+
+    // Ответы, еще не подтвержденные сервером
+    let pending = {...answers};
+    let saveTimer = null;
+
+    let nextOffset = 0;
+    let prefetched = null;
+    let loading = false;
+
+    // Адрес страницы позволяет продолжить тест после перезагрузки или обрыва соединения
+    history.replaceState(null, '', `/questions/attempts/${attemptId}`);
+
+    function saveAnswers(keepalive) {
+        clearTimeout(saveTimer);
+        const batch = {...pending};
+        if (!Object.keys(batch).length) return;
+
+        fetch(`/questions/attempts/${attemptId}/answers`, {
+            method: 'PATCH',
+            credentials: 'same-origin',
+            keepalive: !!keepalive,
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({answers: batch})
+        }).then(response => {
+            if (!response.ok) {
+                throw new Error('HTTP ' + response.status);
+            }
+            // Снимаем с ожидания только ответы, которые не менялись во время запроса
+            Object.entries(batch).forEach(([questionId, answerId]) => {
+                if (pending[questionId] === answerId) {
+                    delete pending[questionId];
+                }
+            });
+        }).catch(e => {
+            console.error('Ошибка автосохранения ответов:', e);
+            saveTimer = setTimeout(saveAnswers, 5000);
+        });
+    }
+
+    function fetchBatch(offset) {
+        return fetch(`/questions/attempts/${attemptId}/questions?offset=${offset}&limit=${pageSize}`, {
+            credentials: 'same-origin'
+        }).then(response => {
+            if (!response.ok) {
+                throw new Error('HTTP ' + response.status);
+            }
+            return response.json();
+        });
+    }
+
+    function createElement(tag, className, text) {
+        const element = document.createElement(tag);
+        if (className) element.className = className;
+        if (text !== undefined) element.textContent = text;
+        return element;
+    }
+
+    function renderQuestion(question) {
+        const card = createElement('div', 'card mb-4');
+
+        const header = createElement('div', 'card-header d-flex justify-content-between');
+        header.appendChild(createElement('span', null, 'Вопрос ' + question.number));
+        header.appendChild(createElement('span', 'badge bg-' + (difficultyColors[question.difficulty] || 'danger'), question.difficulty));
+        card.appendChild(header);
+
+        const body = createElement('div', 'card-body');
+        body.appendChild(createElement('h5', 'card-title', question.text));
+        const options = createElement('div', 'mt-3');
+        question.answers.forEach(answer => {
+            const option = createElement('div', 'form-check mb-2');
+            const input = createElement('input', 'form-check-input');
+            input.type = 'radio';
+            input.name = 'question_' + question.id;
+            input.id = 'answer_' + answer.id;
+            input.value = answer.id;
+            input.checked = String(answers[question.id] || question.selected_answer_id) === String(answer.id);
+            const label = createElement('label', 'form-check-label', answer.text);
+            label.htmlFor = input.id;
+            option.appendChild(input);
+            option.appendChild(label);
+            options.appendChild(option);
+        });
+        body.appendChild(options);
+        card.appendChild(body);
+
+        card.appendChild(createElement('div', 'card-footer text-muted', 'Категория: ' + question.category));
+        return card;
+    }
+
+    function updateCounter() {
+        if (answeredCounter) {
+            answeredCounter.textContent = Object.keys(answers).length;
+        }
+    }
+
+    async function loadNext() {
+        if (loading || nextOffset === null) return;
+        loading = true;
+        try {
+            const batch = await (prefetched || fetchBatch(nextOffset));
+            prefetched = null;
+            batch.items.forEach(question => {
+                if (question.selected_answer_id && !(question.id in answers)) {
+                    answers[question.id] = String(question.selected_answer_id);
+                }
+                container.appendChild(renderQuestion(question));
+            });
+            updateCounter();
+            nextOffset = batch.next_offset;
+
+            if (nextOffset !== null) {
+                // Сразу запрашиваем следующую порцию, пока пользователь отвечает на текущую
+                prefetched = fetchBatch(nextOffset);
+                prefetched.catch(() => {
+                    prefetched = null;
+                });
+            } else {
+                loader.style.display = 'none';
+                observer.disconnect();
+                return;
+            }
+        } catch (e) {
+            prefetched = null;
+            console.error('Ошибка при загрузке вопросов:', e);
+            loader.textContent = 'Не удалось загрузить вопросы. Прокрутите страницу, чтобы повторить попытку.';
+            return;
+        } finally {
+            loading = false;
+        }
+
+        // Повторная подписка вызовет обработчик снова, если конец списка все еще виден
+        observer.unobserve(sentinel);
+        observer.observe(sentinel);
+    }
+
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadNext();
+        }
+    }, {rootMargin: '600px'});
+    observer.observe(sentinel);
+
+    container.addEventListener('change', function(e) {
+        if (e.target.type === 'radio') {
+            const questionId = e.target.name.replace('question_', '');
+            answers[questionId] = e.target.value;
+            pending[questionId] = e.target.value;
+            localStorage.setItem(storageKey, JSON.stringify(answers));
+            updateCounter();
+
+            // Ответы отправляются пачкой после паузы в выборе
+            clearTimeout(saveTimer);
+            saveTimer = setTimeout(saveAnswers, 1000);
+        }
+    });
+
+    // При уходе со страницы отправляем несохраненные ответы
+    document.addEventListener('visibilitychange', function() {
+        if (document.visibilityState === 'hidden') {
+            saveAnswers(true);
+        }
+    });
+
+    form.addEventListener('submit', function(e) {
+        const answered = Object.keys(answers).length;
+        if (answered < total && !confirm(`Вы ответили на ${answered} из ${total} вопросов. Отправить ответы?`)) {
+            e.preventDefault();
+            return;
+        }
+
+        // Сохраненные ответы уже на сервере: отправляем только неподтвержденные
+        clearTimeout(saveTimer);
+        container.querySelectorAll('input').forEach(input => {
+            input.disabled = true;
+        });
+        Object.entries(pending).forEach(([questionId, answerId]) => {
+            const input = document.createElement('input');
+            input.type = 'hidden';
+            input.name = 'question_' + questionId;
+            input.value = answerId;
+            form.appendChild(input);
+        });
+        localStorage.removeItem(storageKey);
+    });
+
+    updateCounter();
+    // Досылаем ответы, сохраненные локально до обрыва соединения
+    saveAnswers();
+}
+
 document.addEventListener('DOMContentLoaded', function() {
     // Проверка авторизации и прав администратора
     const token = getCookie('access_token');
@@ -210,6 +419,12 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
     
+    // Постраничная загрузка вопросов теста
+    const examContainer = document.getElementById('exam-questions');
+    if (examContainer) {
+        initPagedExam(examContainer);
+    }
+    
     // Анимация для карточек на главной странице
     const cards = document.querySelectorAll('.card');
     cards.forEach(card => {
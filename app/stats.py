@@ -0,0 +1,209 @@
+"""Инкрементально обновляемая статистика пользователей по тестам"""
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from models import Question, TestAttempt, UserAnswer, UserCategoryStats, UserStats
+
+
+def _percentage(score, max_score):
+    """Процент правильных ответов для попытки"""
+    return (score / max_score) * 100 if max_score else 0
+
+
+def update_user_stats(db: Session, test_attempt: TestAttempt, graded_answers):
+    """
+    Обновляет агрегаты пользователя по результатам завершенной попытки.
+
+    Вызывается внутри транзакции submit_test до commit, поэтому статистика
+    фиксируется атомарно вместе с самой попыткой.
+    graded_answers - последовательность кортежей (exam_type, category, is_correct).
+    """
+    user_id = test_attempt.user_id
+    finished_at = test_attempt.end_time or datetime.utcnow()
+    percentage = _percentage(test_attempt.score, test_attempt.max_score)
+
+    # SELECT ... FOR UPDATE не блокирует еще не созданную строку, поэтому сначала
+    # создаем ее через ON CONFLICT DO NOTHING: первые отправки пользователя
+    # в разных запросах не столкнутся на первичном ключе
+    db.execute(dialect_insert(UserStats.__table__).values(
+        user_id=user_id,
+        attempts_count=0,
+        total_score=0,
+        total_max_score=0,
+        best_percentage=0,
+        percentage_sum=0
+    ).on_conflict_do_nothing(index_elements=["user_id"]))
+
+    # Блокируем строку статистики, чтобы параллельные отправки не потеряли обновления
+    user_stats = db.query(UserStats).filter(
+        UserStats.user_id == user_id
+    ).with_for_update().populate_existing().one()
+
+    user_stats.attempts_count += 1
+    user_stats.total_score += test_attempt.score
+    user_stats.total_max_score += test_attempt.max_score
+    user_stats.percentage_sum += percentage
+    user_stats.best_percentage = max(user_stats.best_percentage, percentage)
+    user_stats.last_percentage = percentage
+    user_stats.last_attempt_at = finished_at
+
+    # Сворачиваем ответы по категориям, чтобы обновить каждую строку один раз
+    totals = defaultdict(lambda: [0, 0])
+    for exam_type, category, is_correct in graded_answers:
+        counters = totals[(exam_type, category)]
+        counters[0] += 1
+        if is_correct:
+            counters[1] += 1
+
+    if not totals:
+        return user_stats
+
+    db.execute(dialect_insert(UserCategoryStats.__table__).values([
+        {"user_id": user_id, "exam_type": exam_type, "category": category, "answered": 0, "correct": 0}
+        for exam_type, category in totals
+    ]).on_conflict_do_nothing(index_elements=["user_id", "exam_type", "category"]))
+
+    existing = db.query(UserCategoryStats).filter(
+        UserCategoryStats.user_id == user_id,
+        UserCategoryStats.category.in_({category for _, category in totals})
+    ).with_for_update().populate_existing().all()
+    existing = {(row.exam_type, row.category): row for row in existing}
+
+    for (exam_type, category), (answered, correct) in totals.items():
+        row = existing[(exam_type, category)]
+        row.answered += answered
+        row.correct += correct
+        row.last_answered_at = finished_at
+
+    return user_stats
+
+
+def rename_category(db: Session, old_name: str, new_name: str):
+    """
+    Переносит статистику пользователей на новое имя категории.
+
+    Не делает commit: вызывается в транзакции переименования категории.
+    Если у пользователя уже есть строка с новым именем, счетчики складываются.
+    """
+    old_rows = db.query(UserCategoryStats).filter(
+        UserCategoryStats.category == old_name
+    ).with_for_update().all()
+    if not old_rows:
+        return 0
+
+    existing = db.query(UserCategoryStats).filter(
+        UserCategoryStats.category == new_name,
+        UserCategoryStats.user_id.in_({row.user_id for row in old_rows})
+    ).with_for_update().all()
+    existing = {(row.user_id, row.exam_type): row for row in existing}
+
+    for row in old_rows:
+        target = existing.get((row.user_id, row.exam_type))
+        if target is None:
+            # Первичный ключ меняется UPDATE-ом той же строки
+            row.category = new_name
+            continue
+        target.answered = (target.answered or 0) + (row.answered or 0)
+        target.correct = (target.correct or 0) + (row.correct or 0)
+        if row.last_answered_at and (not target.last_answered_at or row.last_answered_at > target.last_answered_at):
+            target.last_answered_at = row.last_answered_at
+        db.delete(row)
+
+    db.flush()
+    return len(old_rows)
+
+
+def get_user_stats(db: Session, user_id: int):
+    """Возвращает общую статистику пользователя и статистику по категориям"""
+    user_stats = db.query(UserStats).filter(UserStats.user_id == user_id).first()
+    category_stats = db.query(UserCategoryStats).filter(
+        UserCategoryStats.user_id == user_id
+    ).order_by(UserCategoryStats.exam_type, UserCategoryStats.category).all()
+    return user_stats, category_stats
+
+
+def rebuild_user_stats(db: Session, user_id: int = None):
+    """
+    Полностью пересчитывает агрегаты из test_attempts и user_answers.
+
+    Используется для первичного заполнения таблиц и исправления расхождений;
+    в обычной работе статистика обновляется инкрементально в submit_test.
+    """
+    user_stats_query = db.query(UserStats)
+    category_stats_query = db.query(UserCategoryStats)
+    if user_id is not None:
+        user_stats_query = user_stats_query.filter(UserStats.user_id == user_id)
+        category_stats_query = category_stats_query.filter(UserCategoryStats.user_id == user_id)
+    user_stats_query.delete(synchronize_session=False)
+    category_stats_query.delete(synchronize_session=False)
+
+    attempts = db.query(
+        TestAttempt.user_id,
+        TestAttempt.score,
+        TestAttempt.max_score,
+        TestAttempt.end_time
+    ).filter(TestAttempt.end_time.is_not(None))
+    if user_id is not None:
+        attempts = attempts.filter(TestAttempt.user_id == user_id)
+
+    rows = {}
+    for attempt_user_id, score, max_score, end_time in attempts.order_by(TestAttempt.end_time):
+        user_stats = rows.get(attempt_user_id)
+        if not user_stats:
+            user_stats = UserStats(
+                user_id=attempt_user_id,
+                attempts_count=0,
+                total_score=0,
+                total_max_score=0,
+                best_percentage=0,
+                percentage_sum=0
+            )
+            rows[attempt_user_id] = user_stats
+        percentage = _percentage(score or 0, max_score or 0)
+        user_stats.attempts_count += 1
+        user_stats.total_score += score or 0
+        user_stats.total_max_score += max_score or 0
+        user_stats.percentage_sum += percentage
+        user_stats.best_percentage = max(user_stats.best_percentage, percentage)
+        user_stats.last_percentage = percentage
+        user_stats.last_attempt_at = end_time
+    db.add_all(rows.values())
+
+    # Статистику по категориям считаем одним агрегирующим запросом
+    category_totals = db.query(
+        TestAttempt.user_id,
+        func.coalesce(Question.exam_type, "rhcsa"),
+        Question.category,
+        func.count(UserAnswer.id),
+        func.sum(case((UserAnswer.is_correct.is_(True), 1), else_=0)),
+        func.max(TestAttempt.end_time)
+    ).select_from(UserAnswer).join(
+        TestAttempt, UserAnswer.test_attempt_id == TestAttempt.id
+    ).join(
+        Question, UserAnswer.question_id == Question.id
+    ).filter(
+        TestAttempt.end_time.is_not(None)
+    ).group_by(
+        TestAttempt.user_id, func.coalesce(Question.exam_type, "rhcsa"), Question.category
+    )
+    if user_id is not None:
+        category_totals = category_totals.filter(TestAttempt.user_id == user_id)
+
+    db.add_all(
+        UserCategoryStats(
+            user_id=row_user_id,
+            exam_type=exam_type,
+            category=category,
+            answered=answered,
+            correct=correct or 0,
+            last_answered_at=last_answered_at
+        )
+        for row_user_id, exam_type, category, answered, correct, last_answered_at in category_totals
+    )
+
+    db.commit()
+    return len(rows)
@@ -0,0 +1,61 @@
+"""
+Общее окружение шаблонов Jinja2 для всего приложения.
+
+Один экземпляр Jinja2Templates означает один кэш скомпилированных шаблонов.
+Байткод шаблонов сохраняется в TEMPLATE_CACHE_DIR (пустое значение отключает
+кэш), поэтому после перезапуска шаблоны не компилируются заново из исходников.
+Проверка изменений файлов (TEMPLATE_AUTO_RELOAD) по умолчанию выключена:
+этот же docker-compose.yml используется при деплое. Для локальной разработки
+задайте TEMPLATE_AUTO_RELOAD=1 в окружении сервиса web.
+
+url_for('static', path=...) в шаблонах возвращает собранный файл с хешем
+в имени (см. assets.py).
+"""
+import os
+import tempfile
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache, pass_context
+
+from assets import asset_url
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "0") == "1"
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "cli-flow-jinja"))
+
+
+def create_templates(auto_reload: bool = TEMPLATE_AUTO_RELOAD, cache_dir: str = TEMPLATE_CACHE_DIR):
+    """Создает Jinja2Templates с заданными настройками (используется и в бенчмарке)"""
+    options = {"auto_reload": auto_reload}
+    if cache_dir:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            options["bytecode_cache"] = FileSystemBytecodeCache(cache_dir)
+        except OSError:
+            # Каталог недоступен для записи: работаем без кэша байткода
+            pass
+    templates = Jinja2Templates(directory=TEMPLATES_DIR, **options)
+    templates.env.globals["url_for"] = url_for
+    templates.env.globals["asset_url"] = asset_url
+    return templates
+
+
+@pass_context
+def url_for(context, name: str, **path_params):
+    """url_for из Starlette, для статических файлов - через манифест сборки"""
+    if name == "static" and "path" in path_params:
+        return asset_url(path_params["path"])
+    return context["request"].url_for(name, **path_params)
+
+
+def precompile_templates(environment=None):
+    """Компилирует все HTML-шаблоны в кэш окружения; возвращает их число"""
+    environment = environment or templates.env
+    names = environment.list_templates(filter_func=lambda name: name.endswith(".html"))
+    for name in names:
+        environment.get_template(name)
+    return len(names)
+
+
+templates = create_templates()
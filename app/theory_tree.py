@@ -0,0 +1,45 @@
+"""Кэш корневых тем теории для страницы /theory/"""
+import logging
+import os
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from cache import Cache
+from database import primary_session
+from exam_builder import EXAM_TYPES
+from models import TheoryTopic
+
+logger = logging.getLogger("theory_tree")
+
+# Время жизни кэша корневых тем в секундах
+THEORY_TREE_TTL = int(os.getenv("THEORY_TREE_TTL", "300"))
+
+# exam_type -> список тем в виде словарей
+_root_topics = Cache("theory_tree", ttl=THEORY_TREE_TTL)
+
+
+def invalidate_theory_tree():
+    """Сбрасывает кэш корневых тем (после изменения тем теории)"""
+    _root_topics.clear()
+
+
+def _load_root_topics(db: Session, exam_type: str):
+    # Кэш заполняется только из основной БД: реплика может отставать
+    with primary_session(db) as session:
+        rows = session.execute(
+            select(TheoryTopic.id, TheoryTopic.title, TheoryTopic.description)
+            .where(TheoryTopic.parent_id.is_(None), TheoryTopic.exam_type == exam_type)
+            .order_by(TheoryTopic.order)
+        ).all()
+    topics = [{"id": topic_id, "title": title, "description": description} for topic_id, title, description in rows]
+    logger.info("Theory tree loaded: exam_type=%s topics=%s", exam_type, len(topics))
+    return topics
+
+
+def get_root_topics(db: Session, exam_type: str):
+    """Корневые темы типа экзамена по порядку: [{id, title, description}]"""
+    # Кэшируем только известные типы экзамена: exam_type приходит из строки запроса
+    if exam_type not in EXAM_TYPES:
+        return _load_root_topics(db, exam_type)
+    return _root_topics.get_or_load(exam_type, lambda: _load_root_topics(db, exam_type))
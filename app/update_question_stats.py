@@ -0,0 +1,52 @@
+import os
+import sys
+
+from sqlalchemy.sql import text
+
+from database import SessionLocal
+
+# Добавляем корневую директорию проекта в sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Показатели анализа качества вопросов, перенесенные в rollup-таблицы аналитики
+ITEM_COLUMNS = (
+    ("question_stats", "discrimination", "DOUBLE PRECISION"),
+    ("question_stats", "weakest_distractor_rate", "DOUBLE PRECISION"),
+    ("question_stats", "item_computed_at", "TIMESTAMP"),
+    ("answer_option_stats", "mean_score", "DOUBLE PRECISION"),
+)
+
+
+def add_item_columns():
+    """Добавление столбцов анализа качества в question_stats и answer_option_stats"""
+    db = SessionLocal()
+    try:
+        for table, column, column_type in ITEM_COLUMNS:
+            check_query = text(
+                "SELECT column_name FROM information_schema.columns "
+                f"WHERE table_name='{table}' AND column_name='{column}'"
+            )
+            if db.execute(check_query).fetchone() is None:
+                db.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
+                print(f"Колонка {column} добавлена в таблицу {table}")
+            else:
+                print(f"Колонка {column} уже существует в таблице {table}")
+
+        # Прежние таблицы item_analysis.py заменены столбцами выше; данные пересчитываются
+        db.execute(text("DROP TABLE IF EXISTS answer_item_stats"))
+        db.execute(text("DROP TABLE IF EXISTS question_item_stats"))
+
+        db.commit()
+        db.close()
+        return True
+
+    except Exception as e:
+        db.rollback()
+        print(f"Ошибка при добавлении колонок: {str(e)}")
+        db.close()
+        return False
+
+
+if __name__ == "__main__":
+    add_item_columns()
+    print("Миграция завершена. Запустите item_analysis.py, чтобы заполнить показатели.")
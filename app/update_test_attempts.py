@@ -0,0 +1,90 @@
+import os
+import sys
+
+from sqlalchemy.sql import text
+
+from database import SessionLocal, engine
+from models import TestAttempt
+
+# Добавляем корневую директорию проекта в sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def add_exam_type_column():
+    """Добавление колонки exam_type в таблицу test_attempts"""
+    db = SessionLocal()
+    try:
+        # Проверяем, существует ли уже колонка exam_type
+        check_query = text("SELECT column_name FROM information_schema.columns WHERE table_name='test_attempts' AND column_name='exam_type'")
+        column_exists = db.execute(check_query).fetchone() is not None
+
+        if not column_exists:
+            db.execute(text("ALTER TABLE test_attempts ADD COLUMN exam_type VARCHAR(50)"))
+
+            # Заполняем тип экзамена по вопросам, на которые отвечал пользователь
+            db.execute(text(
+                "UPDATE test_attempts SET exam_type = ("
+                "SELECT q.exam_type FROM user_answers ua "
+                "JOIN questions q ON q.id = ua.question_id "
+                "WHERE ua.test_attempt_id = test_attempts.id LIMIT 1"
+                ")"
+            ))
+            db.execute(text("UPDATE test_attempts SET exam_type = 'rhcsa' WHERE exam_type IS NULL"))
+            db.commit()
+            print("Колонка exam_type добавлена в таблицу test_attempts")
+        else:
+            print("Колонка exam_type уже существует в таблице test_attempts")
+
+        db.close()
+        return True
+
+    except Exception as e:
+        db.rollback()
+        print(f"Ошибка при добавлении колонки: {str(e)}")
+        db.close()
+        return False
+
+
+def add_session_columns():
+    """Добавление колонок сессии теста: выданные вопросы и фильтры"""
+    db = SessionLocal()
+    try:
+        for column in ("question_ids", "filters"):
+            check_query = text(
+                "SELECT column_name FROM information_schema.columns "
+                f"WHERE table_name='test_attempts' AND column_name='{column}'"
+            )
+            if db.execute(check_query).fetchone() is None:
+                db.execute(text(f"ALTER TABLE test_attempts ADD COLUMN {column} JSON"))
+                print(f"Колонка {column} добавлена в таблицу test_attempts")
+            else:
+                print(f"Колонка {column} уже существует в таблице test_attempts")
+
+        db.commit()
+        db.close()
+        return True
+
+    except Exception as e:
+        db.rollback()
+        print(f"Ошибка при добавлении колонок: {str(e)}")
+        db.close()
+        return False
+
+
+def create_history_index():
+    """Создание покрывающего индекса для постраничной истории тестирования"""
+    try:
+        for index in TestAttempt.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+        print("Индекс ix_test_attempts_user_history создан")
+        return True
+    except Exception as e:
+        print(f"Ошибка при создании индекса: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    if add_exam_type_column():
+        create_history_index()
+    add_session_columns()
+    print("Миграция завершена.")
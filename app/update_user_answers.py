@@ -0,0 +1,54 @@
+import os
+import sys
+
+from sqlalchemy.sql import text
+
+from database import SessionLocal
+
+# Добавляем корневую директорию проекта в sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def add_unique_constraint():
+    """Добавление ограничения уникальности (test_attempt_id, question_id) в таблицу user_answers"""
+    db = SessionLocal()
+    try:
+        # Проверяем, существует ли уже ограничение
+        check_query = text(
+            "SELECT constraint_name FROM information_schema.table_constraints "
+            "WHERE table_name='user_answers' AND constraint_name='uq_user_answers_attempt_question'"
+        )
+        constraint_exists = db.execute(check_query).fetchone() is not None
+
+        if not constraint_exists:
+            # Удаляем дубликаты, оставляя последний ответ на вопрос в попытке
+            result = db.execute(text(
+                "DELETE FROM user_answers ua USING user_answers newer "
+                "WHERE ua.test_attempt_id = newer.test_attempt_id "
+                "AND ua.question_id = newer.question_id "
+                "AND ua.id < newer.id"
+            ))
+            print(f"Удалено дубликатов ответов: {result.rowcount}")
+
+            db.execute(text(
+                "ALTER TABLE user_answers ADD CONSTRAINT uq_user_answers_attempt_question "
+                "UNIQUE (test_attempt_id, question_id)"
+            ))
+            db.commit()
+            print("Ограничение uq_user_answers_attempt_question добавлено в таблицу user_answers")
+        else:
+            print("Ограничение uq_user_answers_attempt_question уже существует")
+
+        db.close()
+        return True
+
+    except Exception as e:
+        db.rollback()
+        print(f"Ошибка при добавлении ограничения: {str(e)}")
+        db.close()
+        return False
+
+
+if __name__ == "__main__":
+    add_unique_constraint()
+    print("Миграция завершена.")
@@ -0,0 +1,83 @@
+"""
+Прогрев кэшей при старте приложения.
+
+В фоновом потоке компилируются все шаблоны Jinja и загружаются данные для
+start_test, страницы выбора теста и списка тем теории по каждому типу экзамена.
+До окончания прогрева /health/ready отвечает 503, поэтому балансировщик
+не направляет запросы на холодный воркер.
+"""
+import logging
+import os
+import threading
+import time
+
+from database import SessionLocal
+from exam_builder import EXAM_TYPES, get_exam_facets
+from templating import precompile_templates
+from theory_tree import get_root_topics
+
+logger = logging.getLogger("warmup")
+
+# Пауза перед повторной попыткой, если прогрев не удался (например, БД еще недоступна)
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+
+_complete = threading.Event()
+_status = {"state": "pending"}
+
+
+def is_complete() -> bool:
+    return _complete.is_set()
+
+
+def status():
+    """Состояние прогрева для /health/ready"""
+    return dict(_status)
+
+
+def preload_data():
+    """Загружает пулы вопросов, категории и сложности, корневые темы теории"""
+    db = SessionLocal()
+    try:
+        categories, _ = get_exam_facets(db)
+        for exam_type in EXAM_TYPES:
+            get_root_topics(db, exam_type)
+    finally:
+        db.close()
+    return {exam_type: len(categories[exam_type]) for exam_type in EXAM_TYPES}
+
+
+def run():
+    """Выполняет прогрев, повторяя попытки до успеха"""
+    attempt = 0
+    while True:
+        attempt += 1
+        start = time.perf_counter()
+        _status.update(state="running", attempt=attempt)
+        try:
+            templates_count = precompile_templates()
+            categories = preload_data()
+        except Exception as e:
+            logger.warning("Warm-up attempt %s failed: %s", attempt, e)
+            _status.update(state="retrying", error=str(e))
+            time.sleep(WARMUP_RETRY_SECONDS)
+            continue
+
+        duration = time.perf_counter() - start
+        _status.clear()
+        _status.update(
+            state="complete",
+            attempt=attempt,
+            warmup_ms=round(duration * 1000, 1),
+            templates=templates_count,
+            categories=categories
+        )
+        _complete.set()
+        logger.info("Warm-up complete in %.3fs: templates=%s categories=%s", duration, templates_count, categories)
+        return
+
+
+def start():
+    """Запускает прогрев в фоновом потоке"""
+    thread = threading.Thread(target=run, name="warmup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,4 @@
+"""
+Микробенчмарки CLI-Flow.
+Сравнение вариантов реализации на запросах внутри процесса.
+"""
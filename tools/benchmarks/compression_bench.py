@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Экономия трафика и цена сжатия ответов по эндпоинтам.
+
+Скрипт входит в работающий сервис и получает ответы без сжатия
+(Accept-Encoding: identity). Затем он сжимает каждый ответ так же, как
+CompressionMiddleware (app/compression.py), и выводит размер до и после
+и процессорное время на одно сжатие.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+try:
+    import httpx
+except ImportError:
+    print("Ошибка: библиотека httpx не установлена")
+    print("Установите ее с помощью команды: pip install -r requirements.txt")
+    sys.exit(1)
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "app"))
+sys.path.insert(0, APP_DIR)
+
+from compression import (  # noqa: E402
+    COMPRESSION_BROTLI_QUALITY,
+    COMPRESSION_GZIP_LEVEL,
+    brotli,
+    compress_body,
+)
+
+DEFAULT_PATHS = [
+    "/questions/test",
+    "/questions/?limit=1000",
+    "/questions/history",
+    "/admin/questions",
+    "/theory/",
+]
+
+
+def cpu_time_ms(data: bytes, encoding: str, repeats: int) -> float:
+    """Медианное процессорное время одного сжатия, мс"""
+    samples = []
+    for _ in range(repeats):
+        start = time.process_time()
+        compress_body(data, encoding)
+        samples.append((time.process_time() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Экономия трафика и цена сжатия ответов")
+    parser.add_argument("-b", "--base-url", default="http://localhost:80", help="Базовый URL сервиса")
+    parser.add_argument("--email", required=True, help="Email пользователя (для /admin нужен администратор)")
+    parser.add_argument("--password", required=True, help="Пароль пользователя")
+    parser.add_argument("-p", "--paths", nargs="+", default=DEFAULT_PATHS, help="Проверяемые пути")
+    parser.add_argument("-r", "--repeats", type=int, default=20, help="Повторов сжатия для замера времени")
+    args = parser.parse_args()
+
+    encodings = ["gzip"] + (["br"] if brotli is not None else [])
+    with httpx.Client(base_url=args.base_url, headers={"Accept-Encoding": "identity"}, timeout=60) as client:
+        response = client.post("/auth/login", data={"username": args.email, "password": args.password})
+        response.raise_for_status()
+        client.cookies.set("access_token", response.json()["access_token"])
+
+        print(f"gzip уровень {COMPRESSION_GZIP_LEVEL}, brotli качество {COMPRESSION_BROTLI_QUALITY}")
+        print(f"{'Путь':<28} {'исходно, Б':>11} {'метод':>6} {'сжато, Б':>10} {'экономия':>9} {'CPU, мс':>8}")
+        total_raw = 0
+        total_saved = {encoding: 0 for encoding in encodings}
+        for path in args.paths:
+            response = client.get(path)
+            if response.status_code != 200:
+                print(f"{path:<28} пропущен: HTTP {response.status_code}")
+                continue
+            data = response.content
+            total_raw += len(data)
+            for encoding in encodings:
+                compressed = len(compress_body(data, encoding))
+                saved = len(data) - compressed
+                total_saved[encoding] += saved
+                print(
+                    f"{path:<28} {len(data):>11} {encoding:>6} {compressed:>10} "
+                    f"{saved / len(data) * 100:>8.1f}% {cpu_time_ms(data, encoding, args.repeats):>8.2f}"
+                )
+
+        for encoding in encodings:
+            print(f"Итого {encoding}: сэкономлено {total_saved[encoding]} из {total_raw} байт")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Сравнение способов отдать GET /questions/?limit=N.
+
+Работает внутри процесса на базе из DATABASE_URL (например, заполненной
+tools/loadtest/seed_data.py) и сравнивает:
+- прежний путь: загрузка вопросов с ленивой загрузкой ответов, проверка
+  каждого объекта схемой QuestionResponse (orm_mode), jsonable_encoder и json;
+- новый путь (app/payloads.py) с пустым кэшем: selectinload и orjson;
+- новый путь с заполненным кэшем: только запрос id и склейка готовых байт.
+Для каждого способа выводятся медианное время запроса и запросов в секунду.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "app"))
+sys.path.insert(0, APP_DIR)
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from database import SessionLocal  # noqa: E402
+from models import Question  # noqa: E402
+from payloads import invalidate_payloads, questions_payload  # noqa: E402
+from schemas import QuestionResponse  # noqa: E402
+
+
+def pydantic_json(db, limit: int) -> bytes:
+    """Прежний путь: как FastAPI обрабатывал response_model=List[QuestionResponse]"""
+    questions = db.query(Question).offset(0).limit(limit).all()
+    validated = [QuestionResponse.from_orm(question) for question in questions]
+    return json.dumps(
+        jsonable_encoder(validated), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def fast_json(db, limit: int) -> bytes:
+    question_ids = [
+        question_id for (question_id,) in
+        db.query(Question.id).order_by(Question.id).offset(0).limit(limit)
+    ]
+    return questions_payload(db, question_ids)
+
+
+def fast_json_cold(db, limit: int) -> bytes:
+    invalidate_payloads()
+    return fast_json(db, limit)
+
+
+def measure(handler, limit: int, requests: int):
+    """Медианное время запроса (мс) и размер ответа; каждый запрос - в новой сессии"""
+    samples = []
+    size = 0
+    for _ in range(requests):
+        db = SessionLocal()
+        try:
+            start = time.perf_counter()
+            size = len(handler(db, limit))
+            samples.append((time.perf_counter() - start) * 1000)
+        finally:
+            db.close()
+    return statistics.median(samples), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение сериализации GET /questions/")
+    parser.add_argument("-l", "--limit", type=int, default=1000, help="Параметр limit запроса")
+    parser.add_argument("-n", "--requests", type=int, default=30, help="Запросов на каждый способ")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        total = db.query(Question).count()
+    finally:
+        db.close()
+    if total == 0:
+        print("В базе нет вопросов: заполните ее, например, tools/loadtest/seed_data.py")
+        sys.exit(1)
+    print(f"Вопросов в базе: {total}, limit={args.limit}, запросов на способ: {args.requests}")
+
+    # Прогрев: импорт, компиляция запросов, пул соединений
+    measure(pydantic_json, args.limit, 2)
+    measure(fast_json_cold, args.limit, 2)
+
+    variants = [
+        ("pydantic + json", pydantic_json),
+        ("orjson, пустой кэш", fast_json_cold),
+        ("orjson, кэш", fast_json),
+    ]
+    baseline = None
+    print(f"{'Способ':<22} {'мс':>8} {'запр/с':>8} {'байт':>9} {'ускорение':>10}")
+    for name, handler in variants:
+        median_ms, size = measure(handler, args.limit, args.requests)
+        baseline = baseline or median_ms
+        print(f"{name:<22} {median_ms:>8.2f} {1000 / median_ms:>8.1f} {size:>9} {baseline / median_ms:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
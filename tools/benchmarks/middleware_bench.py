@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Сравнение пропускной способности middleware.
+
+"before" воспроизводит прежнюю схему из трех @app.middleware("http")
+(BaseHTTPMiddleware): журнал запросов, метрики и авторизацию со списком
+публичных путей. "after" использует RequestMiddleware из app/middleware.py.
+Запросы выполняются в процессе через httpx.ASGITransport, поэтому измеряются
+только накладные расходы приложения, без сети и uvicorn.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+try:
+    import httpx
+except ImportError:
+    print("Ошибка: библиотека httpx не установлена")
+    print("Установите ее с помощью команды: pip install -r requirements.txt")
+    sys.exit(1)
+
+# Модули приложения находятся в каталоге app; БД для замера не нужна
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "app"))
+sys.path.insert(0, APP_DIR)
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import PlainTextResponse, RedirectResponse  # noqa: E402
+from fastapi.staticfiles import StaticFiles  # noqa: E402
+
+import db_metrics  # noqa: E402
+import metrics  # noqa: E402
+from middleware import PUBLIC_PATHS, RequestMiddleware  # noqa: E402
+from routers.auth import AuthService  # noqa: E402
+
+STATIC_PATH = "/static/css/styles.css"
+AUTH_PATH = "/questions/test"
+
+
+def build_base_app():
+    app = FastAPI()
+    app.mount("/static", StaticFiles(directory=os.path.join(APP_DIR, "static")), name="static")
+
+    @app.get(AUTH_PATH)
+    async def protected():
+        return PlainTextResponse("ok")
+
+    return app
+
+
+def build_before():
+    """Прежняя схема: три слоя BaseHTTPMiddleware"""
+    app = build_base_app()
+
+    @app.middleware("http")
+    async def log_requests(request: Request, call_next):
+        start_time = time.time()
+        db_stats, token = db_metrics.start_request()
+        request.state.db_stats = db_stats
+        try:
+            response = await call_next(request)
+        finally:
+            db_metrics.finish_request(token)
+        process_time = time.time() - start_time
+        response.headers["X-DB-Queries"] = str(db_stats.queries)
+        response.headers["Server-Timing"] = db_stats.server_timing(process_time)
+        return response
+
+    @app.middleware("http")
+    async def collect_metrics(request: Request, call_next):
+        metrics.IN_FLIGHT.inc()
+        start_time = time.perf_counter()
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            metrics.IN_FLIGHT.dec()
+            route = metrics.route_template(app, request.scope)
+            metrics.REQUESTS.labels(request.method, route, str(status_code)).inc()
+            metrics.REQUEST_LATENCY.labels(request.method, route).observe(time.perf_counter() - start_time)
+
+    @app.middleware("http")
+    async def auth_middleware(request: Request, call_next):
+        current_path = request.url.path
+        for path in PUBLIC_PATHS:
+            if current_path == path or current_path.startswith(path + "/"):
+                return await call_next(request)
+        auth_token = request.cookies.get("access_token")
+        if not auth_token:
+            return RedirectResponse(url="/login")
+        payload = AuthService.decode_access_token(auth_token)
+        if not payload or "sub" not in payload:
+            return RedirectResponse(url="/login")
+        return await call_next(request)
+
+    return app
+
+
+def build_after():
+    """Новая схема: один ASGI-слой RequestMiddleware"""
+    app = build_base_app()
+    app.add_middleware(RequestMiddleware)
+    return app
+
+
+async def measure(app, path: str, requests: int, concurrency: int, cookies: dict) -> float:
+    """Запросов в секунду для path"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", cookies=cookies) as client:
+        # Прогрев: первые запросы компилируют маршруты и открывают файлы
+        for _ in range(20):
+            response = await client.get(path)
+            response.raise_for_status()
+
+        per_worker = requests // concurrency
+
+        async def worker():
+            for _ in range(per_worker):
+                await client.get(path)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return per_worker * concurrency / (time.perf_counter() - start)
+
+
+async def run(requests: int, concurrency: int, rounds: int):
+    cookies = {"access_token": AuthService.create_access_token({"sub": "bench@example.com"})}
+    variants = [("before", build_before()), ("after", build_after())]
+    results = {}
+    for name, path in (("static", STATIC_PATH), ("authenticated", AUTH_PATH)):
+        for variant, app in variants:
+            # Лучший результат из нескольких прогонов меньше зависит от шума
+            best = 0.0
+            for _ in range(rounds):
+                best = max(best, await measure(app, path, requests, concurrency, cookies))
+            results[(name, variant)] = best
+
+    print(f"{'Маршрут':<15} {'before, RPS':>12} {'after, RPS':>12} {'прирост':>9}")
+    for name in ("static", "authenticated"):
+        before = results[(name, "before")]
+        after = results[(name, "after")]
+        print(f"{name:<15} {before:>12.0f} {after:>12.0f} {(after / before - 1) * 100:>8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение BaseHTTPMiddleware и ASGI-middleware")
+    parser.add_argument("-n", "--requests", type=int, default=2000, help="Запросов на один прогон")
+    parser.add_argument("-c", "--concurrency", type=int, default=10, help="Одновременных запросов")
+    parser.add_argument("-r", "--rounds", type=int, default=3, help="Прогонов для каждого варианта")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
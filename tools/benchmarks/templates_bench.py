@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Замер загрузки и отрисовки шаблонов Jinja2.
+
+Для всех страниц из templates/ и templates/admin/ измеряется:
+- холодная компиляция всех шаблонов без кэша байткода и с кэшем
+  (как при старте нового воркера);
+- отрисовка get_template() + render() с auto_reload включенным
+  (проверка mtime при каждом вызове) и выключенным.
+
+Страницы, которым нужны данные (результаты и детали теста, дашборд, список
+тем), отрисовываются с контекстом той же формы, что передают обработчики.
+Если какой-либо шаблон не отрисовался, замер завершается ошибкой.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "app"))
+sys.path.insert(0, APP_DIR)
+
+from jinja2 import ChainableUndefined  # noqa: E402
+
+from models import Answer, Question, TestAttempt, User, UserAnswer  # noqa: E402
+from templating import create_templates, precompile_templates  # noqa: E402
+
+# Размер теста в контекстах страниц с результатами
+QUESTION_COUNT = 20
+
+
+class StubRequest:
+    """Минимальная замена Request для url_for в шаблонах"""
+
+    def url_for(self, name, **path_params):
+        return "/" + "/".join([name, *map(str, path_params.values())])
+
+
+def sample_attempt():
+    """Завершенная попытка с вопросами, вариантами и ответами пользователя (без БД)"""
+    user = User(id=1, email="student@example.com", is_active=True, is_superuser=False)
+    started = datetime(2024, 1, 1, 10, 0)
+    attempt = TestAttempt(
+        id=1, user_id=user.id, exam_type="rhcsa", start_time=started,
+        end_time=started + timedelta(minutes=30), max_score=QUESTION_COUNT
+    )
+    user_answers = []
+    for index in range(QUESTION_COUNT):
+        question = Question(
+            id=index + 1,
+            text=f"Какая команда выводит содержимое каталога? Вопрос {index + 1}",
+            difficulty=("easy", "medium", "hard")[index % 3],
+            category=f"Категория {index % 4}",
+            exam_type="rhcsa"
+        )
+        question.answers = [
+            Answer(id=index * 4 + option + 1, question_id=question.id, text=f"Вариант {option}", is_correct=option == 0)
+            for option in range(4)
+        ]
+        chosen = question.answers[0 if index % 3 else 1]
+        user_answers.append(UserAnswer(
+            id=index + 1, test_attempt_id=attempt.id, question_id=question.id, answer_id=chosen.id,
+            is_correct=chosen.is_correct, question=question, answer=chosen
+        ))
+    attempt.score = sum(1 for user_answer in user_answers if user_answer.is_correct)
+    return user, attempt, user_answers
+
+
+def page_contexts():
+    """Контексты страниц, которые без данных не отрисовываются"""
+    user, attempt, user_answers = sample_attempt()
+    details = [
+        {
+            "question_id": user_answer.question_id,
+            "question_text": user_answer.question.text,
+            "user_answer": user_answer.answer.text,
+            "is_correct": user_answer.is_correct,
+            "correct_answer": user_answer.question.answers[0].text
+        }
+        for user_answer in user_answers
+    ]
+    return {
+        "admin/dashboard.html": {
+            "users_count": 120, "questions_count": 480, "topics_count": 36, "now": datetime(2024, 1, 1), "token": None
+        },
+        "admin/test_attempt_details.html": {
+            "user": user, "test_attempt": attempt, "user_answers": user_answers, "token": None
+        },
+        "test_results.html": {
+            "user": user,
+            "results": {
+                "score": attempt.score,
+                "max_score": attempt.max_score,
+                "correct_answers": attempt.score,
+                "total_questions": attempt.max_score,
+                "percentage": attempt.score / attempt.max_score * 100,
+                "details": details
+            },
+            "selected_categories": ["Категория 0", "Категория 1"],
+            "selected_difficulties": ["easy", "hard"],
+            "exam_type": "rhcsa"
+        },
+        "theory_index.html": {
+            "user": user,
+            "exam_type": "rhcsa",
+            "topics": [
+                {"id": index + 1, "title": f"Тема {index + 1}", "description": "Краткое описание темы"}
+                for index in range(12)
+            ]
+        },
+    }
+
+
+def cold_compile(cache_dir, rounds: int) -> float:
+    """Среднее время компиляции всех шаблонов новым окружением, мс"""
+    total = 0.0
+    for _ in range(rounds):
+        environment = create_templates(auto_reload=False, cache_dir=cache_dir).env
+        start = time.perf_counter()
+        precompile_templates(environment)
+        total += time.perf_counter() - start
+    return total / rounds * 1000
+
+
+def render_all(iterations: int, rounds: int):
+    """
+    Время get_template + render по шаблонам с auto_reload и без него, мкс.
+
+    Замеры чередуются и берется лучший из rounds, чтобы уменьшить шум.
+    Ошибка отрисовки любого шаблона прерывает замер.
+    """
+    environments = {
+        auto_reload: create_templates(auto_reload=auto_reload, cache_dir="").env
+        for auto_reload in (True, False)
+    }
+    for environment in environments.values():
+        # Отсутствующие переменные и атрибуты не прерывают отрисовку
+        environment.undefined = ChainableUndefined
+    base_context = {"request": StubRequest(), "user": None, "title": "Benchmark"}
+    contexts = page_contexts()
+    timings = {}
+    for name in environments[True].list_templates(filter_func=lambda name: name.endswith(".html")):
+        context = {**base_context, **contexts.get(name, {})}
+        for environment in environments.values():
+            try:
+                environment.get_template(name).render(context)
+            except Exception as e:
+                raise RuntimeError(f"шаблон {name} не отрисовался: {type(e).__name__}: {e}") from e
+        best = {True: float("inf"), False: float("inf")}
+        for _ in range(rounds):
+            for auto_reload, environment in environments.items():
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    environment.get_template(name).render(context)
+                best[auto_reload] = min(best[auto_reload], (time.perf_counter() - start) / iterations * 1_000_000)
+        timings[name] = best
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер загрузки и отрисовки шаблонов")
+    parser.add_argument("-n", "--iterations", type=int, default=200, help="Отрисовок каждого шаблона за один замер")
+    parser.add_argument("-r", "--rounds", type=int, default=5, help="Повторов каждого замера")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        without_cache = cold_compile("", args.rounds)
+        # Первый проход заполняет кэш байткода
+        cold_compile(cache_dir, 1)
+        with_cache = cold_compile(cache_dir, args.rounds)
+
+    print("Холодная загрузка всех шаблонов:")
+    print(f"  без кэша байткода: {without_cache:8.1f} мс")
+    print(f"  с кэшем байткода:  {with_cache:8.1f} мс")
+    print()
+
+    timings = render_all(args.iterations, args.rounds)
+    print(f"{'Шаблон':<35} {'auto_reload, мкс':>17} {'без него, мкс':>14}")
+    for name in sorted(timings):
+        print(f"{name:<35} {timings[name][True]:>17.1f} {timings[name][False]:>14.1f}")
+    total_on = sum(best[True] for best in timings.values())
+    total_off = sum(best[False] for best in timings.values())
+    print(f"{'Итого':<35} {total_on:>17.1f} {total_off:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
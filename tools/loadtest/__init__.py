@@ -0,0 +1,4 @@
+"""
+Нагрузочный тест CLI-Flow.
+Сценарий дня экзамена: вход, тест, отправка ответов и чтение теории.
+"""
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест CLI-Flow: сценарий дня экзамена.
+
+Каждый виртуальный пользователь регистрируется, входит через /auth/login,
+выбирает параметры на /questions/test, начинает тест, получает вопросы
+порциями, автосохраняет ответы, отправляет тест и читает теорию.
+По итогам выводятся p50/p95/p99 и пропускная способность по каждому эндпоинту.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import sys
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+try:
+    import httpx
+except ImportError:
+    print("Ошибка: библиотека httpx не установлена")
+    print("Установите ее с помощью команды: pip install -r requirements.txt")
+    sys.exit(1)
+
+
+CATEGORY_RE = re.compile(r'name="(category_\d+)"[^>]*value="([^"]*)"')
+ATTEMPT_RE = re.compile(r'name="test_attempt_id" value="(\d+)"')
+TOPIC_RE = re.compile(r'href="/theory/(\d+)"')
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class Stats:
+    """Сбор длительностей и ошибок по эндпоинтам"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, name: str, duration: float, ok: bool):
+        self.latencies[name].append(duration)
+        if not ok:
+            self.errors[name] += 1
+
+    def report(self) -> List[Dict]:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        rows = []
+        for name in sorted(self.latencies):
+            values = self.latencies[name]
+            rows.append({
+                "endpoint": name,
+                "requests": len(values),
+                "errors": self.errors[name],
+                "rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+                "max_ms": round(max(values) * 1000, 1),
+            })
+        return rows
+
+
+class VirtualUser:
+    """Один кандидат, проходящий сценарий экзамена"""
+
+    def __init__(self, base_url: str, stats: Stats, args: argparse.Namespace, number: int):
+        self.stats = stats
+        self.args = args
+        self.email = f"loadtest-{uuid.uuid4().hex[:12]}-{number}@example.com"
+        self.password = "loadtest-password"
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=args.timeout, follow_redirects=False)
+
+    async def request(self, name: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        """Выполняет запрос и записывает длительность под именем эндпоинта"""
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.stats.record(name, time.perf_counter() - start, False)
+            return None
+        self.stats.record(name, time.perf_counter() - start, response.status_code < 400)
+        return response if response.status_code < 400 else None
+
+    async def think(self):
+        if self.args.think_time:
+            await asyncio.sleep(random.uniform(0, self.args.think_time))
+
+    async def login(self) -> bool:
+        response = await self.request(
+            "POST /auth/register", "POST", "/auth/register",
+            json={"email": self.email, "password": self.password}
+        )
+        if response is None:
+            return False
+        response = await self.request(
+            "POST /auth/login", "POST", "/auth/login",
+            data={"username": self.email, "password": self.password}
+        )
+        return response is not None
+
+    async def take_exam(self):
+        response = await self.request("GET /questions/test", "GET", "/questions/test")
+        if response is None:
+            return
+
+        # Выбираем тип экзамена и случайное подмножество тем из формы
+        # (на странице темы CKA пронумерованы начиная со 101)
+        exam_type = random.choice(self.args.exam_types)
+        categories = [
+            (field, value) for field, value in CATEGORY_RE.findall(response.text)
+            if (int(field.split("_")[1]) > 100) == (exam_type == "cka")
+        ]
+        form = {"exam_type": exam_type, "question_count": str(self.args.questions)}
+        for field, value in random.sample(categories, k=random.randint(0, len(categories))):
+            form[field] = value
+        await self.think()
+
+        response = await self.request("POST /questions/start_test", "POST", "/questions/start_test", data=form)
+        if response is None:
+            return
+        match = ATTEMPT_RE.search(response.text)
+        if not match:
+            return
+        attempt_id = match.group(1)
+
+        # Получаем вопросы порциями и автосохраняем ответы на каждую порцию
+        next_offset = 0
+        while next_offset is not None:
+            response = await self.request(
+                "GET /questions/attempts/{id}/questions", "GET",
+                f"/questions/attempts/{attempt_id}/questions",
+                params={"offset": next_offset, "limit": self.args.page_size}
+            )
+            if response is None:
+                return
+            batch = response.json()
+            next_offset = batch["next_offset"]
+
+            answers = {
+                str(question["id"]): random.choice(question["answers"])["id"]
+                for question in batch["items"] if question["answers"]
+            }
+            await self.think()
+            if answers:
+                await self.request(
+                    "PATCH /questions/attempts/{id}/answers", "PATCH",
+                    f"/questions/attempts/{attempt_id}/answers",
+                    json={"answers": answers}
+                )
+
+        await self.request("POST /questions/submit", "POST", "/questions/submit", data={"test_attempt_id": attempt_id})
+
+    async def browse_theory(self):
+        response = await self.request("GET /theory/", "GET", "/theory/")
+        if response is None:
+            return
+        topic_ids = TOPIC_RE.findall(response.text)
+        for topic_id in random.sample(topic_ids, k=min(len(topic_ids), self.args.theory_pages)):
+            await self.think()
+            await self.request("GET /theory/{id}", "GET", f"/theory/{topic_id}")
+
+    async def run(self):
+        try:
+            if not await self.login():
+                return
+            for _ in range(self.args.iterations):
+                await self.take_exam()
+                await self.browse_theory()
+        finally:
+            await self.client.aclose()
+
+
+async def run_load(args: argparse.Namespace) -> Stats:
+    stats = Stats()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def user_task(number: int):
+        # Равномерный разгон: пользователи стартуют в течение ramp_up секунд
+        if args.ramp_up:
+            await asyncio.sleep(args.ramp_up * number / args.users)
+        async with semaphore:
+            await VirtualUser(args.base_url, stats, args, number).run()
+
+    await asyncio.gather(*(user_task(number) for number in range(args.users)))
+    stats.finished = time.perf_counter()
+    return stats
+
+
+def print_report(rows: List[Dict], elapsed: float):
+    header = f"{'Эндпоинт':<42} {'Запросов':>8} {'Ошибок':>7} {'RPS':>8} {'p50 мс':>8} {'p95 мс':>8} {'p99 мс':>8} {'max мс':>8}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['endpoint']:<42} {row['requests']:>8} {row['errors']:>7} {row['rps']:>8} "
+            f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8} {row['max_ms']:>8}"
+        )
+    total = sum(row["requests"] for row in rows)
+    print("-" * len(header))
+    print(f"Всего запросов: {total} за {elapsed:.1f} с ({total / elapsed:.1f} запросов/с)" if elapsed else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест сценария экзамена CLI-Flow")
+    parser.add_argument("-b", "--base-url", default="http://localhost:80", help="Базовый URL сервиса")
+    parser.add_argument("-u", "--users", type=int, default=50, help="Количество виртуальных пользователей")
+    parser.add_argument("-c", "--concurrency", type=int, default=None, help="Максимум одновременно активных пользователей")
+    parser.add_argument("-n", "--iterations", type=int, default=1, help="Сколько тестов проходит каждый пользователь")
+    parser.add_argument("-q", "--questions", type=int, default=20, help="Количество вопросов в тесте")
+    parser.add_argument("--page-size", type=int, default=10, help="Размер порции вопросов")
+    parser.add_argument("--exam-types", default="rhcsa,cka", help="Типы экзаменов через запятую")
+    parser.add_argument("--theory-pages", type=int, default=3, help="Сколько страниц теории открывает пользователь")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Максимальная пауза между действиями, с")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Время разгона, с")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Таймаут запроса, с")
+    parser.add_argument("--json", dest="json_path", help="Сохранить результаты в JSON-файл")
+    parser.add_argument("--max-p95", type=float, help="Порог p95 в мс: при превышении код выхода 1")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Допустимая доля ошибок (по умолчанию 1%%)")
+    args = parser.parse_args()
+    args.concurrency = args.concurrency or args.users
+    args.exam_types = [exam_type.strip() for exam_type in args.exam_types.split(",") if exam_type.strip()]
+
+    print(f"Нагрузка на {args.base_url}: {args.users} пользователей, одновременно {args.concurrency}")
+    stats = asyncio.run(run_load(args))
+    rows = stats.report()
+    elapsed = stats.finished - stats.started
+    print_report(rows, elapsed)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"elapsed": elapsed, "users": args.users, "endpoints": rows}, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.json_path}")
+
+    # Проверка порогов для CI
+    failed = False
+    total = sum(row["requests"] for row in rows)
+    errors = sum(row["errors"] for row in rows)
+    if total and errors / total > args.max_error_rate:
+        print(f"Доля ошибок {errors / total:.2%} превышает порог {args.max_error_rate:.2%}")
+        failed = True
+    if args.max_p95 is not None:
+        for row in rows:
+            if row["p95_ms"] > args.max_p95:
+                print(f"p95 {row['endpoint']} = {row['p95_ms']} мс превышает порог {args.max_p95} мс")
+                failed = True
+    sys.exit(1 if failed or not total else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Заполнение базы синтетическими вопросами и темами теории для нагрузочного теста.
+
+Работает с любой БД из DATABASE_URL, в том числе с SQLite-заменой PostgreSQL.
+"""
+
+import argparse
+import os
+import sys
+
+# Модели приложения находятся в каталоге app
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "app")
+sys.path.insert(0, os.path.abspath(APP_DIR))
+
+from database import SessionLocal, engine  # noqa: E402
+from models import (  # noqa: E402
+    Answer,
+    Base,
+    Question,
+    QuestionCategory,
+    TheoryContent,
+    TheoryTopic,
+)
+
+DIFFICULTIES = ("easy", "medium", "hard")
+
+
+def seed(categories: int, questions: int, topics: int):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        for exam_type in ("rhcsa", "cka"):
+            for category_number in range(categories):
+                name = f"Нагрузка {exam_type.upper()} {category_number + 1}"
+                category = db.query(QuestionCategory).filter(QuestionCategory.name == name).first()
+                if category is None:
+                    category = QuestionCategory(name=name, exam_type=exam_type, description=name)
+                    db.add(category)
+                    db.flush()
+
+                for number in range(questions):
+                    question = Question(
+                        text=f"{name}: вопрос {number + 1}",
+                        difficulty=DIFFICULTIES[number % len(DIFFICULTIES)],
+                        category=name,
+                        category_id=category.id,
+                        exam_type=exam_type
+                    )
+                    db.add(question)
+                    db.flush()
+                    db.add_all([
+                        Answer(text=f"Вариант {option + 1}", is_correct=option == 0, question_id=question.id)
+                        for option in range(4)
+                    ])
+
+            for number in range(topics):
+                topic = TheoryTopic(title=f"{exam_type.upper()}: тема {number + 1}", exam_type=exam_type, order=number)
+                db.add(topic)
+                db.flush()
+                db.add(TheoryContent(topic_id=topic.id, content=f"# Тема {number + 1}\n\n" + "Текст раздела. " * 200))
+
+        db.commit()
+        print(f"Добавлено вопросов: {2 * categories * questions}, тем теории: {2 * topics}")
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Тестовые данные для нагрузочного теста CLI-Flow")
+    parser.add_argument("--categories", type=int, default=5, help="Категорий на тип экзамена")
+    parser.add_argument("--questions", type=int, default=40, help="Вопросов в категории")
+    parser.add_argument("--topics", type=int, default=10, help="Тем теории на тип экзамена")
+    args = parser.parse_args()
+    seed(args.categories, args.questions, args.topics)
+
+
+if __name__ == "__main__":
+    main()